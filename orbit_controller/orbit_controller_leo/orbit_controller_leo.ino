@@ -2,7 +2,11 @@
 #define READY_DELAY 1000
 
 Stream * port;
+#define BINARY_SYNC_BYTE 0xA5
+#define BINARY_FRAME_SIZE 12
+
 bool running;
+bool binary;
 int x_axis = A0;
 int y_axis = A1;
 int z_axis = A2;
@@ -76,11 +80,62 @@ void write_accelerometer_values (unsigned long current_time) {
     
 }
 
+/**
+ * CRC-8 with the polynomial 0x07.
+ */
+uint8_t crc8 (const uint8_t * data, size_t length) {
+
+    uint8_t crc = 0;
+    for (size_t i = 0; i < length; i++) {
+        crc ^= data[i];
+        for (uint8_t bit = 0; bit < 8; bit++) {
+            crc = (crc & 0x80) ? ((crc << 1) ^ 0x07) : (crc << 1);
+        }
+    }
+    return crc;
+
+}
+
+/**
+ * Write the binary message frame and flush.
+ * The frame is a sync byte, the time as a little endian uint32, 
+ * the X, Y and Z values as little endian uint16, and a CRC-8 
+ * of the time and the X, Y and Z values.
+ */
+void write_binary_message (unsigned long current_time) {
+
+    uint8_t frame[BINARY_FRAME_SIZE];
+    uint16_t values[3] = {
+        (uint16_t) analogRead(x_axis),
+        (uint16_t) analogRead(y_axis),
+        (uint16_t) analogRead(z_axis)
+    };
+
+    frame[0] = BINARY_SYNC_BYTE;
+    for (uint8_t i = 0; i < 4; i++) {
+        frame[1 + i] = (current_time >> (8 * i)) & 0xFF;
+    }
+    for (uint8_t i = 0; i < 3; i++) {
+        frame[5 + 2 * i] = values[i] & 0xFF;
+        frame[6 + 2 * i] = (values[i] >> 8) & 0xFF;
+    }
+    frame[BINARY_FRAME_SIZE - 1] = crc8(frame + 1, BINARY_FRAME_SIZE - 2);
+
+    port->write(frame, BINARY_FRAME_SIZE);
+    port->flush();
+
+}
+
 /**
  * Write the message frame and flush.
  */
 void write_message (unsigned long current_time) {
 
+    if (binary) {
+        write_binary_message(current_time);
+        return;
+    }
+
     write_frame_start();
     write_accelerometer_values(current_time);
     write_frame_end();
@@ -104,7 +159,9 @@ void write_message_periodic (unsigned long delay, unsigned long current_time, bo
 
 /**
  * Switches the running flag.
- * The input control signal is just an ascii 1 or 0.
+ * The input control signal is just an ascii 0, 1, 2 or 3.
+ * 0 stops, 1 runs with ASCII frames, and 2 runs with binary frames.
+ * 3 queries the binary protocol, which is acknowledged with a "B".
  */
 void switch_running () {
 
@@ -114,6 +171,13 @@ void switch_running () {
             running = false;
         } else if (control == 1) {
             running = true;
+            binary = false;
+        } else if (control == 2) {
+            running = true;
+            binary = true;
+        } else if (control == 3) {
+            port->print("B");
+            port->flush();
         }
     }
 
@@ -153,6 +217,7 @@ void setup () {
     Serial.begin(9600);
     Serial1.begin(9600);
     running = false;
+    binary = false;
     switch_ports();
 
 }
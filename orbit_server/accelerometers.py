@@ -1,16 +1,98 @@
 import numpy as np
+import json
 
-def create_accel_convert(accel_unit_max, volt_max, volt_base, volt_per_g, g_units):
+def create_accel_transform(accel_unit_max, volt_max, volt_base, volt_per_g, g_units):
+    """Compiles the sensor parameters into the affine transform of acceleration units to m/s^2.
+
+    Returns the (scale, offset), where the acceleration is `accel_units * scale + offset`.
+    """
+
+    # accel_volts = accel_units / (accel_unit_max / volt_max)
+    # accel = ((accel_volts - volt_base) / volt_per_g) * g_units
+    scale = (volt_max / accel_unit_max) / volt_per_g * g_units
+    offset = -(volt_base / volt_per_g) * g_units
+    return (scale, offset)
+
+def create_accel_convert(scale, offset):
 
     def accel_convert(accel_units):
 
         """Converts acceleration units from the controller devices to acceleration meters per second squared."""
-        accel_volts = accel_units / (accel_unit_max / volt_max)
-        accel = ((accel_volts - volt_base) / volt_per_g) * g_units
-        return accel
+        return accel_units * scale + offset
 
     return accel_convert
 
+def compile_sensor(sensor):
+
+    (sensor["scale"], sensor["offset"]) = create_accel_transform(
+        sensor["accel_unit_max"],
+        sensor["volt_max"],
+        sensor["volt_base"],
+        sensor["volt_per_g"],
+        sensor["g_units"]
+    )
+    sensor["accel_convert"] = create_accel_convert(sensor["scale"], sensor["offset"])
+    sensor["accel_max"] = sensor["accel_convert"](sensor["accel_unit_max"])
+
+def orientation_matrix(orientation):
+    """Compiles an orientation into the signed permutation matrix that maps (x, y, z) to (east, north, up).
+
+    The orientation maps each ENU axis to a signed controller axis, see `orbit_server.parse_orientation`.
+    """
+
+    matrix = np.zeros((3, 3))
+    for (i, axis) in enumerate(("east", "north", "up")):
+        matrix[i, "xyz".index(orientation[axis]["axis"])] = -1.0 if orientation[axis]["sign"] == "-" else 1.0
+    return matrix
+
+def create_sample_transform(sensor_type, orientation):
+    """Compiles the unit conversion of a sensor and an orientation into a single affine transform.
+
+    Returns the (matrix, offset), where the (east, north, up) accelerations in m/s^2 are 
+    `(x, y, z) @ matrix + offset` for a row of acceleration units.
+    """
+
+    sensor = accel_sensors[sensor_type]
+    matrix = orientation_matrix(orientation)
+    return (sensor["scale"] * matrix.T, sensor["offset"] * matrix.sum(axis=1))
+
+def transform_samples(samples, sample_transform):
+    """Transforms an array of (t, x, y, z) rows of acceleration units into (t, east, north, up) rows in m/s^2.
+
+    The x, y and z columns are transformed together by a single matrix product, the times are 
+    copied as they are. This is applied once when samples are ingested, so the data windows 
+    only ever hold converted and oriented samples.
+    """
+
+    (matrix, offset) = sample_transform
+    transformed = np.empty(np.shape(samples), dtype=np.float64)
+    transformed[:, 0] = samples[:, 0]
+    transformed[:, 1:] = samples[:, 1:] @ matrix
+    transformed[:, 1:] += offset
+    return transformed
+
+sensor_parameters = ("g_units", "volt_base", "volt_max", "volt_per_g", "accel_unit_max")
+
+def load_sensor_profiles(path):
+    """Loads accelerometer sensor profiles from a JSON file, returns the names of the loaded sensors.
+
+    The file is an object of sensor names to objects with the same parameters as `accel_sensors`.
+    Loaded sensors are added to `accel_sensors`, replacing any sensor with the same name.
+    """
+
+    with open(path) as config_file:
+        profiles = json.load(config_file)
+
+    for (name, profile) in profiles.items():
+        missing_parameters = [parameter for parameter in sensor_parameters if parameter not in profile]
+        if missing_parameters:
+            raise ValueError("Sensor profile %s is missing parameters: %s" % (name, ", ".join(missing_parameters)))
+        sensor = {parameter: float(profile[parameter]) for parameter in sensor_parameters}
+        compile_sensor(sensor)
+        accel_sensors[name] = sensor
+
+    return list(profiles)
+
 accel_sensors = {
     # from: www.freetronics.com.au/pages/am3x-quickstart-guide
     "am3x-1.5g": {
@@ -32,12 +114,4 @@ accel_sensors = {
 
 for device in accel_sensors:
 
-    accel_sensors[device]["accel_convert"] = create_accel_convert(
-        accel_sensors[device]["accel_unit_max"], 
-        accel_sensors[device]["volt_max"],
-        accel_sensors[device]["volt_base"],
-        accel_sensors[device]["volt_per_g"],
-        accel_sensors[device]["g_units"]
-    )
-    accel_sensors[device]["accel_convert_map_np"] = np.vectorize(accel_sensors[device]["accel_convert"])
-    accel_sensors[device]["accel_max"] = accel_sensors[device]["accel_convert"](accel_sensors[device]["accel_unit_max"])
+    compile_sensor(accel_sensors[device])
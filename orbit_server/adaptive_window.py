@@ -0,0 +1,39 @@
+import math
+import logging
+
+class AdaptiveWindow:
+    """Sizes the data window of a controller to a target number of rotation periods.
+
+    The frequency estimation only needs a few periods to lock on, so a fixed time window is
+    longer than needed at fast rotations, which costs latency and compute. Every accepted
+    result updates the frequency, and the time window becomes the target number of periods
+    at that frequency, bounded by the minimum and maximum time windows.
+
+    Results are accepted in the callback thread, and the time window is read by the analysis
+    loop, which only ever sees the whole updated value. Frequencies that are not positive,
+    such as when the controller is not rotating, grow the window to the maximum, because
+    slow rotations need the longest window.
+    """
+
+    def __init__(self, time_window_ms, periods, min_time_window_ms, max_time_window_ms):
+
+        self.periods = periods
+        self.min_time_window_ms = min_time_window_ms
+        self.max_time_window_ms = max_time_window_ms
+        self.time_window_ms = self.bound(time_window_ms)
+
+    def bound(self, time_window_ms):
+
+        return min(max(time_window_ms, self.min_time_window_ms), self.max_time_window_ms)
+
+    def update(self, frequency):
+        """Resizes the time window for the last estimated frequency in rotations per second."""
+
+        if frequency > 0 and math.isfinite(frequency):
+            time_window_ms = self.bound(1000 * self.periods / frequency)
+        else:
+            time_window_ms = self.max_time_window_ms
+
+        logging.debug("Adaptive Time Window: %d ms for %.3f RPS", time_window_ms, frequency)
+
+        self.time_window_ms = time_window_ms
@@ -1,102 +1,36 @@
-from copy import deepcopy
 import serial
 import window_processing
+import rolling_window as rw
+import controller_protocol
+import accelerometers
+import resampling
+import tracing
+import metrics
+import numpy as np
 import time
 import logging
-import re
 import functools
 import pprint
 
-controller_message_regex = re.compile('^Time.(\d+).X.(\d+).Y.(\d+).Z.(\d+)', re.I)
-
-def read_from_controller(controller, frame_start_byte, frame_end_byte):
-
-    # block until we get a proper message from the controller
-    while True:
-        # discard bytes until we find the frame start byte
-        starting_byte = controller.read(1)
-        if starting_byte != frame_start_byte:
-            continue
-
-        # read bytes until we get the frame end byte
-        intermediate_byte = controller.read(1)
-        message_buffer = bytearray()
-        while (intermediate_byte != frame_end_byte):
-            message_buffer += intermediate_byte
-            intermediate_byte = controller.read(1)
-
-        # decode bytes into a string
-        message_buffer = message_buffer.decode("ascii")
-
-        # match the sample
-        sample = re.match(controller_message_regex, message_buffer)
-
-        if sample is not None:
-            break
-
-    sample_time_ms = int(sample.group(1))
-    sample_x_accel = int(sample.group(2)) 
-    sample_y_accel = int(sample.group(3))
-    sample_z_accel = int(sample.group(4))
-
-    return (sample_time_ms, sample_x_accel, sample_y_accel, sample_z_accel)
-
-def roll_the_window(rolling_window, rolling_window_interval, rolling_time, shift_or_increment=True):
-    """Rolls the data window. Make sure the new window is the same type as the existing window.
-
-    Because the our rolling increment is based on time, this means the resulting window 
-    size can change. If the existing window is empty, then the new window becomes the existing 
-    window.
-
-    It will mutate the rolling_window, but values from rolling_window_interval will be cloned 
-    when they are pushed into the rolling_window.
-    """
-
-    rolling_window_interval = deepcopy(rolling_window_interval)
-
-    # if the existing window is empty, then the new window becomes the existing window
-    if rolling_window and rolling_window['t']:
-        
-        # rolling the window can involve a same-size shift (truncate and append), or just an increment
-        # rolling windows generally need a same-size shift, however to reach the full size we need to 
-        # first act like recursive windows!
-        if shift_or_increment:
-
-            starting_time = rolling_window['t'][0]
-            cutoff_time = starting_time + rolling_time
-            cutoff_index = None
-
-            # find the first time sample that is greater to the cutoff time
-            # the index of that becomes the length that we perform a cutoff
-            for i,t in enumerate(rolling_window['t']):
-                if t > cutoff_time:
-                    cutoff_index = i
-                    break
-
-        else:
-
-            cutoff_index = 0
-
-        # for example, if the index is 7, it will remove sample 0 to sample 6
-        for k in rolling_window:
-            rolling_window[k] = rolling_window[k][cutoff_index:]
-            rolling_window[k] = rolling_window[k] + rolling_window_interval[k]
-            
-    else:
-
-        rolling_window = rolling_window_interval
-
-    return rolling_window
-
-def connect(device_path, baud_rate):
+def connect(device_path, baud_rate, binary_protocol=False):
     """Connects to the game controller serial device with a given baud rate.
 
     This orbit server should be started after the game controller is already connected.
     It will block until for the controller device sends a `Ready!\n` message. If the 
     controller sends something other than message, it will raise an IOError exception.
+
+    If the binary protocol is requested, it is negotiated with the controller. Controllers 
+    that don't acknowledge the binary protocol fall back to the ASCII protocol. This returns 
+    the controller and the negotiated protocol, which is either "ascii" or "binary".
     """
 
-    controller = serial.Serial(device_path, baud_rate)
+    return prepare_controller(serial.Serial(device_path, baud_rate), binary_protocol)
+
+def prepare_controller(controller, binary_protocol=False):
+    """Waits for a controller to be ready and negotiates its protocol, see `connect`.
+
+    The controller can be anything with the interface of `serial.Serial`, such as a replay.
+    """
 
     # clear the buffers first
     controller.reset_input_buffer()
@@ -115,30 +49,77 @@ def connect(device_path, baud_rate):
 
     logging.info("Device is ready!")
 
-    return controller
+    protocol = "ascii"
+    if binary_protocol:
+        if negotiate_binary_protocol(controller):
+            protocol = "binary"
+        else:
+            logging.warning("Device does not support the binary protocol, falling back to the ASCII protocol")
+
+    logging.info("Using the %s protocol", protocol)
+
+    return (controller, protocol)
+
+def negotiate_binary_protocol(controller, timeout=2):
+
+    # the controller keeps sending ready messages while it waits, so we look for the 
+    # acknowledgement among them, older controllers just ignore the query command
+    controller.write(controller_protocol.binary_protocol_query_command)
+    controller.timeout = 0.1
+
+    acknowledged = False
+    deadline = time.time() + timeout
+    while not acknowledged and time.time() < deadline:
+        acknowledged = controller_protocol.binary_protocol_acknowledgement in controller.read(max(1, controller.in_waiting))
+
+    controller.timeout = None
+    controller.reset_input_buffer()
+
+    return acknowledged
 
 def run(
     controller, 
+    protocol, 
     time_window_ms, 
     time_interval_ms, 
     time_delta_ms, 
     sensor_type, 
     orientation, 
     process_pool, 
+    shared_windows, 
+    result_sequencer, 
     broadcaster, 
-    graph 
+    graph,
+    capture=None,
+    controller_id=0,
+    adaptive_window=None
 ):
-    
-    logging.info("Running Analysis Loop")
+    """Runs the analysis loop until the controller fails.
+
+    If a capture writer is given, the samples that are analysed are recorded into it.
+
+    If an adaptive window is given, the data window is sized by its time window instead of 
+    the fixed time window, and every accepted result updates it with the estimated frequency.
+
+    Each controller runs its own analysis loop, with its own result sequencer, and they share 
+    the process pool, the shared windows and the broadcaster. The results are broadcasted with 
+    the controller id.
+    """
+
+    logging.info("Running Analysis Loop for controller: %d", controller_id)
 
     # the time window size determines the number of values that will be inside a data window
-    # however the actual size of a data window is not deterministic, as the real time delta between 
-    # each acceleration sample may be slightly different because arduino is a soft realtime system
+    # the samples are resampled onto the regular time grid, but the window still rolls by the time
+    # of whole rolling intervals, so the size of a data window can vary by a rolling interval
+    # so the capacity is only an estimate with some headroom, the rolling window grows if it needs to
+    # an adaptive window can grow up to its maximum time window
+    capacity_time_ms = adaptive_window.max_time_window_ms if adaptive_window else time_window_ms
     
-    rolling_window = {"t": [], "x": [], "y": [], "z": []}
+    rolling_window = rw.RollingWindow(
+        2 * (capacity_time_ms + time_interval_ms) // time_delta_ms
+    )
     rolling_window_start = None
     rolling_window_end = None
-    rolling_window_interval = deepcopy(rolling_window)
     rolling_window_interval_start = None
     rolling_window_interval_end = None
     filled_rolling_window = False
@@ -147,41 +128,53 @@ def run(
     # we'll use this to trace through the concurrent environment
     # this should only be incremented upon passing a data window 
     # to the window processing code
-    trace_id = 0
+    # the trace ids of each controller are spaced by the stride of the sequencer, so they are unique
+    trace_id = controller_id
 
     # fix some of the static parameters of asynchronous processing and callback
     analyse_rotation_process = functools.partial(
-        window_processing.analyse_rotation_process, 
+        window_processing.analyse_shared_window_process, 
         time_delta_ms, 
-        orientation, 
-        sensor_type
+        controller_id
     )
-    analyse_rotation_process_callback = functools.partial(
-        window_processing.analyse_rotation_process_callback, 
+    analyse_shared_window_process_callback = functools.partial(
+        window_processing.analyse_shared_window_process_callback, 
         broadcaster, 
-        graph
+        graph, 
+        shared_windows, 
+        result_sequencer, 
+        controller_id, 
+        adaptive_window
     )
 
+    # frames are read from the controller in bulk, and decoded into batches of samples
+    frame_reader = controller_protocol.frame_readers[protocol](controller)
+
     # tell the controller to start sending data
-    controller.write(b'1')
+    controller.write(frame_reader.start_command)
+
+    # drop the first batch of readings, because they're most likely old samples that are queued in the serial port
+    frame_reader.read_samples()
 
-    # drop the first reading, because it's most likely an old sample that is queued in the serial port
-    read_from_controller(controller, b"S", b"E")
+    # samples are converted to m/s^2, oriented to the ENU axes and resampled onto the regular time grid
+    # as they are ingested, so the rolling window only holds regular samples, and the data windows are 
+    # slices of it, the capture keeps the raw samples
+    # the conversion and the orientation are compiled into a single affine transform
+    sample_transform = accelerometers.create_sample_transform(sensor_type, orientation)
+    resampler = resampling.StreamingResampler(time_delta_ms)
 
     # this is the initial loop setup
-    # it will setup the first rolling interval
-    (
-        sample_time_ms, 
-        sample_x_accel, 
-        sample_y_accel, 
-        sample_z_accel
-    ) = read_from_controller(controller, b"S", b"E")
-
-    rolling_window_interval_start = sample_time_ms
-    rolling_window_interval['t'] = [sample_time_ms]
-    rolling_window_interval['x'] = [sample_x_accel]
-    rolling_window_interval['y'] = [sample_y_accel]
-    rolling_window_interval['z'] = [sample_z_accel]
+    # it will setup the first rolling interval, once the samples have reached the regular time grid
+    samples = np.empty((0, 4))
+    while len(samples) == 0:
+        samples = frame_reader.read_samples()
+        samples_read_time = time.monotonic()
+        metrics.increment("orbit_samples_total", len(samples))
+        if capture:
+            capture.write(samples)
+        samples = resampler.resample(accelerometers.transform_samples(samples, sample_transform))
+    rolling_window_interval_start = samples[0, 0]
+    reported_malformed_frames = 0
 
     # the analysis loop is the main thread event loop
     # it needs to accumulate samples into a rolling interval
@@ -189,26 +182,26 @@ def run(
     # then execute the analysis on the data asynchronously
     while True:
 
-        # block until we get proper cooordinates
-        (
-            sample_time_ms, 
-            sample_x_accel, 
-            sample_y_accel, 
-            sample_z_accel
-        ) = read_from_controller(controller, b"S", b"E")
-
-        # if we are continuing the accumulation the rolling interval
-        if (rolling_window_interval_start + time_interval_ms >= sample_time_ms):
+        # the batch is split at the samples that finish a rolling interval
+        batch_index = 0
+        while batch_index < len(samples):
 
-            rolling_window_interval['t'].append(sample_time_ms)
-            rolling_window_interval['x'].append(sample_x_accel)
-            rolling_window_interval['y'].append(sample_y_accel)
-            rolling_window_interval['z'].append(sample_z_accel)
+            # the samples up to the first one beyond the rolling interval are accumulated into it
+            interval_end_index = batch_index + np.searchsorted(
+                samples[batch_index:, 0], 
+                rolling_window_interval_start + time_interval_ms, 
+                side="right"
+            )
+            rolling_window.extend(samples[batch_index:interval_end_index])
 
-        # else if we have finished accumulating a rolling interval
-        else: 
+            if interval_end_index == len(samples):
+                break
 
-            rolling_window_interval_end = rolling_window_interval["t"][-1]
+            # else if we have finished accumulating a rolling interval
+            # the pending samples of the rolling window are the rolling interval
+            sample_time_ms = samples[interval_end_index, 0]
+            window_time_ms = adaptive_window.time_window_ms if adaptive_window else time_window_ms
+            rolling_window_interval_end = rolling_window.view("t", pending=True)[-1]
 
             logging.info(
                 "%d - Rolling the Data Window with Interval at: %d - %d", 
@@ -227,7 +220,7 @@ def run(
             if (
                 not filled_rolling_window 
                 and rolling_window_start is not None 
-                and (rolling_window_start + time_window_ms < sample_time_ms)
+                and (rolling_window_start + window_time_ms < sample_time_ms)
             ): 
 
                 filled_rolling_window = True 
@@ -236,39 +229,87 @@ def run(
             
                 shift_rolling_window = True
 
-            rolling_window = roll_the_window(
-                rolling_window, 
-                rolling_window_interval, 
-                time_interval_ms, 
-                shift_rolling_window
-            )
-            rolling_window_start = rolling_window["t"][0]
-            rolling_window_end = rolling_window["t"][-1]
+            # an adaptive window is never shifted, instead it is incremented and then trimmed to its time window
+            # so it shrinks at once, and grows by a rolling interval at a time
+            if adaptive_window:
+                rolling_window.roll(time_interval_ms, False)
+                if shift_rolling_window:
+                    rolling_window.trim(window_time_ms)
+            else:
+                rolling_window.roll(time_interval_ms, shift_rolling_window)
+            rolled_time = time.monotonic()
+            rolling_window_times = rolling_window.view("t")
+            rolling_window_start = rolling_window_times[0]
+            rolling_window_end = rolling_window_times[-1]
 
             # we only want to process filled rolling windows, not the initial partially filled window
             if filled_rolling_window:
 
-                logging.info("%d - Processing Data Window at: %d - %d", trace_id, rolling_window_start, rolling_window_end)
-                
-                # the analysis will be executed in a child-process
-                # the callback will be executed in another thread of this main-process
-                # therefore, it won't be blocked this event loop
-                process_pool.apply_async(
-                    analyse_rotation_process, 
-                    args=(deepcopy(rolling_window), trace_id), 
-                    callback=analyse_rotation_process_callback
-                )
+                # the data window is handed to the child-process through a shared slot
+                # if there are no free slots, the process pool is backlogged, so we skip this window
+                slot = shared_windows.acquire()
+
+                if slot is None:
+
+                    logging.warning("%d - Skipping Data Window at: %d - %d", trace_id, rolling_window_start, rolling_window_end)
+                    metrics.increment("orbit_windows_skipped_total")
 
-                trace_id = trace_id + 1
+                else:
+
+                    logging.info("%d - Processing Data Window at: %d - %d", trace_id, rolling_window_start, rolling_window_end)
+
+                    # the window is only traced once it's going to be submitted, because skipped windows reuse the trace id
+                    tracing.mark(trace_id, "sample_read", samples_read_time)
+                    tracing.mark(trace_id, "window_rolled", rolled_time)
+
+                    length = shared_windows.write_window(slot, rolling_window.window())
+
+                    # the means of the data window come from the running sums of the rolling window
+                    # unless the data window was truncated into the slot
+                    means = rolling_window.means() if length == len(rolling_window) else None
+                    result_sequencer.submit(trace_id)
+            
+                    # the analysis will be executed in a child-process
+                    # the callback will be executed in another thread of this main-process
+                    # therefore, it won't be blocked this event loop
+                    # only the slot descriptor is sent to the child-process, not the data window
+                    # a window that fails or misses its deadline gets the error callback instead
+                    process_pool.apply_async(
+                        analyse_rotation_process, 
+                        args=(slot, length, trace_id, means), 
+                        callback=functools.partial(analyse_shared_window_process_callback, samples_read_time), 
+                        error_callback=functools.partial(
+                            window_processing.analyse_shared_window_process_error_callback, 
+                            broadcaster, 
+                            shared_windows, 
+                            result_sequencer, 
+                            controller_id, 
+                            slot, 
+                            trace_id
+                        )
+                    )
+
+                    tracing.mark(trace_id, "submitted")
+                    metrics.increment("orbit_windows_submitted_total")
+
+                    trace_id = trace_id + result_sequencer.stride
 
             # start a new rolling_window_interval with the most recently acquired sample
             # this is because the rolling_window_interval was completed now and 
             # the current sample represents the start of the next rolling_window_interval
             rolling_window_interval_start = sample_time_ms
-            rolling_window_interval['t'] = [sample_time_ms]
-            rolling_window_interval['x'] = [sample_x_accel]
-            rolling_window_interval['y'] = [sample_y_accel]
-            rolling_window_interval['z'] = [sample_z_accel]
+            batch_index = interval_end_index
 
         # yield to other threads
-        time.sleep(0)
\ No newline at end of file
+        time.sleep(0)
+
+        # block until we get proper cooordinates
+        samples = frame_reader.read_samples()
+        samples_read_time = time.monotonic()
+        metrics.increment("orbit_samples_total", len(samples))
+        # every controller has its own frame reader, so each adds its new malformed frames to the shared counter
+        metrics.increment("orbit_malformed_frames_total", frame_reader.malformed_frames - reported_malformed_frames)
+        reported_malformed_frames = frame_reader.malformed_frames
+        if capture:
+            capture.write(samples)
+        samples = resampler.resample(accelerometers.transform_samples(samples, sample_transform))
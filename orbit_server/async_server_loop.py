@@ -0,0 +1,210 @@
+import asyncio
+import threading
+import logging
+import time
+import server_loop
+from broadcaster import ChannelClosed
+import tracing
+import metrics
+
+class RotationClient:
+    """The state of a connected client, and its channel subscribed to the broadcaster.
+
+    The broadcast happens in another thread, so the channel only wakes up the event loop,
+    which then writes every rotation waiting in the channel to the client.
+    """
+
+    def __init__(self, peer, writer, loop, broadcaster):
+
+        self.peer = peer
+        self.writer = writer
+        self.rotation_event = asyncio.Event()
+        self.channel = broadcaster.add_channel(
+            notify=lambda: loop.call_soon_threadsafe(self.rotation_event.set),
+            name="%s:%d" % peer[:2],
+            keys=server_loop.default_controllers
+        )
+        self.tagged = False
+        self.tasks = []
+        self.closed = asyncio.Event()
+
+class RotationAsyncServer:
+    """TCP server running an asyncio event loop in its own thread.
+
+    This serves the same protocol as the threaded `server_loop.RotationTCPServer`, but all
+    clients are handled by one event loop instead of a busy polling thread per client.
+
+    Every client subscribes its own channel to the broadcaster, and waits on its own event,
+    so idle clients cost nothing until a rotation or a keepalive arrives.
+
+    It has the same `shutdown` and `server_close` methods as the threaded server.
+    """
+
+    def __init__(self, server_address, broadcaster):
+
+        self.server_address = server_address
+        self.broadcaster = broadcaster
+        self.clients = set()
+        self.loop = asyncio.new_event_loop()
+        self.loop_thread = threading.Thread(target=self.loop.run_forever)
+        self.loop_thread.daemon = True
+        self.server = None
+
+    def serve(self):
+
+        self.loop_thread.start()
+        asyncio.run_coroutine_threadsafe(self.start_server(), self.loop).result()
+
+    async def start_server(self):
+
+        (host, port) = self.server_address
+        self.server = await asyncio.start_server(self.handle, host, port)
+
+    async def handle(self, reader, writer):
+
+        client = RotationClient(writer.get_extra_info("peername"), writer, self.loop, self.broadcaster)
+        self.clients.add(client)
+
+        logging.info("Responding to new client: %s", client.peer)
+
+        # the client either times out or closes the connection when receiving
+        # or fails when sending, either way the other task is cancelled
+        client.tasks = [
+            asyncio.ensure_future(self.receive(client, reader)),
+            asyncio.ensure_future(self.send(client, writer))
+        ]
+        await asyncio.wait(client.tasks, return_when=asyncio.FIRST_COMPLETED)
+        for task in client.tasks:
+            task.cancel()
+
+        self.clients.discard(client)
+        self.broadcaster.remove_channel(client.channel)
+
+        logging.info("Closing connection to: %s %s", client.peer, client.channel.stats())
+
+        writer.close()
+        client.closed.set()
+
+    async def receive(self, client, reader):
+
+        # we expect a keep alive ping every once and a while
+        # it can be in response to every message we send to the client
+        # this allows us to end the connection in case the client quits without closing the connection
+        ping_time = time.time()
+
+        client_input_buffer = bytearray()
+
+        while True:
+
+            try:
+                client_data = await asyncio.wait_for(
+                    reader.read(64),
+                    timeout=max(0, ping_time + server_loop.ping_timeout - time.time())
+                )
+            except asyncio.TimeoutError:
+                logging.info("Client timed out: %s", client.peer)
+                metrics.increment("orbit_client_keepalive_timeouts_total")
+                return
+            except OSError:
+                logging.exception("Error in reading from connection: %s", client.peer)
+                return
+
+            # if the length of the received data is 0 then it's an EOF character
+            if len(client_data) == 0:
+                logging.info("Client closed connection: %s", client.peer)
+                return
+
+            client_input_buffer.extend(client_data)
+
+            # extract every token in the buffer, a token may not be extracted at all
+            while True:
+
+                lexical_analysis = server_loop.client_message_protocol.search(client_input_buffer.decode('ascii', 'replace'))
+                token = lexical_analysis.group(1)
+
+                if token == "OK":
+                    ping_time = time.time()
+                elif token is not None and token.startswith("SUB:"):
+                    self.subscribe(client, token)
+
+                # drops the handled input and characters before the start frame
+                client_input_buffer = client_input_buffer[lexical_analysis.span()[1]:]
+
+                if token is None:
+                    break
+
+    async def send(self, client, writer):
+
+        while True:
+
+            await client.rotation_event.wait()
+            client.rotation_event.clear()
+
+            while True:
+
+                try:
+                    rotation = client.channel.pop()
+                except IndexError:
+                    break
+                except ChannelClosed:
+                    logging.info("Channel closed for connection: %s", client.peer)
+                    return
+
+                trace_id = rotation[-1]
+                try:
+                    writer.write(server_loop.format_rotation(rotation, client.tagged))
+                    await writer.drain()
+                    tracing.mark(trace_id, "client_write")
+                    logging.info("%d - Wrote RPS and RPS Direction to connection %s", trace_id, client.peer)
+                except OSError:
+                    logging.exception("%d - Error writing to connection: %s", trace_id, client.peer)
+                    metrics.increment("orbit_client_send_failures_total")
+                    return
+
+    def subscribe(self, client, token):
+
+        try:
+            controllers = server_loop.parse_subscription(token)
+        except ValueError:
+            logging.warning("Invalid subscription from client: %s %r", client.peer, token)
+            return
+
+        logging.info("Client subscribed to controllers: %s %s", client.peer, controllers or "*")
+        client.channel.subscribe(controllers)
+        client.tagged = True
+
+    def shutdown(self):
+
+        # stop listening, then end every client handler and wait for them to close their connections
+        async def close_server():
+            self.server.close()
+            clients = list(self.clients)
+            for client in clients:
+                for task in client.tasks:
+                    task.cancel()
+            for client in clients:
+                await client.closed.wait()
+
+        if self.server is not None and self.loop_thread.is_alive():
+            asyncio.run_coroutine_threadsafe(close_server(), self.loop).result()
+
+    def server_close(self):
+
+        # closing the loop destroys its pending tasks, so any clients left are closed first
+        if self.loop_thread.is_alive():
+            self.shutdown()
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.loop_thread.join()
+
+        # the loop has stopped, so its listening sockets and its selector can be closed from this thread
+        if self.server is not None:
+            self.server.close()
+        if not self.loop.is_closed():
+            self.loop.close()
+
+def start(host, port, broadcaster):
+
+    logging.info("Running Async Server Loop")
+    server = RotationAsyncServer((host, port), broadcaster)
+    server.serve()
+    return server
@@ -0,0 +1,99 @@
+import numpy as np
+
+def autocorrelation(signal):
+    """Batch autocorrelation of a signal from lag 0 up to lag len(signal) - 1.
+
+    This is the second half of the full linear cross-correlation of the signal with itself,
+    computed as the inverse FFT of the power spectrum, zero padded to avoid circular wrap.
+
+    The signal can also be a 2D array of equal length signals, which are correlated row by row.
+    """
+
+    n = np.shape(signal)[-1]
+    spectrum = np.fft.rfft(signal, 2 * n)
+    return np.fft.irfft(spectrum.real ** 2 + spectrum.imag ** 2, 2 * n)[..., :n]
+
+# numpy 2 transforms into preallocated output arrays, older versions allocate a new output on every transform
+fft_out = np.lib.NumpyVersion(np.__version__) >= "2.0.0"
+
+def fast_fft_length(n):
+    """The smallest length of at least n with only the factors 2, 3 and 5, which are the fastest to transform."""
+
+    length = n
+    while True:
+        remainder = length
+        for factor in (2, 3, 5):
+            while remainder % factor == 0:
+                remainder //= factor
+        if remainder == 1:
+            return length
+        length += 1
+
+class AutocorrelationEngine:
+    """Batch autocorrelation with cached FFT lengths and reused workspaces for each signal shape.
+
+    The data windows only come in a handful of lengths, so each shape gets its FFT length, padded 
+    to a fast length of at least 2n - 1 to avoid circular wrap, and the spectrum, power and lag 
+    buffers, once. The power spectrum is computed in place, so computing an autocorrelation 
+    doesn't churn through new arrays in the long-lived child-processes.
+
+    The returned autocorrelation is a view into the lag buffer of its shape, so it is only valid 
+    until the next autocorrelation of the same shape, and must not be mutated or kept.
+    """
+
+    def __init__(self, rising_chunk=32):
+
+        self.workspaces = {}
+        self.rising = np.empty(rising_chunk, dtype=bool)
+
+    def workspace(self, shape):
+
+        if shape not in self.workspaces:
+            fft_length = fast_fft_length(2 * shape[-1] - 1)
+            self.workspaces[shape] = {
+                "fft_length": fft_length,
+                "spectrum": np.empty(shape[:-1] + (fft_length // 2 + 1,), dtype=np.complex128),
+                "power": np.empty(shape[:-1] + (fft_length // 2 + 1,)),
+                "imag_power": np.empty(shape[:-1] + (fft_length // 2 + 1,)),
+                "corr": np.empty(shape[:-1] + (fft_length,))
+            }
+        return self.workspaces[shape]
+
+    def autocorrelation(self, signal):
+        """The same as `autocorrelation`, but into the reused workspace of the shape of the signal."""
+
+        n = np.shape(signal)[-1]
+        workspace = self.workspace(np.shape(signal))
+        fft_length = workspace["fft_length"]
+
+        if fft_out:
+            spectrum = np.fft.rfft(signal, fft_length, out=workspace["spectrum"])
+        else:
+            spectrum = np.fft.rfft(signal, fft_length)
+
+        # the power spectrum |X|^2 is the inverse transform of the autocorrelation
+        power = np.multiply(spectrum.real, spectrum.real, out=workspace["power"])
+        power += np.multiply(spectrum.imag, spectrum.imag, out=workspace["imag_power"])
+
+        if fft_out:
+            corr = np.fft.irfft(power, fft_length, out=workspace["corr"])
+        else:
+            corr = np.fft.irfft(power, fft_length)
+
+        return corr[..., :n]
+
+    def first_rise(self, corr):
+        """The first lag where the autocorrelation rises to the next lag, None if it never rises.
+
+        The lags fall from lag 0 until about a quarter period, so the first rise is searched in 
+        chunks into a reused mask, instead of comparing every lag.
+        """
+
+        chunk = len(self.rising)
+        for start in range(0, len(corr) - 1, chunk):
+            end = min(start + chunk, len(corr) - 1)
+            rising = np.greater(corr[start + 1:end + 1], corr[start:end], out=self.rising[:end - start])
+            i = int(rising.argmax())
+            if rising[i]:
+                return start + i
+        return None
@@ -0,0 +1,412 @@
+import argparse
+import accelerometers
+import orbit_server
+import recording
+import resampling
+import rolling_window as rw
+import window_processing
+import sine
+import autocorrelation
+import multiprocessing
+import functools
+import itertools
+import logging
+import time
+import csv
+import sys
+import numpy as np
+
+result_fields = (
+    "time_window_ms",
+    "time_interval_ms",
+    "time_delta_ms",
+    "trace_id",
+    "start_ms",
+    "end_ms",
+    "samples",
+    "rps_east",
+    "rps_up",
+    "rps",
+    "direction",
+    "residual_east",
+    "residual_up"
+)
+
+# the capture is opened in each child-process by the process pool initializer
+# its samples are converted to m/s^2 and oriented once, and resampled once for each time delta, 
+# like the analysis loop ingests them
+# the cumulative sums of the resampled samples give the mean of any data window in O(1)
+capture_samples = None
+regular_samples = {}
+regular_sums = {}
+
+def setup_process(capture_path, sensor_type, orientation):
+
+    global capture_samples
+    (_, columns) = recording.read_capture(capture_path)
+    capture_samples = accelerometers.transform_samples(
+        recording.capture_samples(columns),
+        accelerometers.create_sample_transform(sensor_type, orientation)
+    )
+    regular_samples.clear()
+    regular_sums.clear()
+
+def resample_capture(time_delta_ms):
+
+    if time_delta_ms not in regular_samples:
+        regular_samples[time_delta_ms] = resampling.resample(capture_samples, time_delta_ms)
+        regular_sums[time_delta_ms] = np.vstack((
+            np.zeros((1, 4)),
+            np.cumsum(regular_samples[time_delta_ms], axis=0)
+        ))
+    return regular_samples[time_delta_ms]
+
+def window_bounds(times, time_window_ms, time_interval_ms):
+    """Reproduces the data windows that the analysis loop rolls over the regular sample times.
+
+    This follows `analysis_loop.run`, but only tracks the sample indices of the rolling window.
+    Returns the [start, end) sample indices of every data window the analysis loop would have
+    processed, in the order of their trace ids.
+    """
+
+    bounds = []
+    window_start_index = 0
+    window_end_index = 0
+    filled_rolling_window = False
+    shift_rolling_window = False
+    rolling_window_interval_start = times[0]
+
+    while True:
+
+        # the rolling interval ends at the first sample beyond it, like the analysis loop
+        # we stop at the last incomplete interval, which the analysis loop would still wait on
+        interval_end_index = int(np.searchsorted(times, rolling_window_interval_start + time_interval_ms, side="right"))
+        if interval_end_index >= len(times):
+            break
+
+        sample_time_ms = times[interval_end_index]
+
+        if (
+            not filled_rolling_window
+            and window_end_index > window_start_index
+            and times[window_start_index] + time_window_ms < sample_time_ms
+        ):
+
+            filled_rolling_window = True
+
+        elif (filled_rolling_window):
+
+            shift_rolling_window = True
+
+        if window_end_index > window_start_index and shift_rolling_window:
+
+            cutoff_index = int(np.searchsorted(
+                times[window_start_index:window_end_index],
+                times[window_start_index] + time_interval_ms,
+                side="right"
+            ))
+            if cutoff_index < window_end_index - window_start_index:
+                window_start_index += cutoff_index
+
+        window_end_index = interval_end_index
+
+        if filled_rolling_window:
+            bounds.append((window_start_index, window_end_index))
+
+        rolling_window_interval_start = sample_time_ms
+
+    return np.array(bounds, dtype=np.int64).reshape((-1, 2))
+
+def analyse_windows(time_delta_ms, direction_half_life_s, windows):
+    """Runs the window processing pipeline over a chunk of (trace_id, start, end) windows of the resampled capture.
+
+    Windows with the same number of samples are stacked into 2D arrays, so their autocorrelations
+    and frequencies are computed together. Returns a result row for each window.
+    """
+
+    sampling_rate = 1000 / time_delta_ms
+    samples = resample_capture(time_delta_ms)
+    sums = regular_sums[time_delta_ms]
+
+    norm_data_windows = []
+    for (trace_id, start, end) in windows:
+        data_window = {channel: samples[start:end, i] for (i, channel) in enumerate(rw.RollingWindow.channels)}
+        means = dict(zip(rw.RollingWindow.channels[1:], (sums[end, 1:] - sums[start, 1:]) / (end - start)))
+        norm_data_windows.append(window_processing.normalise_signals(data_window, means))
+
+    frequencies = [{} for _ in norm_data_windows]
+    wave_properties = [None for _ in norm_data_windows]
+    lengths = np.array([len(norm_data_window["time"]) for norm_data_window in norm_data_windows])
+    for length in np.unique(lengths):
+        group = np.flatnonzero(lengths == length)
+        for axis in ("east", "up"):
+            corrs = autocorrelation.autocorrelation(
+                np.stack([norm_data_windows[i][axis] for i in group])
+            )
+            for (i, freq) in zip(group, window_processing.freqs_from_corrs(corrs, sampling_rate)):
+                frequencies[i][axis] = freq
+
+        # the sine waves of both axes of every window in the group are fitted together
+        # windows without a frequency on an axis can't be fitted, and fail below
+        axes = window_processing.analysis_axes
+        fitted = [i for i in group if all(np.isfinite(frequencies[i][axis]) for axis in axes)]
+        if fitted:
+            (popts, pcovs) = sine.fit_sines(
+                [frequencies[i][axis] for i in fitted for axis in axes],
+                np.stack([norm_data_windows[i]["time"] for i in fitted for _ in axes]),
+                np.stack([norm_data_windows[i][axis] for i in fitted for axis in axes])
+            )
+            for (j, i) in enumerate(fitted):
+                wave_properties[i] = {
+                    axis: {"popt": popts[j * len(axes) + a], "pcov": pcovs[j * len(axes) + a]}
+                    for (a, axis) in enumerate(axes)
+                }
+
+    rows = []
+    for ((trace_id, start, end), norm_data_window, window_frequencies, window_wave_properties) in zip(
+        windows, 
+        norm_data_windows, 
+        frequencies, 
+        wave_properties
+    ):
+
+        rps = (window_frequencies["east"] + window_frequencies["up"]) / 2
+
+        try:
+
+            if window_wave_properties is None:
+                raise ValueError("Cannot fit a sine wave with a non-finite frequency: %r" % window_frequencies)
+
+            rotation_direction = window_processing.estimate_rotation_direction(
+                norm_data_window,
+                window_frequencies,
+                window_wave_properties,
+                direction_half_life_s
+            )
+
+            # the root mean square error of the fitted sine waves
+            residuals = {
+                axis: np.sqrt(np.mean((
+                    norm_data_window[axis] - window_processing.sine(
+                        window_frequencies[axis],
+                        norm_data_window["time"],
+                        *window_wave_properties[axis]["popt"]
+                    )
+                ) ** 2)) for axis in ("east", "up")
+            }
+
+        except ValueError as e:
+
+            logging.warning("%d - Window Processing Failed: %r", trace_id, e)
+            rotation_direction = 0
+            residuals = {"east": np.nan, "up": np.nan}
+
+        rows.append((
+            trace_id,
+            int(samples[start, 0]),
+            int(samples[end - 1, 0]),
+            end - start,
+            window_frequencies["east"],
+            window_frequencies["up"],
+            rps,
+            rotation_direction,
+            residuals["east"],
+            residuals["up"]
+        ))
+
+    return rows
+
+def parse_int_list(value):
+
+    return [int(v) for v in value.split(",")]
+
+def main():
+
+    command_line_parser = argparse.ArgumentParser(
+        description="Runs the window processing over every rolling data window of a capture, " +
+                    "and writes a CSV table of the results of each data window."
+    )
+    command_line_parser.add_argument("capture", type=str, help="Path to the Capture Directory")
+    command_line_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Path to the CSV Results Table (default is stdout)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-s",
+        "--sensor-type",
+        type=str,
+        help="Accelerometer Sensor Type, one of %s or a sensor of the sensor config (default is the sensor type of the capture, or am3x-1.5g)" % ", ".join(accelerometers.accel_sensors),
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-sc",
+        "--sensor-config",
+        type=str,
+        help="Path to a JSON file of additional Accelerometer Sensor Profiles, keyed by Sensor Type",
+        default=None
+    )
+    for (option, axis) in (("-ea", "east"), ("-na", "north"), ("-ua", "up")):
+        command_line_parser.add_argument(
+            option,
+            "--%s-axis" % axis,
+            type=str,
+            choices=["+x", "+y", "+z", "-x", "-y", "-z"],
+            help="%s Axis and Sign from Orbit Controller (default is the orientation of the capture)" % axis.title(),
+            default=None
+        )
+    command_line_parser.add_argument(
+        "-tw",
+        "--time-window",
+        type=parse_int_list,
+        help="Comma separated Rolling Time Window Sizes in Milliseconds to sweep (default is the capture's, or 4000ms)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-ti",
+        "--time-interval",
+        type=parse_int_list,
+        help="Comma separated Rolling Time Window Intervals in Milliseconds to sweep (default is the capture's, or 150ms)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-td",
+        "--time-delta",
+        type=parse_int_list,
+        help="Comma separated Sampling Periods in Milliseconds to sweep (default is the capture's, or 40ms)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-dh",
+        "--direction-half-life",
+        type=int,
+        help="Half Life in Milliseconds of the Recency Weighted Direction Vote (default is an unweighted vote)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of Window Processing Child-Processes (default is the number of CPUs)",
+        default=multiprocessing.cpu_count()
+    )
+    command_line_parser.add_argument(
+        "-cs",
+        "--chunk-size",
+        type=int,
+        help="Number of Data Windows processed together by a Child-Process (default is 256)",
+        default=256
+    )
+    command_line_parser.add_argument(
+        "-v",
+        "--verbose",
+        help="Log Verbose Messages",
+        action="store_const",
+        dest="loglevel",
+        const=logging.INFO
+    )
+    command_line_parser.add_argument(
+        "-d",
+        "--debug",
+        help="Log Debug Messages",
+        action="store_const",
+        dest="loglevel",
+        const=logging.DEBUG
+    )
+    command_line_args = command_line_parser.parse_args()
+
+    logging.basicConfig(level=command_line_args.loglevel)
+
+    # the analysis parameters default to the ones the capture was recorded with
+    (header, columns) = recording.read_capture(command_line_args.capture)
+
+    if command_line_args.sensor_config:
+        accelerometers.load_sensor_profiles(command_line_args.sensor_config)
+    sensor_type = command_line_args.sensor_type or header.get("sensor_type", "am3x-1.5g")
+    if sensor_type not in accelerometers.accel_sensors:
+        command_line_parser.error("unknown sensor type: %s" % sensor_type)
+    axes = {}
+    for (axis, default_axis) in (("east", "+x"), ("north", "+y"), ("up", "+z")):
+        captured_axis = header.get("orientation", {}).get(axis)
+        axes[axis] = (
+            getattr(command_line_args, axis + "_axis")
+            or (captured_axis["sign"] + captured_axis["axis"] if captured_axis else default_axis)
+        )
+    orientation = orbit_server.parse_orientation(axes["east"], axes["north"], axes["up"])
+    time_windows = command_line_args.time_window or [header.get("time_window_ms", 4000)]
+    time_intervals = command_line_args.time_interval or [header.get("time_interval_ms", 150)]
+    time_deltas = command_line_args.time_delta or [header.get("time_delta_ms", 40)]
+    direction_half_life_s = command_line_args.direction_half_life / 1000 if command_line_args.direction_half_life else None
+
+    logging.info("Analysing %d samples of capture: %s", len(columns["t"]), command_line_args.capture)
+
+    # the data windows are rolled over the resampled capture, the same as in the child-processes
+    setup_process(command_line_args.capture, sensor_type, orientation)
+
+    output = open(command_line_args.output, "w", newline="") if command_line_args.output else sys.stdout
+    results = csv.writer(output)
+    results.writerow(result_fields)
+
+    process_pool = multiprocessing.Pool(
+        processes=command_line_args.workers,
+        initializer=setup_process,
+        initargs=(command_line_args.capture, sensor_type, orientation)
+    )
+
+    try:
+
+        for (time_window_ms, time_interval_ms, time_delta_ms) in itertools.product(time_windows, time_intervals, time_deltas):
+
+            start_time = time.time()
+
+            bounds = window_bounds(resample_capture(time_delta_ms)[:, 0], time_window_ms, time_interval_ms)
+            windows = [(trace_id, int(start), int(end)) for (trace_id, (start, end)) in enumerate(bounds)]
+            chunks = [
+                windows[i:i + command_line_args.chunk_size]
+                for i in range(0, len(windows), command_line_args.chunk_size)
+            ]
+
+            analyse = functools.partial(
+                analyse_windows,
+                time_delta_ms,
+                direction_half_life_s
+            )
+
+            rps = []
+            directions = []
+            for rows in process_pool.imap(analyse, chunks):
+                for row in rows:
+                    results.writerow((time_window_ms, time_interval_ms, time_delta_ms) + row)
+                    rps.append(row[6])
+                    directions.append(row[7])
+
+            elapsed = time.time() - start_time
+            print(
+                "Time Window: %dms, Time Interval: %dms, Time Delta: %dms - %d windows in %.2fs (%.0f windows/s), "
+                "RPS median: %.4f, Directions (C/AC/?): %d/%d/%d" % (
+                    time_window_ms,
+                    time_interval_ms,
+                    time_delta_ms,
+                    len(windows),
+                    elapsed,
+                    len(windows) / elapsed if elapsed > 0 else 0,
+                    np.nanmedian(rps) if len(rps) and not np.isnan(rps).all() else np.nan,
+                    directions.count(1),
+                    directions.count(-1),
+                    directions.count(0)
+                ),
+                file=sys.stderr
+            )
+
+    finally:
+
+        process_pool.close()
+        process_pool.join()
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == "__main__":
+
+    main()
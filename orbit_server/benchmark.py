@@ -0,0 +1,390 @@
+import argparse
+import accelerometers
+import batch_analysis
+import window_processing
+import recording
+import resampling
+import rolling_window as rw
+import subprocess
+import platform
+import logging
+import json
+import time
+import sys
+import os
+import numpy as np
+
+stages = ("normalise", "frequency", "fit", "direction")
+
+def generate_orbit(
+    duration_ms,
+    sample_period_ms,
+    rps=1.0,
+    jitter_ms=3,
+    noise=0.3,
+    reversal_interval_ms=None,
+    accel=5.0,
+    sensor_type="am3x-1.5g",
+    seed=0
+):
+    """Generates the raw samples of a synthetic orbit, like the orbit controller would send them.
+
+    The east and up accelerations are sinusoids with the given amplitude in m/s^2, a quarter
+    period apart, and the up axis also measures gravity. The sample times are jittered uniformly
+    by up to jitter_ms, and gaussian noise with a standard deviation of noise m/s^2 is added
+    to every axis. The direction of the orbit reverses every reversal_interval_ms if it's given.
+
+    Returns an array of (t, x, y, z) rows in controller units, with east on x, north on y and up
+    on z, and the direction of the orbit at every sample, 1 being clockwise and -1 anticlockwise.
+    """
+
+    rng = np.random.default_rng(seed)
+    sensor = accelerometers.accel_sensors[sensor_type]
+
+    count = int(duration_ms // sample_period_ms)
+    jitter = rng.uniform(-jitter_ms, jitter_ms, count) if jitter_ms else np.zeros(count)
+    times = np.maximum.accumulate(np.round(
+        1000 + np.arange(count) * sample_period_ms + jitter
+    ))
+
+    if reversal_interval_ms:
+        directions = np.where((times - times[0]) // reversal_interval_ms % 2 == 0, 1, -1)
+    else:
+        directions = np.ones(count, dtype=np.int64)
+
+    # the phase is integrated, so the orbit stays continuous when it reverses
+    phase = 2 * np.pi * rps * np.concatenate(([0], np.cumsum(directions[1:] * np.diff(times) / 1000)))
+
+    accelerations = np.stack([
+        accel * np.sin(phase),
+        np.zeros(count),
+        accel * np.cos(phase) + sensor["g_units"]
+    ]) + rng.normal(0, noise, (3, count))
+
+    # the inverse of the accelerometer conversion, rounded and clipped like the analog readings
+    volts = accelerations / sensor["g_units"] * sensor["volt_per_g"] + sensor["volt_base"]
+    units = np.clip(np.round(volts * sensor["accel_unit_max"] / sensor["volt_max"]), 0, sensor["accel_unit_max"])
+
+    return (np.column_stack((times, units.T)), directions)
+
+def percentiles(durations_s):
+
+    durations_us = np.asarray(durations_s) * 1e6
+    return {
+        "p50": float(np.percentile(durations_us, 50)),
+        "p90": float(np.percentile(durations_us, 90)),
+        "p99": float(np.percentile(durations_us, 99)),
+        "mean": float(np.mean(durations_us))
+    }
+
+def benchmark(samples, directions, rps, time_window_ms, time_interval_ms, time_delta_ms, sensor_type, max_windows):
+    """Times every stage of the window processing over the rolling data windows of the samples.
+
+    The stages run in the same order as `window_processing.analyse_rotation_process`, so the
+    autocorrelation peak tracking sees consecutive windows. Durations are in microseconds.
+    """
+
+    orientation = {
+        "east": {"sign": "+", "axis": "x"},
+        "north": {"sign": "+", "axis": "y"},
+        "up": {"sign": "+", "axis": "z"}
+    }
+    sample_transform = accelerometers.create_sample_transform(sensor_type, orientation)
+    sampling_rate = 1000 / time_delta_ms
+
+    window_processing.last_peak_lags.clear()
+
+    # the data windows are rolled over the samples resampled onto the regular time grid
+    # the direction of a regular sample is the direction of the raw sample at or after it
+    regular_samples = resampling.resample(accelerometers.transform_samples(samples, sample_transform), time_delta_ms)
+    regular_directions = directions[np.searchsorted(samples[:, 0], regular_samples[:, 0])]
+
+    bounds = batch_analysis.window_bounds(regular_samples[:, 0], time_window_ms, time_interval_ms)[:max_windows]
+
+    # the samples are ingested like the analysis loop ingests them, as each rolling interval arrives
+    # so the normalise stage includes transforming and resampling the samples of the rolling interval
+    # the means of the data windows are from cumulative sums, like the running sums of the rolling window
+    resampler = resampling.StreamingResampler(time_delta_ms)
+    ingested = 0
+    sums = np.vstack((np.zeros((1, 4)), np.cumsum(regular_samples, axis=0)))
+
+    durations = {stage: [] for stage in stages}
+    rps_errors = []
+    correct_directions = 0
+
+    for (start, end) in bounds:
+
+        ingest_end = int(np.searchsorted(samples[:, 0], regular_samples[end - 1, 0])) + 1
+
+        stage_start = time.perf_counter()
+        resampler.resample(accelerometers.transform_samples(samples[ingested:ingest_end], sample_transform))
+        data_window = {channel: regular_samples[start:end, i].copy() for (i, channel) in enumerate(rw.RollingWindow.channels)}
+        means = dict(zip(rw.RollingWindow.channels[1:], (sums[end, 1:] - sums[start, 1:]) / (end - start)))
+        norm_data_window = window_processing.normalise_signals(data_window, means)
+        normalised = time.perf_counter()
+        frequencies = window_processing.estimate_frequency(norm_data_window, sampling_rate)
+        estimated = time.perf_counter()
+        wave_properties = window_processing.fit_sine_waves(norm_data_window, frequencies)
+        fitted = time.perf_counter()
+        rotation_direction = window_processing.estimate_rotation_direction(
+            norm_data_window,
+            frequencies,
+            wave_properties,
+            window_processing.direction_half_life_s
+        )
+        voted = time.perf_counter()
+
+        durations["normalise"].append(normalised - stage_start)
+        durations["frequency"].append(estimated - normalised)
+        durations["fit"].append(fitted - estimated)
+        durations["direction"].append(voted - fitted)
+
+        # the expected direction is the direction for most of the data window
+        rps_errors.append(abs((frequencies["east"] + frequencies["up"]) / 2 - rps))
+        if rotation_direction == np.sign(np.sum(regular_directions[start:end])):
+            correct_directions += 1
+
+        ingested = max(ingested, ingest_end)
+
+    totals = np.sum([durations[stage] for stage in stages], axis=0)
+
+    return {
+        "time_window_ms": time_window_ms,
+        "time_interval_ms": time_interval_ms,
+        "time_delta_ms": time_delta_ms,
+        "windows": len(bounds),
+        "samples_per_window": float(np.mean(bounds[:, 1] - bounds[:, 0])),
+        "stages": dict(
+            {stage: percentiles(durations[stage]) for stage in stages},
+            total=percentiles(totals)
+        ),
+        "windows_per_s": float(len(bounds) / np.sum(totals)),
+        "rps_error_median": float(np.nanmedian(rps_errors)),
+        "direction_accuracy": correct_directions / len(bounds)
+    }
+
+def git_commit():
+
+    repository = os.path.dirname(os.path.abspath(__file__))
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=repository, stderr=subprocess.DEVNULL)
+        status = subprocess.check_output(["git", "status", "--porcelain"], cwd=repository, stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return (None, None)
+    return (commit.decode().strip(), len(status.strip()) > 0)
+
+def print_results(results):
+
+    for result in results:
+        print(
+            "Time Window: %dms, Time Delta: %dms, %d windows of %.0f samples - %.0f windows/s, "
+            "RPS error: %.4f, Direction accuracy: %.2f" % (
+                result["time_window_ms"],
+                result["time_delta_ms"],
+                result["windows"],
+                result["samples_per_window"],
+                result["windows_per_s"],
+                result["rps_error_median"],
+                result["direction_accuracy"]
+            )
+        )
+        for stage in stages + ("total",):
+            latency = result["stages"][stage]
+            print("    %-10s p50 %9.1fus  p90 %9.1fus  p99 %9.1fus" % (stage, latency["p50"], latency["p90"], latency["p99"]))
+
+def compare_results(baseline, results, threshold):
+    """Compares the p50 latencies and the throughput against a baseline, returns the number of regressions."""
+
+    baseline_results = {
+        (result["time_window_ms"], result["time_delta_ms"]): result for result in baseline["results"]
+    }
+
+    print("Compared to commit %s:" % baseline.get("commit"))
+
+    regressions = 0
+    for result in results:
+
+        key = (result["time_window_ms"], result["time_delta_ms"])
+        if key not in baseline_results:
+            continue
+        baseline_result = baseline_results[key]
+
+        print("Time Window: %dms, Time Delta: %dms" % key)
+        for stage in stages + ("total",):
+            before = baseline_result["stages"][stage]["p50"]
+            after = result["stages"][stage]["p50"]
+            change = after / before - 1
+            regressed = change > threshold
+            regressions += regressed
+            print("    %-10s p50 %9.1fus -> %9.1fus  %+6.1f%%%s" % (stage, before, after, change * 100, "  REGRESSION" if regressed else ""))
+        print("    %-10s %9.0f/s  -> %9.0f/s" % ("windows", baseline_result["windows_per_s"], result["windows_per_s"]))
+
+    return regressions
+
+def parse_int_list(value):
+
+    return [int(v) for v in value.split(",")]
+
+def main():
+
+    command_line_parser = argparse.ArgumentParser(
+        description="Benchmarks the stages of the window processing over synthetic orbits."
+    )
+    command_line_parser.add_argument(
+        "-tw",
+        "--time-window",
+        type=parse_int_list,
+        help="Comma separated Rolling Time Window Sizes in Milliseconds (default is 2000,4000,8000)",
+        default=[2000, 4000, 8000]
+    )
+    command_line_parser.add_argument(
+        "-ti",
+        "--time-interval",
+        type=int,
+        help="Rolling Time Window Interval in Milliseconds (default is 150ms)",
+        default=150
+    )
+    command_line_parser.add_argument(
+        "-td",
+        "--time-delta",
+        type=parse_int_list,
+        help="Comma separated Sampling Periods in Milliseconds, the orbits are sampled at these periods (default is 20,40)",
+        default=[20, 40]
+    )
+    command_line_parser.add_argument(
+        "-n",
+        "--windows",
+        type=int,
+        help="Number of Data Windows to time for each Window Size and Sampling Period (default is 200)",
+        default=200
+    )
+    command_line_parser.add_argument(
+        "--rps",
+        type=float,
+        help="Rotations per Second of the synthetic orbit (default is 1.0)",
+        default=1.0
+    )
+    command_line_parser.add_argument(
+        "--jitter",
+        type=float,
+        help="Maximum Jitter of the sample times in Milliseconds (default is 3ms)",
+        default=3
+    )
+    command_line_parser.add_argument(
+        "--noise",
+        type=float,
+        help="Standard Deviation of the acceleration noise in m/s^2 (default is 0.3)",
+        default=0.3
+    )
+    command_line_parser.add_argument(
+        "--reversal-interval",
+        type=int,
+        help="Milliseconds between reversals of the orbit direction (default is no reversals)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "--seed",
+        type=int,
+        help="Seed of the synthetic orbits (default is 0)",
+        default=0
+    )
+    command_line_parser.add_argument(
+        "-s",
+        "--sensor-type",
+        type=str,
+        choices=[k for k in accelerometers.accel_sensors],
+        help="Accelerometer Sensor Type",
+        default="am3x-1.5g"
+    )
+    command_line_parser.add_argument(
+        "-o",
+        "--output",
+        type=str,
+        help="Save the results as JSON to this path"
+    )
+    command_line_parser.add_argument(
+        "--compare",
+        type=str,
+        help="Compare the results against the JSON results saved at this path"
+    )
+    command_line_parser.add_argument(
+        "--threshold",
+        type=float,
+        help="Relative p50 latency increase that is reported as a regression (default is 0.1)",
+        default=0.1
+    )
+    command_line_parser.add_argument(
+        "--save-capture",
+        type=str,
+        help="Also save each synthetic orbit as a capture, into this directory, for replays and batch analysis"
+    )
+    command_line_args = command_line_parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+
+    results = []
+    for time_delta_ms in command_line_args.time_delta:
+        for time_window_ms in command_line_args.time_window:
+
+            # enough samples for the initial window and the timed windows
+            duration_ms = time_window_ms + (command_line_args.windows + 2) * command_line_args.time_interval + 1000
+            (samples, directions) = generate_orbit(
+                duration_ms,
+                time_delta_ms,
+                rps=command_line_args.rps,
+                jitter_ms=command_line_args.jitter,
+                noise=command_line_args.noise,
+                reversal_interval_ms=command_line_args.reversal_interval,
+                sensor_type=command_line_args.sensor_type,
+                seed=command_line_args.seed
+            )
+
+            if command_line_args.save_capture:
+                capture = recording.CaptureWriter(
+                    os.path.join(command_line_args.save_capture, "orbit-%dms-%dms" % (time_window_ms, time_delta_ms)),
+                    sensor_type=command_line_args.sensor_type,
+                    time_window_ms=time_window_ms,
+                    time_interval_ms=command_line_args.time_interval,
+                    time_delta_ms=time_delta_ms
+                )
+                capture.write(samples)
+                capture.close()
+
+            results.append(benchmark(
+                samples,
+                directions,
+                command_line_args.rps,
+                time_window_ms,
+                command_line_args.time_interval,
+                time_delta_ms,
+                command_line_args.sensor_type,
+                command_line_args.windows
+            ))
+
+    print_results(results)
+
+    (commit, dirty) = git_commit()
+    report = {
+        "commit": commit,
+        "dirty": dirty,
+        "created": time.time(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "parameters": vars(command_line_args),
+        "results": results
+    }
+
+    if command_line_args.output:
+        with open(command_line_args.output, "w") as output:
+            json.dump(report, output, indent=4)
+
+    if command_line_args.compare:
+        with open(command_line_args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+        if compare_results(baseline, results, command_line_args.threshold) > 0:
+            sys.exit(1)
+
+if __name__ == "__main__":
+
+    main()
@@ -1,26 +1,190 @@
 import collections
+import threading
+
+class ChannelClosed(Exception):
+    """Raised when receiving from a channel that is closed and has no values left."""
+    pass
+
+class Channel:
+    """A subscription to the broadcaster, holding the broadcasted values not yet received.
+
+    The policy decides what happens when a value is broadcasted into a full channel:
+
+        * "latest" only keeps the newest value of each key, any value of the same key not yet 
+          received is replaced
+        * "bounded" keeps up to `size` values, and drops the newly broadcasted value when full
+        * "drop-oldest" keeps up to `size` values, and drops the oldest value when full
+
+    Values are broadcasted with a key, such as the controller that they came from. A channel
+    only receives the values of the keys it is subscribed to, or of every key if its keys are
+    None. Values broadcasted without a key are received by every channel.
+
+    Subscribers can block on `get`, or pass a notify function which is called after every
+    broadcast and on close, so an event loop can be woken up to `pop` the values.
+    """
+
+    def __init__(self, policy, size, notify=None, name=None, keys=None):
+
+        if policy not in policies:
+            raise ValueError("Unknown channel policy: %r" % policy)
+
+        self.policy = policy
+        self.size = 1 if policy == "latest" else size
+        self.notify = notify
+        self.name = name
+        self.keys = None if keys is None else frozenset(keys)
+        self.values = collections.deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        self.delivered = 0
+        self.dropped = 0
+
+    def subscribe(self, keys):
+        """Changes the keys that the channel is subscribed to, None subscribes to every key."""
+
+        with self.condition:
+            self.keys = None if keys is None else frozenset(keys)
+
+    def subscribes(self, key):
+
+        keys = self.keys
+        return key is None or keys is None or key in keys
+
+    def put(self, value, key=None):
+
+        with self.condition:
+
+            if self.closed:
+                return
+
+            if self.policy == "latest":
+                # there are only ever as many values as keys, so this is a short scan
+                for (i, (value_key, _)) in enumerate(self.values):
+                    if value_key == key:
+                        self.dropped += 1
+                        del self.values[i]
+                        break
+            elif len(self.values) >= self.size:
+                self.dropped += 1
+                if self.policy == "bounded":
+                    return
+                self.values.popleft()
+
+            self.values.append((key, value))
+            self.condition.notify_all()
+
+        if self.notify:
+            self.notify()
+
+    def get(self, timeout=None):
+        """Blocks until a value is broadcasted, returns None if the timeout expires first."""
+
+        with self.condition:
+
+            self.condition.wait_for(lambda: self.values or self.closed, timeout)
+
+            if self.values:
+                self.delivered += 1
+                return self.values.popleft()[1]
+
+            if self.closed:
+                raise ChannelClosed()
+
+            return None
+
+    def pop(self):
+        """Non-blocking receive, raises IndexError if there is no value."""
+
+        with self.condition:
+
+            if not self.values and self.closed:
+                raise ChannelClosed()
+
+            (_, value) = self.values.popleft()
+            self.delivered += 1
+            return value
+
+    def close(self):
+        """Closes the channel, values already broadcasted can still be received."""
+
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+
+        if self.notify:
+            self.notify()
+
+    def stats(self):
+        """The lag is the number of values broadcasted but not yet received."""
+
+        with self.condition:
+            return {
+                "name": self.name,
+                "keys": None if self.keys is None else sorted(self.keys),
+                "policy": self.policy,
+                "size": self.size,
+                "lag": len(self.values),
+                "delivered": self.delivered,
+                "dropped": self.dropped,
+                "closed": self.closed
+            }
+
+policies = ("latest", "bounded", "drop-oldest")
 
 class Broadcaster:
+    """Thread-safe fan-out of values to all the subscribed channels.
+
+    Channels are subscribed with `add_channel` and must be unsubscribed with `remove_channel`,
+    which also closes them. Channels that were closed directly are unsubscribed on the next
+    broadcast, so they do not accumulate on a long running server.
+    """
 
-    def __init__(self, size):
+    def __init__(self, size, policy="latest"):
 
         self.channels = []
         self.channel_size = size
+        self.channel_policy = policy
+        self.lock = threading.Lock()
 
-    def add_channel(self):
+    def add_channel(self, notify=None, policy=None, size=None, name=None, keys=None):
+        """Adds a channel, the optional notify function is called after every broadcast into it.
 
-        channel = collections.deque(maxlen=self.channel_size)
-        self.channels.append(channel)
+        The notify function is called from the broadcasting thread, so it should only schedule
+        work for the subscriber, such as waking up an event loop. The name identifies the 
+        subscriber in the statistics. The channel is subscribed to the keys, or every key if None.
+        """
+
+        channel = Channel(
+            policy if policy is not None else self.channel_policy,
+            size if size is not None else self.channel_size,
+            notify,
+            name,
+            keys
+        )
+        with self.lock:
+            self.channels.append(channel)
         return channel
 
     def remove_channel(self, channel):
 
-        try:
-            self.channels.remove(channel)
-        except:
-            pass
+        with self.lock:
+            self.channels = [c for c in self.channels if c is not channel]
+        channel.close()
+
+    def broadcast(self, value, key=None):
+
+        with self.lock:
+            self.channels = [c for c in self.channels if not c.closed]
+            channels = self.channels
+
+        for channel in channels:
+            if channel.subscribes(key):
+                channel.put(value, key)
+
+    def stats(self):
+        """Statistics of every subscribed channel."""
 
-    def broadcast(self, value):
+        with self.lock:
+            channels = self.channels
 
-        for channel in self.channels:
-            channel.append(value)
\ No newline at end of file
+        return [channel.stats() for channel in channels]
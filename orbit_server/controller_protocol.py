@@ -0,0 +1,226 @@
+import numpy as np
+
+# the controller protocol is negotiated when connecting to the controller
+# the query command asks the controller if it supports the binary protocol
+# which it acknowledges by replying with the acknowledgement byte
+binary_protocol_query_command = b"3\n"
+binary_protocol_acknowledgement = b"B"
+stop_command = b"0"
+
+class AsciiFrameReader:
+    """Buffered decoder of the ASCII frames sent by the orbit controller.
+
+    Each frame looks like `STime=1234,X=512,Y=498,Z=620E`. Instead of reading the serial
+    device one byte at a time, everything that is waiting on the device is read in one go,
+    and all the complete frames in the buffer are split out and decoded together. A partial
+    frame at the end of the buffer is kept until the rest of it arrives.
+
+    Bytes outside of frames (such as the ready messages) are discarded, and frames that
+    don't decode into a sample are counted as malformed and dropped.
+    """
+
+    start_command = b"1"
+    sample_fields = (b"time", b"x", b"y", b"z")
+
+    def __init__(self, controller, frame_start_byte=b"S", frame_end_byte=b"E"):
+
+        self.controller = controller
+        self.frame_start_byte = frame_start_byte
+        self.frame_end_byte = frame_end_byte
+        self.buffer = bytearray()
+        self.malformed_frames = 0
+
+    def read_samples(self):
+        """Blocks until at least one sample is decoded, returns an array of (t, x, y, z) rows."""
+
+        while True:
+
+            # read everything that is waiting, but block for at least 1 byte
+            self.buffer += self.controller.read(max(1, self.controller.in_waiting))
+
+            samples = self.decode()
+            if len(samples) > 0:
+                return samples
+
+    def decode(self):
+
+        frames_end = self.buffer.rfind(self.frame_end_byte)
+        if frames_end < 0:
+            return np.empty((0, 4))
+
+        frames = self.buffer[:frames_end].split(self.frame_end_byte)
+        del self.buffer[:frames_end + 1]
+
+        samples = []
+        for frame in frames:
+
+            # discard bytes until the last frame start byte
+            frame_start = frame.rfind(self.frame_start_byte)
+            if frame_start < 0:
+                continue
+
+            sample = self.decode_sample(frame[frame_start + 1:])
+            if sample is None:
+                self.malformed_frames += 1
+            else:
+                samples.append(sample)
+
+        return np.array(samples, dtype=np.float64).reshape((-1, 4))
+
+    def decode_sample(self, message):
+
+        fields = message.split(b",")
+        if len(fields) != len(self.sample_fields):
+            return None
+
+        sample = []
+        for (field, sample_field) in zip(fields, self.sample_fields):
+            (name, _, value) = field.partition(b"=")
+            if name.lower() != sample_field or not value.isdigit():
+                return None
+            sample.append(int(value))
+
+        return sample
+
+def create_crc8_table(polynomial):
+
+    table = np.zeros(256, dtype=np.uint8)
+    for byte in range(256):
+        crc = byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ polynomial) if (crc & 0x80) else (crc << 1)
+        table[byte] = crc & 0xFF
+    return table
+
+crc8_table = create_crc8_table(0x07)
+
+def crc8(payloads):
+    """CRC-8 of every row of a 2D array of payload bytes."""
+
+    crc = np.zeros(len(payloads), dtype=np.uint8)
+    for column in range(payloads.shape[1]):
+        crc = crc8_table[crc ^ payloads[:, column]]
+    return crc
+
+class BinaryFrameReader:
+    """Buffered decoder of the fixed-width binary frames sent by the orbit controller.
+
+    Each frame is 12 bytes, all values are little endian:
+
+        * a sync byte 0xA5
+        * the time as uint32
+        * the X, Y and Z values as uint16
+        * a CRC-8 (polynomial 0x07) of the time and the X, Y and Z values
+
+    Everything that is waiting on the device is read in one go, then all the complete frames 
+    are decoded together with `numpy.frombuffer`, and their sync bytes and checksums are checked 
+    in bulk. Frames are consumed up to the first invalid frame, after which the reader 
+    resynchronises by searching for the next sync byte, counting the invalid frame as malformed.
+    """
+
+    start_command = b"2"
+    sync_byte = 0xA5
+    frame_size = 12
+    frame_dtype = np.dtype([
+        ("sync", "u1"), 
+        ("time", "<u4"), 
+        ("x", "<u2"), 
+        ("y", "<u2"), 
+        ("z", "<u2"), 
+        ("crc", "u1")
+    ])
+
+    def __init__(self, controller):
+
+        self.controller = controller
+        self.buffer = bytearray()
+        self.malformed_frames = 0
+        self.resynchronising = False
+
+    def read_samples(self):
+        """Blocks until at least one sample is decoded, returns an array of (t, x, y, z) rows."""
+
+        while True:
+
+            # read everything that is waiting, but block for at least 1 byte
+            self.buffer += self.controller.read(max(1, self.controller.in_waiting))
+
+            samples = self.decode()
+            if len(samples) > 0:
+                return samples
+
+    def decode(self):
+
+        batches = []
+
+        while True:
+
+            # discard bytes until the sync byte
+            frame_start = self.buffer.find(self.sync_byte)
+            if frame_start < 0:
+                self.buffer.clear()
+                break
+            del self.buffer[:frame_start]
+
+            count = len(self.buffer) // self.frame_size
+            if count == 0:
+                break
+
+            frame_bytes = np.frombuffer(bytes(self.buffer[:count * self.frame_size]), dtype=np.uint8)
+            frame_bytes = frame_bytes.reshape((count, self.frame_size))
+
+            valid = (frame_bytes[:, 0] == self.sync_byte) & (crc8(frame_bytes[:, 1:-1]) == frame_bytes[:, -1])
+            valid_count = count if valid.all() else int(np.argmin(valid))
+
+            frames = frame_bytes[:valid_count].view(self.frame_dtype).reshape(-1)
+            batches.append(np.column_stack((frames["time"], frames["x"], frames["y"], frames["z"])))
+            del self.buffer[:valid_count * self.frame_size]
+
+            if valid_count > 0:
+                self.resynchronising = False
+
+            if valid_count == count:
+                break
+
+            # drop the sync byte of the invalid frame, and resynchronise on the next one
+            # until a valid frame is found, any invalid frames are part of the same malformed frame
+            if not self.resynchronising:
+                self.malformed_frames += 1
+                self.resynchronising = True
+            del self.buffer[:1]
+
+        if not batches:
+            return np.empty((0, 4))
+
+        return np.concatenate(batches).astype(np.float64)
+
+def encode_ascii_frames(samples):
+    """Encodes an array of (t, x, y, z) rows into the ASCII frames sent by the orbit controller."""
+
+    return b"".join(
+        b"STime=%d,X=%d,Y=%d,Z=%dE" % tuple(sample) 
+        for sample in samples.astype(np.int64).tolist()
+    )
+
+def encode_binary_frames(samples):
+    """Encodes an array of (t, x, y, z) rows into the binary frames sent by the orbit controller."""
+
+    frames = np.zeros(len(samples), dtype=BinaryFrameReader.frame_dtype)
+    frames["sync"] = BinaryFrameReader.sync_byte
+    for (column, field) in enumerate(("time", "x", "y", "z")):
+        frames[field] = samples[:, column]
+
+    frame_bytes = frames.view(np.uint8).reshape((len(samples), BinaryFrameReader.frame_size))
+    frames["crc"] = crc8(frame_bytes[:, 1:-1])
+
+    return frames.tobytes()
+
+frame_readers = {
+    "ascii": AsciiFrameReader,
+    "binary": BinaryFrameReader
+}
+
+frame_encoders = {
+    "ascii": encode_ascii_frames,
+    "binary": encode_binary_frames
+}
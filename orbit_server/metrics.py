@@ -0,0 +1,167 @@
+import http.server
+import threading
+import logging
+import time
+
+# every metric that is exposed, with its type and help text
+# the names follow the prometheus text format, so the endpoint can also be scraped
+definitions = {
+    "orbit_samples_total": ("counter", "Samples ingested from the controller"),
+    "orbit_samples_per_second": ("gauge", "Samples ingested per second, over the last second"),
+    "orbit_malformed_frames_total": ("counter", "Malformed frames dropped by the frame reader"),
+    "orbit_windows_submitted_total": ("counter", "Data windows submitted to the process pool"),
+    "orbit_windows_skipped_total": ("counter", "Data windows skipped because the process pool was backlogged"),
+    "orbit_windows_completed_total": ("counter", "Data windows processed and broadcasted"),
+    "orbit_windows_dropped_total": ("counter", "Data windows superseded or out of order, and not broadcasted"),
+    "orbit_windows_failed_total": ("counter", "Data windows that failed processing"),
+    "orbit_windows_late_total": ("counter", "Data windows that missed their deadline, and were skipped or had their worker killed"),
+    "orbit_workers_respawned_total": ("counter", "Window processing child-processes respawned after hanging or dying"),
+    "orbit_pool_backlog": ("gauge", "Data windows submitted to the process pool but not yet finished"),
+    "orbit_result_age_seconds": ("gauge", "Time from reading the last samples of a data window to broadcasting its result"),
+    "orbit_result_age_seconds_sum": ("counter", "Sum of the result ages"),
+    "orbit_result_age_seconds_count": ("counter", "Number of result ages"),
+    "orbit_clients": ("gauge", "Connected clients"),
+    "orbit_client_send_failures_total": ("counter", "Failed writes to clients"),
+    "orbit_client_keepalive_timeouts_total": ("counter", "Clients disconnected for not sending a keepalive"),
+    "orbit_client_delivered_total": ("counter", "Rotations delivered to each connected client"),
+    "orbit_client_dropped_total": ("counter", "Rotations dropped by the channel of each connected client"),
+    "orbit_client_lag": ("gauge", "Rotations broadcasted but not yet sent to each connected client")
+}
+
+class Meter:
+    """Rate of a counter over the last completed second."""
+
+    def __init__(self):
+
+        self.window_start = time.monotonic()
+        self.window_count = 0
+        self.rate = 0.0
+
+    def mark(self, amount):
+
+        self.window_count += amount
+        now = time.monotonic()
+        if now - self.window_start >= 1:
+            self.rate = self.window_count / (now - self.window_start)
+            self.window_start = now
+            self.window_count = 0
+
+    def value(self):
+
+        # the rate decays if nothing was marked for more than a second
+        elapsed = time.monotonic() - self.window_start
+        return self.window_count / elapsed if elapsed >= 1 else self.rate
+
+class Registry:
+    """Thread-safe values of the metrics.
+
+    Values are updated from the analysis loop, the callback thread and the server threads,
+    which only take the lock for an addition. Computed metrics are functions that are called
+    when the metrics are rendered, they either return a value, or a dict of values by label.
+    """
+
+    def __init__(self):
+
+        self.lock = threading.Lock()
+        self.values = {name: 0 for name in definitions}
+        self.functions = {}
+        self.meters = {"orbit_samples_total": Meter()}
+
+    def increment(self, name, amount=1):
+
+        with self.lock:
+            self.values[name] += amount
+            if name in self.meters:
+                self.meters[name].mark(amount)
+
+    def set_value(self, name, value):
+
+        with self.lock:
+            self.values[name] = value
+
+    def observe(self, name, value):
+        """Sets a gauge, and accumulates its sum and count."""
+
+        with self.lock:
+            self.values[name] = value
+            self.values[name + "_sum"] += value
+            self.values[name + "_count"] += 1
+
+    def register(self, name, function):
+
+        self.functions[name] = function
+
+    def render(self):
+        """Renders the metrics in the prometheus text format."""
+
+        with self.lock:
+            values = dict(self.values)
+            values["orbit_samples_per_second"] = self.meters["orbit_samples_total"].value()
+
+        values["orbit_pool_backlog"] = values["orbit_windows_submitted_total"] - (
+            values["orbit_windows_completed_total"]
+            + values["orbit_windows_dropped_total"]
+            + values["orbit_windows_failed_total"]
+        )
+
+        for (name, function) in self.functions.items():
+            try:
+                values[name] = function()
+            except Exception:
+                logging.exception("Failed to compute the metric: %s", name)
+
+        lines = []
+        for (name, (metric_type, help_text)) in definitions.items():
+            lines.append("# HELP %s %s" % (name, help_text))
+            lines.append("# TYPE %s %s" % (name, metric_type))
+            if isinstance(values[name], dict):
+                for (label, value) in values[name].items():
+                    lines.append('%s{client="%s"} %s' % (name, label, value))
+            else:
+                lines.append("%s %s" % (name, values[name]))
+
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+
+def increment(name, amount=1):
+
+    registry.increment(name, amount)
+
+def set_value(name, value):
+
+    registry.set_value(name, value)
+
+def observe(name, value):
+
+    registry.observe(name, value)
+
+def register(name, function):
+
+    registry.register(name, function)
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+
+    def do_GET(self):
+
+        body = registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+
+        logging.debug("Metrics request from %s: %s", self.address_string(), format % args)
+
+def serve(host, port):
+    """Serves the metrics over HTTP from a daemon thread, so the analysis loop is never blocked."""
+
+    logging.info("Serving metrics at http://%s:%d/metrics", host, port)
+    server = http.server.ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    server_thread = threading.Thread(target=server.serve_forever)
+    server_thread.daemon = True
+    server_thread.start()
+    return server
@@ -4,22 +4,72 @@ import argparse
 import accelerometers
 import signal as unix_signal
 import server_loop
+import async_server_loop
 import analysis_loop
-import multiprocessing
+import controller_protocol
+import window_processing
 import broadcaster
-import graphing
+import recording
+import tracing
+import metrics
+import shared_windows
+import sequencer
+import supervisor
+import adaptive_window
+import threading
 import logging
+import queue
 
 axis_regex = re.compile('([+-])([xyz])', re.I)
 
-def cleanup_and_exit(pool, device, server, code):
+server_loops = {
+    "asyncio": async_server_loop,
+    "threading": server_loop
+}
+
+def parse_orientation(east_axis, north_axis, up_axis):
+    """Maps the ENU axes to the signed controller axes, such as "+x"."""
+
+    east_axis_match = re.match(axis_regex, east_axis)
+    north_axis_match = re.match(axis_regex, north_axis)
+    up_axis_match = re.match(axis_regex, up_axis)
+    return {
+        "east": {
+            "sign": east_axis_match.group(1),
+            "axis": east_axis_match.group(2).lower()
+        },
+        "north": {
+            "sign": north_axis_match.group(1), 
+            "axis": north_axis_match.group(2).lower()
+        },
+        "up": {
+            "sign": up_axis_match.group(1), 
+            "axis": up_axis_match.group(2).lower()
+        }
+    }
+
+def parse_axis_list(value):
+
+    axes = value.split(",")
+    for axis in axes:
+        if not re.fullmatch(axis_regex, axis):
+            raise argparse.ArgumentTypeError("invalid axis: %r" % axis)
+    return axes
+
+def cleanup_and_exit(pool, windows, devices, captures, server, code):
     print("Closing Orbit Detection Process Pool and TCP Server!")
     if pool:
         pool.close()
-    if device and device.is_open:
-        device.write_timeout = 0
-        device.write(b"0")
-        device.close()
+    if windows:
+        windows.close()
+    for device in devices:
+        if device.is_open:
+            device.write_timeout = 0
+            device.write(controller_protocol.stop_command)
+            device.close()
+    for capture in captures:
+        capture.close()
+    tracing.close()
     if server:
         server.shutdown()
         server.server_close()
@@ -28,41 +78,99 @@ def cleanup_and_exit(pool, device, server, code):
 def main():
 
     command_line_parser = argparse.ArgumentParser()
-    command_line_parser.add_argument("device", type=str, help="Path to Orbit Controller Serial Device")
+    command_line_parser.add_argument(
+        "device", 
+        type=str, 
+        nargs="+", 
+        help="Paths to Orbit Controller Serial Devices, each controller is identified by its position from 0"
+    )
     command_line_parser.add_argument("baud", type=int, help="Baud Rate")
     command_line_parser.add_argument("host", type=str, help="IP Address for the Orbit Detection Server")
     command_line_parser.add_argument("port", type=int, help="Port for the Orbit Detection Server")
+    command_line_parser.add_argument(
+        "-sm",
+        "--server-mode",
+        type=str,
+        choices=[k for k in server_loops],
+        help="TCP Server Mode, an asyncio event loop or a thread per client (default is asyncio)",
+        default="asyncio"
+    )
+    command_line_parser.add_argument(
+        "-cp",
+        "--client-policy",
+        type=str,
+        choices=broadcaster.policies,
+        help="What a slow client's channel does when it is full: keep only the latest rotation, " + 
+             "drop new rotations, or drop the oldest rotations (default is latest)",
+        default="latest"
+    )
+    command_line_parser.add_argument(
+        "-cq",
+        "--client-queue",
+        type=int,
+        help="Number of rotations a client's channel holds for the bounded and drop-oldest policies (default is 8)",
+        default=8
+    )
+    command_line_parser.add_argument(
+        "-b",
+        "--binary-protocol",
+        help="Negotiate the Binary Controller Protocol, falls back to ASCII if unsupported",
+        action="store_true"
+    )
+    command_line_parser.add_argument(
+        "-c",
+        "--capture",
+        type=str,
+        help="Record the controller samples into a new capture directory at this path, " + 
+             "with multiple controllers each is recorded at this path suffixed by the controller id"
+    )
+    command_line_parser.add_argument(
+        "-r",
+        "--replay",
+        help="Replay the capture directories at the device paths instead of serial devices, the baud rate is ignored",
+        action="store_true"
+    )
+    command_line_parser.add_argument(
+        "-rs",
+        "--replay-speed",
+        type=float,
+        help="Speed multiplier of the replay, 0 replays as fast as possible (default is 1)",
+        default=1.0
+    )
     command_line_parser.add_argument(
         "-s", 
         "--sensor-type",
         type=str,
-        choices=[k for k in accelerometers.accel_sensors],
-        help="Accelerometer Sensor Type",
+        help="Accelerometer Sensor Type, one of %s or a sensor of the sensor config (default is am3x-1.5g)" % ", ".join(accelerometers.accel_sensors),
         default="am3x-1.5g"
     )
+    command_line_parser.add_argument(
+        "-sc",
+        "--sensor-config",
+        type=str,
+        help="Path to a JSON file of additional Accelerometer Sensor Profiles, keyed by Sensor Type",
+        default=None
+    )
     command_line_parser.add_argument(
         "-ea", 
         "--east-axis", 
-        type=str, 
-        choices=["+x", "+y", "+z", "-x", "-y", "-z"], 
-        help="East Axis and Sign from Orbit Controller",
-        default="+x"
+        type=parse_axis_list, 
+        help="East Axis and Sign from Orbit Controller, such as +x, or comma separated for each controller (default is +x)",
+        default=['+x']
     )
     command_line_parser.add_argument(
         "-na", 
         "--north-axis", 
-        type=str, 
-        choices=["+x", "+y", "+z", "-x", "-y", "-z"], 
-        help="North Axis and Sign from Orbit Controller",
-        default="+y"
+        type=parse_axis_list, 
+        help="North Axis and Sign from Orbit Controller, such as +x, or comma separated for each controller (default is +y)",
+        default=['+y']
     )
     command_line_parser.add_argument(
         "-ua", 
         "--up-axis", 
-        type=str, 
-        choices=["+x", "+y", "+z", "-x", "-y", "-z"], 
-        help="Up Axis and Sign from Orbit Controller",
-        default="+z"
+        type=parse_axis_list, 
+        help="Up Axis and Sign from Orbit Controller, such as +x, or comma separated for each controller (default is +z)",
+        default=['+z']
     )
     command_line_parser.add_argument(
         "-tw", 
@@ -85,6 +193,77 @@ def main():
         help="Sampling Period in Milliseconds (default is 30ms)",
         default=40
     )
+    command_line_parser.add_argument(
+        "-ap", 
+        "--adaptive-periods", 
+        type=float, 
+        help="Adapt the Rolling Time Window to this many Rotation Periods of the last estimated frequency, " + 
+             "instead of the fixed time window (default is disabled)"
+    )
+    command_line_parser.add_argument(
+        "-twn", 
+        "--min-time-window", 
+        type=int, 
+        help="Minimum Adaptive Rolling Time Window Size in Milliseconds (default is 1000ms)",
+        default=1000
+    )
+    command_line_parser.add_argument(
+        "-twx", 
+        "--max-time-window", 
+        type=int, 
+        help="Maximum Adaptive Rolling Time Window Size in Milliseconds (default is 8000ms)",
+        default=8000
+    )
+    command_line_parser.add_argument(
+        "-w",
+        "--workers",
+        type=int,
+        help="Number of Window Processing Child-Processes (default is 1)",
+        default=1
+    )
+    command_line_parser.add_argument(
+        "-dl",
+        "--deadline-intervals",
+        type=float,
+        help="Deadline of each Data Window in Rolling Time Window Intervals, " + 
+             "late windows are skipped and hung Child-Processes are respawned (default is 4)",
+        default=4
+    )
+    command_line_parser.add_argument(
+        "-lr",
+        "--lag-radius",
+        type=int,
+        help="Radius in Lags of the Autocorrelation Peak Search around the Last Peak of each Controller Axis, " + 
+             "falling back to a full search when the peak is lost (default is always a full search)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-dh",
+        "--direction-half-life",
+        type=int,
+        help="Half Life in Milliseconds of the Recency Weighted Direction Vote (default is an unweighted vote)",
+        default=None
+    )
+    command_line_parser.add_argument(
+        "-tr",
+        "--trace",
+        type=str,
+        help="Trace the latency of every data window through the pipeline, and export the histograms as JSON to this path on exit"
+    )
+    command_line_parser.add_argument(
+        "-mh",
+        "--metrics-host",
+        type=str,
+        help="IP Address for the Metrics Endpoint (default is 127.0.0.1)",
+        default="127.0.0.1"
+    )
+    command_line_parser.add_argument(
+        "-mp",
+        "--metrics-port",
+        type=int,
+        help="Port for the Metrics Endpoint, which serves the counters and gauges of the server over HTTP (default is disabled)",
+        default=None
+    )
     command_line_parser.add_argument(
         "-g",
         "--graph",
@@ -114,34 +293,67 @@ def main():
     # set the log level
     logging.basicConfig(level=command_line_args.loglevel)
 
-    # acquire the axes that will be used for ENU orientation
-    east_axis_match = re.match(axis_regex, command_line_args.east_axis)
-    north_axis_match = re.match(axis_regex, command_line_args.north_axis)
-    up_axis_match = re.match(axis_regex, command_line_args.up_axis)
-    orientation = {
-        "east": {
-            "sign": east_axis_match.group(1),
-            "axis": east_axis_match.group(2).lower()
-        },
-        "north": {
-            "sign": north_axis_match.group(1), 
-            "axis": north_axis_match.group(2).lower()
-        },
-        "up": {
-            "sign": up_axis_match.group(1), 
-            "axis": up_axis_match.group(2).lower()
-        }
-    }
+    # sensor profiles from the config are added to the built-in sensor profiles
+    if command_line_args.sensor_config:
+        accelerometers.load_sensor_profiles(command_line_args.sensor_config)
+    if command_line_args.sensor_type not in accelerometers.accel_sensors:
+        command_line_parser.error("unknown sensor type: %s" % command_line_args.sensor_type)
+
+    if command_line_args.adaptive_periods is not None and (
+        command_line_args.adaptive_periods <= 0 
+        or command_line_args.min_time_window > command_line_args.max_time_window
+    ):
+        command_line_parser.error("the adaptive periods must be positive, within a minimum time window no more than the maximum")
+
+    # acquire the axes that will be used for ENU orientation of each controller
+    # a single orientation of an axis applies to every controller
+    devices = command_line_args.device
+    orientations = []
+    for (i, _) in enumerate(devices):
+        axes = []
+        for axis in ("east", "north", "up"):
+            axis_list = getattr(command_line_args, axis + "_axis")
+            if len(axis_list) not in (1, len(devices)):
+                command_line_parser.error("the %s axis needs 1 or %d orientations" % (axis, len(devices)))
+            axes.append(axis_list[i] if len(axis_list) > 1 else axis_list[0])
+        orientations.append(parse_orientation(*axes))
 
     # initialise the external resources for this server
     process_pool = None
-    controller = None
+    analysis_shared_windows = None
+    controllers = []
+    captures = []
     server = None
-    # queue size of 1
-    analysis_server_broadcaster = broadcaster.Broadcaster(1)
+    analysis_server_broadcaster = broadcaster.Broadcaster(
+        command_line_args.client_queue, 
+        command_line_args.client_policy
+    )
+
+    # the child-processes send their spans back with the processed windows
+    if command_line_args.trace:
+        tracing.enable(command_line_args.trace)
+
+    # the metrics are rendered from the thread of the metrics endpoint, it never blocks the analysis loop
+    if command_line_args.metrics_port is not None:
+        metrics.register("orbit_clients", lambda: len(analysis_server_broadcaster.channels))
+        for (name, statistic) in (
+            ("orbit_client_delivered_total", "delivered"), 
+            ("orbit_client_dropped_total", "dropped"), 
+            ("orbit_client_lag", "lag")
+        ):
+            metrics.register(
+                name, 
+                lambda statistic=statistic: {
+                    channel_stats["name"]: channel_stats[statistic] 
+                    for channel_stats in analysis_server_broadcaster.stats()
+                }
+            )
+        metrics.serve(command_line_args.metrics_host, command_line_args.metrics_port)
 
     # if we need to graph, we'll setup the graph
+    # matplotlib is only imported when graphing
     if command_line_args.graph:
+        import graphing
         graph = graphing.setup(
             -(accelerometers.accel_sensors[command_line_args.sensor_type]["accel_max"] / 2),
             accelerometers.accel_sensors[command_line_args.sensor_type]["accel_max"] / 2
@@ -150,41 +362,161 @@ def main():
         graph = None
 
     # prevent the process_window child-process from inheriting the common exit signals
-    exit_handler = lambda signum, frame: cleanup_and_exit(process_pool, controller, server, 0)
+    exit_handler = lambda signum, frame: cleanup_and_exit(
+        process_pool, 
+        analysis_shared_windows, 
+        controllers, 
+        captures, 
+        server, 
+        0
+    )
     unix_signal.signal(unix_signal.SIGINT, unix_signal.SIG_IGN)
     unix_signal.signal(unix_signal.SIGTERM, unix_signal.SIG_IGN)
     unix_signal.signal(unix_signal.SIGQUIT, unix_signal.SIG_IGN)
     unix_signal.signal(unix_signal.SIGHUP, unix_signal.SIG_IGN)
-    process_pool = multiprocessing.Pool(processes=1)
+    # data windows are handed to the process pool through shared memory slots
+    # a slot should fit a data window even if the controller samples faster than the time delta
+    # there are enough slots to keep every child-process busy while results are being consumed
+    # every controller shares the slots and the process pool, but has its own result sequencer
+    # adaptive data windows can grow up to the maximum time window
+    slot_time_window = command_line_args.time_window
+    if command_line_args.adaptive_periods is not None:
+        slot_time_window = command_line_args.max_time_window
+    analysis_shared_windows = shared_windows.SharedWindows(
+        4 * command_line_args.workers + 4 * len(devices), 
+        4 * (slot_time_window + command_line_args.time_interval) // command_line_args.time_delta
+    )
+    analysis_result_sequencers = [
+        sequencer.ResultSequencer(command_line_args.workers, len(devices)) for _ in devices
+    ]
+    # every data window has a deadline of a number of rolling intervals from its submission
+    # late windows are skipped, and hung child-processes are killed and respawned, so the results 
+    # keep up with the data windows even when a data window stalls its child-process
+    process_pool = supervisor.SupervisedPool(
+        processes=command_line_args.workers, 
+        deadline_s=command_line_args.deadline_intervals * command_line_args.time_interval / 1000, 
+        initializer=window_processing.setup_process, 
+        initargs=(
+            analysis_shared_windows, 
+            analysis_result_sequencers, 
+            command_line_args.direction_half_life / 1000 if command_line_args.direction_half_life else None, 
+            bool(command_line_args.trace), 
+            command_line_args.lag_radius
+        )
+    )
     unix_signal.signal(unix_signal.SIGINT, exit_handler)
     unix_signal.signal(unix_signal.SIGTERM, exit_handler)
     unix_signal.signal(unix_signal.SIGQUIT, exit_handler)
     unix_signal.signal(unix_signal.SIGHUP, exit_handler)
 
+    logging.info("Orbit Server started with a maximum RSS of %d KiB", window_processing.max_rss_kib())
+
     try: 
 
         logging.info("Establishing TCP server at %s:%d", command_line_args.host, command_line_args.port)
-        server = server_loop.start(command_line_args.host, command_line_args.port, analysis_server_broadcaster)
-
-        logging.info("Establishing connection to controller: %s", command_line_args.device)
-        controller = analysis_loop.connect(command_line_args.device, command_line_args.baud)
-
-        # starts the main loop (pass in the process_pool)
-        analysis_loop.run(
-            controller=controller, 
-            time_window_ms=command_line_args.time_window, 
-            time_interval_ms=command_line_args.time_interval, 
-            time_delta_ms=command_line_args.time_delta, 
-            sensor_type=command_line_args.sensor_type, 
-            orientation=orientation, 
-            process_pool=process_pool, 
-            broadcaster=analysis_server_broadcaster, 
-            graph=graph
+        server = server_loops[command_line_args.server_mode].start(
+            command_line_args.host, 
+            command_line_args.port, 
+            analysis_server_broadcaster
         )
 
+        protocols = []
+        for (controller_id, device) in enumerate(devices):
+
+            if command_line_args.replay:
+                logging.info("Replaying capture: %s", device)
+                (controller, protocol) = analysis_loop.prepare_controller(
+                    recording.ReplayController(device, command_line_args.replay_speed), 
+                    command_line_args.binary_protocol
+                )
+            else:
+                logging.info("Establishing connection to controller: %s", device)
+                (controller, protocol) = analysis_loop.connect(
+                    device, 
+                    command_line_args.baud, 
+                    command_line_args.binary_protocol
+                )
+            controllers.append(controller)
+            protocols.append(protocol)
+
+            if command_line_args.capture:
+                capture_path = command_line_args.capture
+                if len(devices) > 1:
+                    capture_path = "%s-%d" % (capture_path, controller_id)
+                logging.info("Recording capture: %s", capture_path)
+                captures.append(recording.CaptureWriter(
+                    capture_path, 
+                    device=device, 
+                    protocol=protocol, 
+                    sensor_type=command_line_args.sensor_type, 
+                    orientation=orientations[controller_id], 
+                    time_window_ms=command_line_args.time_window, 
+                    time_interval_ms=command_line_args.time_interval, 
+                    time_delta_ms=command_line_args.time_delta
+                ))
+
+        # every controller runs its analysis loop in its own thread
+        # the main thread waits for them to finish, which only happens when a controller fails
+        # or a replay ends, a failed controller shuts down the whole server
+        finished_controllers = queue.Queue()
+
+        # each controller adapts its own time window, starting from the fixed time window
+        adaptive_windows = [None for _ in devices]
+        if command_line_args.adaptive_periods is not None:
+            adaptive_windows = [
+                adaptive_window.AdaptiveWindow(
+                    command_line_args.time_window, 
+                    command_line_args.adaptive_periods, 
+                    command_line_args.min_time_window, 
+                    command_line_args.max_time_window
+                ) for _ in devices
+            ]
+
+        def run_controller(controller_id):
+
+            try:
+                analysis_loop.run(
+                    controller=controllers[controller_id], 
+                    protocol=protocols[controller_id], 
+                    time_window_ms=command_line_args.time_window, 
+                    time_interval_ms=command_line_args.time_interval, 
+                    time_delta_ms=command_line_args.time_delta, 
+                    sensor_type=command_line_args.sensor_type, 
+                    orientation=orientations[controller_id], 
+                    process_pool=process_pool, 
+                    shared_windows=analysis_shared_windows, 
+                    result_sequencer=analysis_result_sequencers[controller_id], 
+                    broadcaster=analysis_server_broadcaster, 
+                    graph=graph if controller_id == 0 else None, 
+                    capture=captures[controller_id] if captures else None, 
+                    controller_id=controller_id, 
+                    adaptive_window=adaptive_windows[controller_id]
+                )
+            except EOFError:
+                # the replay has ended
+                logging.info("Finished replaying capture: %s", devices[controller_id])
+                finished_controllers.put((controller_id, None))
+            except Exception as e:
+                logging.exception("Controller %d failed: %s", controller_id, devices[controller_id])
+                finished_controllers.put((controller_id, e))
+
+        for (controller_id, _) in enumerate(devices):
+            controller_thread = threading.Thread(target=run_controller, args=(controller_id,))
+            controller_thread.daemon = True
+            controller_thread.start()
+
+        for _ in devices:
+            (controller_id, error) = finished_controllers.get()
+            if error is not None:
+                raise error
+
+        # every replay has ended, let the queued data windows finish
+        process_pool.close()
+        process_pool.join()
+
     finally: 
 
-        cleanup_and_exit(process_pool, controller, server, 0)
+        cleanup_and_exit(process_pool, analysis_shared_windows, controllers, captures, server, 0)
 
 if __name__ == "__main__": 
 
@@ -0,0 +1,208 @@
+import controller_protocol
+import numpy as np
+import json
+import os
+import time
+
+# a capture is a directory with a JSON header, and a raw little endian file for each column of the samples
+# the column files can be memory mapped, the number of samples is derived from the size of the files
+capture_version = 1
+capture_header = "header.json"
+capture_columns = (
+    ("t", "<u4"),
+    ("x", "<u2"),
+    ("y", "<u2"),
+    ("z", "<u2")
+)
+
+def column_path(path, name):
+
+    return os.path.join(path, name + ".bin")
+
+class CaptureWriter:
+    """Records the decoded controller samples into a capture directory.
+
+    Every batch of samples is appended to the column files as it is read, and flushed, so a
+    capture that is interrupted is still readable up to the last complete sample. The keyword
+    arguments are kept in the header, such as the analysis parameters the capture was made with.
+    """
+
+    def __init__(self, path, **metadata):
+
+        os.makedirs(path, exist_ok=True)
+        if os.path.exists(os.path.join(path, capture_header)):
+            raise FileExistsError("There is already a capture at: %s" % path)
+
+        header = {
+            "version": capture_version,
+            "columns": [{"name": name, "dtype": dtype} for (name, dtype) in capture_columns],
+            "created": time.time()
+        }
+        header.update(metadata)
+        with open(os.path.join(path, capture_header), "w") as header_file:
+            json.dump(header, header_file, indent=4)
+
+        self.path = path
+        self.files = {name: open(column_path(path, name), "wb") for (name, _) in capture_columns}
+        self.samples = 0
+
+    def write(self, samples):
+        """Appends an array of (t, x, y, z) rows."""
+
+        for (column, (name, dtype)) in enumerate(capture_columns):
+            self.files[name].write(samples[:, column].astype(dtype).tobytes())
+        for column_file in self.files.values():
+            column_file.flush()
+
+        self.samples += len(samples)
+
+    def close(self):
+
+        for column_file in self.files.values():
+            column_file.close()
+
+def read_capture(path):
+    """Opens a capture, returns its header and its columns as read-only memory maps, keyed by name."""
+
+    with open(os.path.join(path, capture_header)) as header_file:
+        header = json.load(header_file)
+
+    if header["version"] != capture_version:
+        raise ValueError("Unsupported capture version %r at: %s" % (header["version"], path))
+
+    # the columns are truncated to the last complete sample
+    dtypes = [(column["name"], np.dtype(column["dtype"])) for column in header["columns"]]
+    length = min(os.path.getsize(column_path(path, name)) // dtype.itemsize for (name, dtype) in dtypes)
+
+    columns = {}
+    for (name, dtype) in dtypes:
+        if length == 0:
+            columns[name] = np.zeros(0, dtype=dtype)
+        else:
+            columns[name] = np.memmap(column_path(path, name), dtype=dtype, mode="r", shape=(length,))
+
+    return (header, columns)
+
+def capture_samples(columns, start=0, end=None):
+    """Returns the captured samples as an array of (t, x, y, z) rows, like the frame readers do."""
+
+    return np.column_stack(
+        [columns[name][start:end] for (name, _) in capture_columns]
+    ).astype(np.float64)
+
+class ReplayController:
+    """Replays a capture with the interface of the `serial.Serial` controller.
+
+    Like the orbit controller, it sends ready messages until it is started, acknowledges the
+    binary protocol query, and streams the frames of the ASCII or the binary protocol after
+    the start commands. The frames are released at the pace of the captured sample times
+    multiplied by the speed. A speed of 0 releases them as fast as they are read.
+
+    Reading past the end of the capture raises an EOFError.
+    """
+
+    ready_message = b"1"
+
+    def __init__(self, path, speed=1.0, chunk_size=256):
+
+        (self.header, self.columns) = read_capture(path)
+        self.times = self.columns["t"]
+        self.length = len(self.times)
+        self.speed = speed
+        self.chunk_size = chunk_size
+        self.timeout = None
+        self.write_timeout = None
+        self.is_open = True
+        self.output = bytearray()
+        self.encoder = None
+        self.position = 0
+        self.start_time = None
+        self.start_sample_time = None
+
+    @property
+    def in_waiting(self):
+
+        self.release()
+        return len(self.output)
+
+    def release(self):
+        """Encodes the samples that are due into the output buffer."""
+
+        if self.encoder is None:
+            # until it is started, there is always a ready message waiting
+            if len(self.output) == 0:
+                self.output += self.ready_message
+            return
+
+        if self.speed:
+            elapsed_ms = (time.time() - self.start_time) * 1000 * self.speed
+            due = int(np.searchsorted(self.times, self.start_sample_time + elapsed_ms, side="right"))
+        else:
+            due = min(self.length, self.position + self.chunk_size)
+
+        if due > self.position:
+            self.output += self.encoder(capture_samples(self.columns, self.position, due))
+            self.position = due
+
+    def read(self, size=1):
+
+        deadline = None if self.timeout is None else time.time() + self.timeout
+
+        while True:
+
+            self.release()
+
+            if len(self.output) >= size:
+                break
+
+            if self.encoder is not None and self.position >= self.length:
+                if len(self.output) == 0:
+                    raise EOFError("End of the replayed capture")
+                break
+
+            now = time.time()
+            if deadline is not None and now >= deadline:
+                break
+
+            # sleep until the next sample is due
+            if self.encoder is not None and self.speed:
+                wait = self.start_time + (self.times[self.position] - self.start_sample_time) / 1000 / self.speed - now
+            else:
+                wait = 0.01
+            if deadline is not None:
+                wait = min(wait, deadline - now)
+            time.sleep(max(0, wait))
+
+        data = bytes(self.output[:size])
+        del self.output[:size]
+        return data
+
+    def write(self, data):
+
+        for command in data.decode("ascii", "replace"):
+
+            if command == "0":
+                self.encoder = None
+            elif command in ("1", "2"):
+                self.encoder = controller_protocol.frame_encoders["ascii" if command == "1" else "binary"]
+                self.output.clear()
+                # the replay continues from where it stopped
+                self.start_time = time.time()
+                if self.position < self.length:
+                    self.start_sample_time = self.times[self.position]
+            elif command == "3":
+                self.output += controller_protocol.binary_protocol_acknowledgement
+
+        return len(data)
+
+    def reset_input_buffer(self):
+
+        self.output.clear()
+
+    def reset_output_buffer(self):
+
+        pass
+
+    def close(self):
+
+        self.is_open = False
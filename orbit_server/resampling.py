@@ -0,0 +1,55 @@
+import numpy as np
+
+class StreamingResampler:
+    """Resamples the irregularly timed samples of the controller onto a regular time grid.
+
+    The controller is a soft realtime system, so the time delta between its samples jitters.
+    The regular time grid is every multiple of the time delta, so overlapping data windows
+    share exactly the same regular times. Each grid time is linearly interpolated between the
+    samples before and after it, as soon as the sample after it has arrived.
+
+    The last sample is kept between batches, so the resampled samples don't depend on how the
+    samples were batched, and each grid time is only interpolated once, instead of once for
+    every data window that it is part of.
+    """
+
+    def __init__(self, time_delta_ms):
+
+        self.time_delta_ms = time_delta_ms
+        self.last_sample = None
+
+        # the index of the next grid time to be resampled
+        self.grid_index = None
+
+    def resample(self, samples):
+        """Resamples an array of (t, x, y, z) rows.
+
+        Returns the (t, x, y, z) rows of the grid times up to the last sample, that were not
+        already returned for a previous batch.
+        """
+
+        if len(samples) == 0:
+            return np.empty((0, 4))
+
+        if self.last_sample is None:
+            self.grid_index = int(np.ceil(samples[0, 0] / self.time_delta_ms))
+        else:
+            samples = np.vstack((self.last_sample, samples))
+
+        end_grid_index = int(np.floor(samples[-1, 0] / self.time_delta_ms)) + 1
+        grid_times = np.arange(self.grid_index, end_grid_index) * self.time_delta_ms
+
+        resampled = np.empty((len(grid_times), 4))
+        resampled[:, 0] = grid_times
+        for channel in range(1, 4):
+            resampled[:, channel] = np.interp(grid_times, samples[:, 0], samples[:, channel])
+
+        self.grid_index = max(self.grid_index, end_grid_index)
+        self.last_sample = samples[-1].copy()
+
+        return resampled
+
+def resample(samples, time_delta_ms):
+    """Resamples all the samples at once, the same as streaming them through a `StreamingResampler`."""
+
+    return StreamingResampler(time_delta_ms).resample(samples)
@@ -0,0 +1,158 @@
+import numpy as np
+
+class RollingWindow:
+    """Circular buffer holding the t, east, north, up channels of the rolling data window.
+
+    The buffer is mirrored, every sample is written at index i and at index i + capacity.
+    This means any run of up to capacity samples is contiguous in memory, so the window
+    can always be handed out as zero-copy views into the buffer.
+
+    Samples are first pushed into a pending rolling interval. Rolling the window commits
+    the pending interval into the window, and cuts off old samples by time. Because the
+    timestamps are sorted, the cutoff is a binary search rather than a linear scan.
+
+    The capacity is fixed, but if the window and the pending interval ever outgrow it,
+    the buffer is reallocated at double the capacity. Views that were already handed out
+    keep referencing the old buffer, so they stay valid.
+
+    A handed out view is only valid until capacity samples have been pushed after its
+    window start, so it should be consumed or copied before the window rolls much further.
+
+    The sums of every channel over the window are kept as running sums, so the means of the
+    window are O(1). Pushed samples are added to the pending sums, and rolling subtracts the 
+    samples that were cut off, so rolling costs O(interval) rather than O(window). The sums 
+    are recomputed every `resync_interval` rolls, so floating point errors can't accumulate.
+    """
+
+    channels = ("t", "east", "north", "up")
+
+    def __init__(self, capacity, resync_interval=1000):
+
+        self.capacity = capacity
+        self.buffer = np.zeros((len(self.channels), 2 * capacity))
+
+        # these are logical indices, they only grow, the physical index is modulo capacity
+        # [start, end) is the committed window, [end, pending_end) is the pending interval
+        self.start = 0
+        self.end = 0
+        self.pending_end = 0
+
+        self.sums = np.zeros(len(self.channels))
+        self.pending_sums = np.zeros(len(self.channels))
+        self.resync_interval = resync_interval
+        self.rolls = 0
+
+    def __len__(self):
+
+        return self.end - self.start
+
+    def push(self, t, east, north, up):
+        """Pushes a sample into the pending rolling interval."""
+
+        if self.pending_end - self.start >= self.capacity:
+            self._grow()
+
+        i = self.pending_end % self.capacity
+        self.buffer[:, i] = (t, east, north, up)
+        self.buffer[:, i + self.capacity] = (t, east, north, up)
+        self.pending_sums += (t, east, north, up)
+        self.pending_end += 1
+
+    def extend(self, samples):
+        """Pushes an array of (t, east, north, up) rows into the pending rolling interval."""
+
+        while self.pending_end - self.start + len(samples) > self.capacity:
+            self._grow()
+
+        indices = (self.pending_end + np.arange(len(samples))) % self.capacity
+        self.buffer[:, indices] = samples.T
+        self.buffer[:, indices + self.capacity] = samples.T
+        self.pending_sums += samples.sum(axis=0)
+        self.pending_end += len(samples)
+
+    def roll(self, rolling_time, shift_or_increment=True):
+        """Rolls the data window by committing the pending rolling interval.
+
+        Because our rolling increment is based on time, this means the resulting window
+        size can change. If the existing window is empty, then the pending interval becomes
+        the window.
+        """
+
+        # rolling the window can involve a same-size shift (truncate and append), or just an increment
+        # rolling windows generally need a same-size shift, however to reach the full size we need to
+        # first act like recursive windows!
+        if self.end > self.start and shift_or_increment:
+
+            times = self.view("t")
+            cutoff_time = times[0] + rolling_time
+
+            # find the first time sample that is greater to the cutoff time
+            # the index of that becomes the length that we perform a cutoff
+            # if there is no such sample, then nothing is cut off
+            cutoff_index = np.searchsorted(times, cutoff_time, side="right")
+            if cutoff_index < len(times):
+                i = self.start % self.capacity
+                self.sums -= self.buffer[:, i:i + cutoff_index].sum(axis=1)
+                self.start += int(cutoff_index)
+
+        self.end = self.pending_end
+        self.sums += self.pending_sums
+        self.pending_sums[:] = 0
+
+        self.rolls += 1
+        if self.rolls % self.resync_interval == 0:
+            i = self.start % self.capacity
+            self.sums = self.buffer[:, i:i + len(self)].sum(axis=1)
+
+    def trim(self, window_time):
+        """Cuts off the samples of the window older than the window time before its last sample.
+
+        This sizes the window by time after rolling it without a shift, so the window can
+        shrink, or grow by not cutting off anything until it reaches the window time.
+        """
+
+        if self.end == self.start:
+            return
+
+        times = self.view("t")
+        cutoff_index = np.searchsorted(times, times[-1] - window_time, side="left")
+        if cutoff_index > 0:
+            i = self.start % self.capacity
+            self.sums -= self.buffer[:, i:i + cutoff_index].sum(axis=1)
+            self.start += int(cutoff_index)
+
+    def view(self, channel, pending=False):
+        """Zero-copy view of a channel of the window, or of the pending interval."""
+
+        (start, end) = (self.end, self.pending_end) if pending else (self.start, self.end)
+        i = start % self.capacity
+        return self.buffer[self.channels.index(channel), i:i + (end - start)]
+
+    def window(self):
+        """Zero-copy views of all the channels of the window, keyed by channel name."""
+
+        return {channel: self.view(channel) for channel in self.channels}
+
+    def means(self):
+        """Means of the acceleration channels of the window, keyed by channel name."""
+
+        return {
+            channel: float(self.sums[c] / len(self))
+            for (c, channel) in enumerate(self.channels) if channel != "t"
+        }
+
+    def _grow(self):
+
+        length = self.pending_end - self.start
+        i = self.start % self.capacity
+        samples = self.buffer[:, i:i + length]
+
+        self.capacity = self.capacity * 2
+        buffer = np.zeros((len(self.channels), 2 * self.capacity))
+        buffer[:, :length] = samples
+        buffer[:, self.capacity:self.capacity + length] = samples
+        self.buffer = buffer
+
+        self.end = self.end - self.start
+        self.pending_end = length
+        self.start = 0
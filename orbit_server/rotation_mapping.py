@@ -87,6 +87,8 @@ If the data window is not periodic, but a rolling data window, we should instead
 perform a weighted majority vote, weighing on the more recent samples.
 '''
 
+import numpy as np
+
 # This is mapping from the sign of the acceleration vector deltas to rotational 
 # tangent direction.
 # 
@@ -216,4 +218,25 @@ accel_vector_direction_and_position_mapping = {
     ('E' , 'B' ):  1,
     ('W' , 'T' ):  1,
     ('W' , 'B' ): -1
-}
\ No newline at end of file
+}
+
+def compile_direction_lookup():
+    """Compiles the three mappings above into a single lookup array.
+
+    The array is indexed by the signs of (East Axis Delta, Up Axis Delta, East Axis, Up Axis), 
+    each shifted by 1, so that -1, 0 and 1 become the indices 0, 1 and 2. This allows the 
+    rotational directions of every time interval to be looked up in one vectorised indexing.
+    """
+
+    lookup = np.zeros((3, 3, 3, 3), dtype=np.int8)
+    for (delta_signs, direction) in accel_vector_delta_direction_mapping.items():
+        for (signs, position) in accel_vector_position_mapping.items():
+            lookup[
+                delta_signs[0] + 1, 
+                delta_signs[1] + 1, 
+                signs[0] + 1, 
+                signs[1] + 1
+            ] = accel_vector_direction_and_position_mapping.get((direction, position), 0)
+    return lookup
+
+accel_vector_direction_lookup = compile_direction_lookup()
@@ -0,0 +1,58 @@
+import multiprocessing
+import threading
+
+class ResultSequencer:
+    """Sequences the window processing results, so that rotations are only broadcasted in order.
+
+    With multiple child-processes, data windows can finish out of order. The newest result
+    always wins, any result that is older than the last accepted result is dropped.
+
+    The child-processes also consult the sequencer before processing a data window, so they
+    can skip windows that have been superseded while they were queued. A window is superseded
+    if a newer result was already accepted, or if there are enough newer windows submitted to
+    keep every child-process busy. The latest trace ids are kept in shared memory for this.
+
+    Each controller has its own sequencer. The trace ids of a controller are spaced by the
+    stride, which is the number of controllers, so trace ids are unique across controllers.
+    """
+
+    def __init__(self, workers, stride=1):
+
+        self.workers = workers
+        self.stride = stride
+        self.latest_submitted = multiprocessing.RawValue('q', -1)
+        self.latest_accepted = multiprocessing.RawValue('q', -1)
+        self.lock = threading.Lock()
+
+    def __getstate__(self):
+
+        state = self.__dict__.copy()
+        del state["lock"]
+        return state
+
+    def __setstate__(self, state):
+
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+    def submit(self, trace_id):
+        """Records a data window that is about to be submitted to the process pool."""
+
+        self.latest_submitted.value = trace_id
+
+    def superseded(self, trace_id):
+        """Checks if a queued data window is no longer worth processing."""
+
+        return (
+            trace_id <= self.latest_accepted.value
+            or trace_id + self.workers * self.stride <= self.latest_submitted.value
+        )
+
+    def accept(self, trace_id):
+        """Accepts a result if it is newer than every accepted result."""
+
+        with self.lock:
+            if trace_id <= self.latest_accepted.value:
+                return False
+            self.latest_accepted.value = trace_id
+            return True
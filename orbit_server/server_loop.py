@@ -5,6 +5,54 @@ import threading
 import time
 import re
 import logging
+from broadcaster import ChannelClosed
+import tracing
+import metrics
+
+# this regular expression will always succeed and match something or nothing
+# a problem with this is it can receive a DOS if a client sends a large message of garbage
+client_message_protocol = re.compile(
+    """
+        ^
+        (?:[^S]*) # drop everything before the frame start, this gives us the drop range
+        (?:S(     # frame start
+            .*?
+        )E)?      # frame end
+    """, 
+    re.X
+)
+
+# clients have to respond with an "OK" message within this many seconds
+ping_timeout = 10
+
+# while waiting for rotations, the threaded handler checks the client for input this often
+receive_interval = 0.1
+
+# clients receive the rotations of the first controller in the untagged "S<rps>:<direction>E" format
+# until they subscribe with "SSUB:<controller>E" or "SSUB:*E", after which they receive the rotations 
+# of the subscribed controllers in the tagged "S<controller>:<rps>:<direction>E" format
+default_controllers = (0,)
+subscription_regex = re.compile(r'^SUB:(\*|\d+)$')
+
+def parse_subscription(token):
+    """Parses a subscription token, returns the subscribed controllers, None being every controller.
+
+    Raises a ValueError if the token is not a subscription.
+    """
+
+    subscription_match = subscription_regex.match(token)
+    if not subscription_match:
+        raise ValueError("Not a subscription: %r" % token)
+    if subscription_match.group(1) == "*":
+        return None
+    return (int(subscription_match.group(1)),)
+
+def format_rotation(rotation, tagged):
+
+    (controller, rps, rotation_direction, trace_id) = rotation
+    if tagged:
+        return bytes("S{0}:{1}:{2}E".format(controller, rps, rotation_direction), 'ascii')
+    return bytes("S{0}:{1}E".format(rps, rotation_direction), 'ascii')
 
 class RotationTCPServer(socketserver.ThreadingMixIn, socketserver.TCPServer):
     """TCP server will be in its own thread, and handle TCP connection requests."""
@@ -39,36 +87,32 @@ class RotationTCPHandler(socketserver.BaseRequestHandler):
     This is an application-level keepalive protocol because TCP keep alive does not work reliably 
     across all operating systems.
 
+    Clients can also subscribe to a controller, or to every controller, see `parse_subscription`.
+
     The handler will not respond back to the client, it will only send rotation data.
     """
 
     def __init__(self, request, client_address, server):
 
         self.broadcaster = server.broadcaster
-        self.channel = self.broadcaster.add_channel()
+        self.channel = None
+        self.tagged = False
         
-        # this regular expression will always succeed and match something or nothing
-        # a problem with this is it can receive a DOS if a client sends a large message of garbage
-        self.message_protocol = re.compile(
-            """
-                ^
-                (?:[^S]*) # drop everything before the frame start, this gives us the drop range
-                (?:S(     # frame start
-                    .*?
-                )E)?      # frame end
-            """, 
-            re.X
-        )
+        self.message_protocol = client_message_protocol
 
         super().__init__(request, client_address, server)
 
-    def __del__(self):
+    def setup(self):
 
+        self.channel = self.broadcaster.add_channel(
+            name="%s:%d" % self.client_address[:2], 
+            keys=default_controllers
+        )
+
+    def finish(self):
+
+        # unsubscribe explicitly, instead of relying on the handler being garbage collected
         self.broadcaster.remove_channel(self.channel)
-        
-        s = super()
-        if hasattr(s, "__del__"): 
-            s.__del__(self)
 
     def handle(self):
         
@@ -84,7 +128,6 @@ class RotationTCPHandler(socketserver.BaseRequestHandler):
         # this allows us to end the connection handler in case the client quits without closing the connection
         # that way we don't have a resource leak
         ping_time = time.time()
-        ping_timeout = 10
 
         client_input_buffer = bytearray()
 
@@ -104,6 +147,7 @@ class RotationTCPHandler(socketserver.BaseRequestHandler):
                     # otherwise continue to the next step
                     if time.time() >= ping_time + ping_timeout:
                         logging.info("Client timed out: %s", self.request.getpeername())
+                        metrics.increment("orbit_client_keepalive_timeouts_total")
                         break 
                     else:
                         client_data = None
@@ -113,21 +157,24 @@ class RotationTCPHandler(socketserver.BaseRequestHandler):
                     logging.exception("Error in reading from connection: %s", self.request.getpeername())
                     break 
 
-            # poll the channel
+            # wait on the channel, this also paces the polling of the client
             try:
-                server_data = self.channel.pop()
-            except IndexError:
-                server_data = None
+                server_data = self.channel.get(timeout=receive_interval)
+            except ChannelClosed:
+                logging.info("Channel closed for connection: %s", self.request.getpeername())
+                break
 
             # handle the server_data
             if server_data is not None:
 
-                (rps, rotation_direction, trace_id) = server_data
+                trace_id = server_data[-1]
                 try:
-                    self.request.sendall(bytes("S{0}:{1}E".format(rps, rotation_direction), 'ascii'))
+                    self.request.sendall(format_rotation(server_data, self.tagged))
+                    tracing.mark(trace_id, "client_write")
                     logging.info("%d - Wrote RPS and RPS Direction to connection %s", trace_id, self.request.getpeername())
                 except socket.error as e:
                     logging.exception("%d - Error writing to connection: %s", trace_id, self.request.getpeername())
+                    metrics.increment("orbit_client_send_failures_total")
                     break
 
             # handle the client_data
@@ -150,6 +197,8 @@ class RotationTCPHandler(socketserver.BaseRequestHandler):
 
                     if token == "OK":
                         ping_time = time.time()
+                    elif token is not None and token.startswith("SUB:"):
+                        self.subscribe(token)
 
                     # drops the handled input and characters before the start frame
                     client_input_buffer = client_input_buffer[lexical_analysis.span()[1]:]
@@ -159,13 +208,27 @@ class RotationTCPHandler(socketserver.BaseRequestHandler):
                     logging.info("Client closed connection: %s", self.request.getpeername())
                     break
 
-            time.sleep(0)
-      
         # event loop for the connection was broken, so here we just clean up the connection and pinging action 
-        logging.info("Closing connection to: %s", self.request.getpeername()) 
+        logging.info(
+            "Closing connection to: %s %s", 
+            self.request.getpeername(), 
+            self.channel.stats()
+        ) 
 
         self.request.close()
 
+    def subscribe(self, token):
+
+        try:
+            controllers = parse_subscription(token)
+        except ValueError:
+            logging.warning("Invalid subscription from client: %s %r", self.request.getpeername(), token)
+            return
+
+        logging.info("Client subscribed to controllers: %s %s", self.request.getpeername(), controllers or "*")
+        self.channel.subscribe(controllers)
+        self.tagged = True
+
 def start(host, port, broadcaster):
     
     logging.info("Running Server Loop")
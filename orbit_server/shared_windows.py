@@ -0,0 +1,151 @@
+from multiprocessing import shared_memory
+import numpy as np
+import queue
+import logging
+
+class SharedWindows:
+    """Slab of shared memory slots used to hand data windows to the process pool and back.
+
+    Each slot holds a data window (the t, east, north, up channels) that the analysis loop writes,
+    and the result of processing it (the normalised time, east and up signals and the
+    fitted wave properties) that the window processing child-process writes. Both sides
+    read NumPy views of the slab, so only a small descriptor is passed through the pool.
+
+    A slot is acquired before writing a window, and it must be released once the result
+    has been consumed by the callback. If every slot is in use, no slot is acquired, which
+    means the pool is backlogged and the window should be skipped.
+
+    The slab is created by the main-process. When the pool child-processes are forked,
+    they inherit the mapping, otherwise they attach to the slab by name when unpickled.
+    """
+
+    window_channels = ("t", "east", "north", "up")
+    result_channels = ("time", "east", "up")
+    result_axes = ("east", "up")
+
+    def __init__(self, slots, slot_capacity, name=None):
+
+        self.slots = slots
+        self.slot_capacity = slot_capacity
+
+        # each slot is a row of: window channels, result channels, 2 x popt (3), 2 x pcov (3x3)
+        self.slot_size = (len(self.window_channels) + len(self.result_channels)) * slot_capacity + 2 * (3 + 9)
+        size = slots * self.slot_size * np.dtype(np.float64).itemsize
+
+        if name is None:
+            self.memory = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.memory = attach(name)
+            self.owner = False
+
+        self.slab = np.ndarray((slots, self.slot_size), dtype=np.float64, buffer=self.memory.buf)
+
+        # free slots are only tracked in the main-process
+        self.free_slots = queue.Queue()
+        for slot in range(slots):
+            self.free_slots.put(slot)
+
+    def __getstate__(self):
+
+        return (self.memory.name, self.slots, self.slot_capacity)
+
+    def __setstate__(self, state):
+
+        (name, slots, slot_capacity) = state
+        self.__init__(slots, slot_capacity, name)
+
+    @property
+    def name(self):
+
+        return self.memory.name
+
+    def acquire(self):
+        """Acquires a free slot, returns None if every slot is in use."""
+
+        try:
+            return self.free_slots.get_nowait()
+        except queue.Empty:
+            return None
+
+    def release(self, slot):
+
+        self.free_slots.put(slot)
+
+    def write_window(self, slot, data_window):
+        """Copies a data window into a slot, returns the number of samples written.
+
+        If the data window is larger than a slot, only the most recent samples are written.
+        """
+
+        length = len(data_window["t"])
+        if length > self.slot_capacity:
+            logging.warning(
+                "Data window of %d samples exceeds the shared slot capacity of %d samples, dropping the oldest samples",
+                length,
+                self.slot_capacity
+            )
+            length = self.slot_capacity
+
+        for channel in self.window_channels:
+            self.window_view(slot, channel, length)[:] = data_window[channel][-length:]
+
+        return length
+
+    def window_view(self, slot, channel, length):
+
+        offset = self.window_channels.index(channel) * self.slot_capacity
+        return self.slab[slot, offset:offset + length]
+
+    def window(self, slot, length):
+        """Zero-copy views of the data window in a slot, keyed by channel name."""
+
+        return {channel: self.window_view(slot, channel, length) for channel in self.window_channels}
+
+    def result_view(self, slot, channel, length):
+
+        offset = (len(self.window_channels) + self.result_channels.index(channel)) * self.slot_capacity
+        return self.slab[slot, offset:offset + length]
+
+    def wave_properties_view(self, slot, axis):
+
+        offset = (len(self.window_channels) + len(self.result_channels)) * self.slot_capacity
+        offset = offset + self.result_axes.index(axis) * (3 + 9)
+        return {
+            "popt": self.slab[slot, offset:offset + 3],
+            "pcov": self.slab[slot, offset + 3:offset + 3 + 9].reshape((3, 3))
+        }
+
+    def write_result(self, slot, norm_data_window, wave_properties):
+
+        length = len(norm_data_window["time"])
+        for channel in self.result_channels:
+            self.result_view(slot, channel, length)[:] = norm_data_window[channel]
+        for axis in self.result_axes:
+            wave_properties_view = self.wave_properties_view(slot, axis)
+            wave_properties_view["popt"][:] = wave_properties[axis]["popt"]
+            wave_properties_view["pcov"][:] = wave_properties[axis]["pcov"]
+
+    def result(self, slot, length):
+        """Zero-copy views of the normalised data window and wave properties in a slot."""
+
+        norm_data_window = {channel: self.result_view(slot, channel, length) for channel in self.result_channels}
+        wave_properties = {axis: self.wave_properties_view(slot, axis) for axis in self.result_axes}
+        return (norm_data_window, wave_properties)
+
+    def close(self):
+
+        # views into the shared memory have to be released before it can be closed
+        self.slab = None
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+
+def attach(name):
+
+    # only the creator of the shared memory should track it for cleanup
+    # the track parameter only exists from Python 3.13
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        return shared_memory.SharedMemory(name=name)
@@ -1,4 +1,76 @@
 import numpy as np
 
-def sine(freq, time, amp, phase, vertical_disp):    
-    return amp * np.sin(freq * 2 * np.pi * time + phase) + vertical_disp
\ No newline at end of file
+def sine(freq, time, amp, phase, vertical_disp):
+    return amp * np.sin(freq * 2 * np.pi * time + phase) + vertical_disp
+
+def fit_sine(freq, time, signal):
+    """Least squares fit of a sine wave with a fixed frequency to regularly spaced time values.
+
+    With a fixed frequency, the sine wave is linear in its coefficients:
+
+        amp * sin(w t + phase) + vertical_disp =
+            amp cos(phase) * sin(w t) + amp sin(phase) * cos(w t) + vertical_disp
+
+    So the fit is a linear least squares solve against a design matrix of sin(w t), cos(w t)
+    and 1. The design matrix is computed on time values relative to the first time value,
+    which keeps it well conditioned, and the phase is then shifted back to absolute time.
+
+    Returns the same (popt, pcov) as `scipy.optimize.curve_fit` would for the `sine` function
+    with a fixed frequency, that is the (amp, phase, vertical_disp) parameters and their
+    estimated covariance. The amplitude is always positive.
+    """
+
+    (popts, pcovs) = fit_sines([freq], time, [signal])
+    return (popts[0], pcovs[0])
+
+def fit_sines(freqs, time, signals):
+    """Batched `fit_sine` of the rows of a 2D array of signals, each with its own fixed frequency.
+
+    The time values are either shared by every signal, or a 2D array with a row for each signal
+    of the same length. The design matrices of every row are computed into one stacked array, and
+    their 3x3 normal equations are solved together, rather than one least squares solve per row.
+
+    Returns the (popts, pcovs) with the (amp, phase, vertical_disp) and the covariance in each row.
+    """
+
+    freqs = np.asarray(freqs, dtype=np.float64)
+    signals = np.asarray(signals, dtype=np.float64)
+    time = np.atleast_2d(time)
+
+    if not np.all(np.isfinite(freqs)):
+        raise ValueError("Cannot fit a sine wave with a non-finite frequency: %r" % freqs)
+
+    (count, n) = signals.shape
+    angular_freqs = 2 * np.pi * freqs
+
+    # the design matrices are stacked as (count, 3, n), the angles are computed in the row of ones
+    designs = np.empty((count, 3, n))
+    angles = np.multiply(angular_freqs[:, np.newaxis], time - time[:, :1], out=designs[:, 2])
+    np.sin(angles, out=designs[:, 0])
+    np.cos(angles, out=designs[:, 1])
+    designs[:, 2] = 1
+
+    inverse_normals = np.linalg.inv(designs @ designs.transpose(0, 2, 1))
+    projections = designs @ signals[:, :, np.newaxis]
+    coefficients = inverse_normals @ projections
+    (sin_coefficients, cos_coefficients, vertical_disps) = coefficients[:, :, 0].T
+
+    amps = np.hypot(sin_coefficients, cos_coefficients)
+    relative_phases = np.arctan2(cos_coefficients, sin_coefficients)
+    phases = np.angle(np.exp(1j * (relative_phases - angular_freqs * time[:, 0])))
+
+    # the residual sum of squares of a least squares solve is |y|^2 - c . A^T y
+    # the covariance of the linear coefficients is the residual variance times the inverse
+    # normal matrix, it is propagated to (amp, phase, vertical_disp) through their jacobian
+    residual_sums = np.einsum("ki,ki->k", signals, signals) - np.einsum("kij,kij->k", coefficients, projections)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        jacobians = np.zeros((count, 3, 3))
+        jacobians[:, 0, :2] = np.column_stack((sin_coefficients, cos_coefficients)) / amps[:, np.newaxis]
+        jacobians[:, 1, :2] = np.column_stack((-cos_coefficients, sin_coefficients)) / (amps ** 2)[:, np.newaxis]
+        jacobians[:, 2, 2] = 1
+        residual_variances = residual_sums / (n - 3)
+        pcovs = residual_variances[:, np.newaxis, np.newaxis] * (jacobians @ inverse_normals @ jacobians.transpose(0, 2, 1))
+
+    popts = np.column_stack((amps, phases, vertical_disps))
+
+    return (popts, pcovs)
@@ -0,0 +1,307 @@
+import multiprocessing
+import multiprocessing.connection
+import signal as unix_signal
+import threading
+import collections
+import logging
+import time
+import metrics
+
+class DeadlineExceeded(Exception):
+    """A task was not finished before its deadline, it was skipped or its worker was killed."""
+    pass
+
+class WorkerDied(Exception):
+    """The worker running a task exited without returning a result."""
+    pass
+
+def worker(connection, initializer, initargs, start_time, log_level):
+    """Runs the tasks sent over the connection until the connection is closed or a None task is sent."""
+
+    # forked workers inherit the logging configuration, but respawned workers start without one
+    logging.basicConfig(level=log_level)
+
+    # the signals are handled by the main process, a worker is only ever stopped by its supervisor
+    for signal_number in (unix_signal.SIGINT, unix_signal.SIGQUIT, unix_signal.SIGHUP):
+        unix_signal.signal(signal_number, unix_signal.SIG_IGN)
+    unix_signal.signal(unix_signal.SIGTERM, unix_signal.SIG_DFL)
+
+    if initializer:
+        initializer(*initargs, start_time=start_time)
+
+    # the supervisor only dispatches tasks to a worker once it has finished starting up
+    connection.send(None)
+
+    while True:
+
+        try:
+            task = connection.recv()
+        except EOFError:
+            return
+
+        if task is None:
+            return
+
+        (function, args) = task
+        try:
+            result = (True, function(*args))
+        except Exception as e:
+            result = (False, e)
+
+        try:
+            connection.send(result)
+        except Exception as e:
+            # the exception or the result could not be pickled
+            connection.send((False, RuntimeError("Unsendable result: %r" % e)))
+
+class Worker:
+
+    def __init__(self, initializer, initargs, context=multiprocessing):
+
+        (self.connection, worker_connection) = context.Pipe()
+        self.process = context.Process(target=worker, args=(
+            worker_connection, 
+            initializer, 
+            initargs, 
+            time.monotonic(), 
+            logging.getLogger().level
+        ))
+        self.process.daemon = True
+        self.process.start()
+        worker_connection.close()
+        self.ready = False
+        self.task = None
+        self.task_start_time = None
+
+    def exit_code(self):
+
+        # the pipe closes as the worker exits, so it is joined briefly for its exit code to be set
+        self.process.join(0.1)
+        return self.process.exitcode
+
+    def kill(self):
+
+        self.process.kill()
+        self.process.join()
+        self.connection.close()
+
+class SupervisedPool:
+    """Process pool with a deadline for every task, which respawns hung and dead workers.
+
+    It has the same `apply_async`, `close`, `join` and `terminate` methods as `multiprocessing.Pool`,
+    but `apply_async` returns nothing. Each worker gets its own pipe, and a supervisor thread
+    dispatches the tasks in order to idle workers and calls the callbacks, like the result handler
+    thread of `multiprocessing.Pool`.
+
+    Workers only get tasks once they report that their initializer has finished, so a slow 
+    startup, such as a respawned worker importing its modules, doesn't count towards the deadline 
+    of its first task.
+
+    Every task has a deadline:
+
+        * tasks still queued a deadline after they were submitted are skipped without running
+        * workers still running a task a deadline after it was dispatched are killed and respawned
+        * workers that died while running a task are respawned
+
+    In all of these cases the error callback of the task is called, with `DeadlineExceeded` or
+    `WorkerDied`. So a pathological task can't stall the pool, and every task gets its callback or
+    its error callback within two deadlines. The running deadline starts from the dispatch, so a 
+    backlogged pool skips queued tasks to catch up, rather than killing workers that are not hung.
+
+    The initializer is called with the initargs and a `start_time` keyword, which is the monotonic 
+    time the worker was started, so every worker can measure its own startup.
+
+    The first workers are forked with the default start method, so they share the pages of the main 
+    process. By the time a worker is respawned, the main process is running its other threads, and 
+    a forked child could inherit locks that those threads hold. So the respawned workers are started 
+    by the forkserver, or spawned where there is no forkserver.
+    """
+
+    def __init__(self, processes, deadline_s, initializer=None, initargs=()):
+
+        self.deadline_s = deadline_s
+        self.initializer = initializer
+        self.initargs = initargs
+        self.workers = [Worker(initializer, initargs) for _ in range(processes)]
+        self.respawn_context = multiprocessing.get_context(
+            "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        )
+
+        # queued tasks of (submit time, function, args, callback, error callback)
+        self.tasks = collections.deque()
+        self.lock = threading.Lock()
+        self.closed = False
+
+        # submitting a task wakes up the supervisor thread waiting on the worker pipes
+        (self.wake_connection, self.wake_sender) = multiprocessing.Pipe(duplex=False)
+
+        self.supervisor_thread = threading.Thread(target=self.supervise)
+        self.supervisor_thread.daemon = True
+        self.supervisor_thread.start()
+
+    def apply_async(self, function, args=(), callback=None, error_callback=None):
+
+        with self.lock:
+            if self.closed:
+                raise ValueError("Pool not running")
+            self.tasks.append((time.monotonic(), function, args, callback, error_callback))
+            self.wake_sender.send_bytes(b"")
+
+    def close(self):
+        """Stops accepting tasks, the queued tasks are still finished."""
+
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                self.wake_sender.send_bytes(b"")
+
+    def join(self):
+
+        self.supervisor_thread.join()
+
+    def terminate(self):
+
+        self.close()
+        for worker in self.workers:
+            worker.kill()
+
+    def supervise(self):
+
+        while True:
+
+            self.expire()
+            self.dispatch()
+
+            busy_workers = [worker for worker in self.workers if worker.task is not None]
+            starting_workers = [worker for worker in self.workers if not worker.ready]
+
+            with self.lock:
+                if self.closed and not self.tasks and not busy_workers:
+                    break
+                oldest_submit_time = self.tasks[0][0] if self.tasks else None
+
+            # wait for a result, a started worker, a new task, or the earliest deadline of a running 
+            # or a queued task, tasks are still queued if every worker is busy or starting up
+            deadlines = [worker.task_start_time for worker in busy_workers]
+            if oldest_submit_time is not None:
+                deadlines.append(oldest_submit_time)
+            timeout = None
+            if deadlines:
+                timeout = max(0, min(deadlines) + self.deadline_s - time.monotonic())
+
+            ready = multiprocessing.connection.wait(
+                [self.wake_connection] + [worker.connection for worker in busy_workers + starting_workers],
+                timeout
+            )
+
+            if self.wake_connection in ready:
+                while self.wake_connection.poll():
+                    self.wake_connection.recv_bytes()
+
+            for worker in starting_workers:
+                if worker.connection in ready:
+                    self.start(worker)
+
+            for worker in busy_workers:
+                if worker.connection in ready:
+                    self.receive(worker)
+                elif time.monotonic() - worker.task_start_time > self.deadline_s:
+                    self.respawn(worker, DeadlineExceeded("Task exceeded the deadline of %.3fs" % self.deadline_s))
+                    metrics.increment("orbit_windows_late_total")
+
+        for worker in self.workers:
+            try:
+                worker.connection.send(None)
+            except OSError:
+                pass
+            worker.process.join()
+            worker.connection.close()
+
+    def expire(self):
+
+        # tasks that are already late are skipped, so the pool catches up with the submitted tasks
+        # the tasks are queued in submission order, so the late tasks are at the front
+        while True:
+
+            with self.lock:
+                if not self.tasks or time.monotonic() - self.tasks[0][0] <= self.deadline_s:
+                    return
+                task = self.tasks.popleft()
+
+            metrics.increment("orbit_windows_late_total")
+            self.call(task[4], DeadlineExceeded("Task was queued past the deadline of %.3fs" % self.deadline_s))
+
+    def dispatch(self):
+
+        for i in range(len(self.workers)):
+
+            # the worker is looked up again on every task, because it may have been respawned
+            while self.workers[i].ready and self.workers[i].task is None:
+
+                worker = self.workers[i]
+
+                with self.lock:
+                    if not self.tasks:
+                        return
+                    task = self.tasks.popleft()
+
+                (submit_time, function, args, callback, error_callback) = task
+
+                try:
+                    worker.connection.send((function, args))
+                except OSError:
+                    # the worker has died while idle, so the task is queued again for the respawned worker
+                    with self.lock:
+                        self.tasks.appendleft(task)
+                    self.respawn(worker)
+                    continue
+
+                worker.task = task
+                worker.task_start_time = time.monotonic()
+
+    def start(self, worker):
+
+        try:
+            worker.connection.recv()
+        except (EOFError, OSError):
+            self.respawn(worker, WorkerDied("Worker exited while starting with code %r" % worker.exit_code()))
+            return
+
+        worker.ready = True
+
+    def receive(self, worker):
+
+        (_, _, _, callback, error_callback) = worker.task
+
+        try:
+            (success, value) = worker.connection.recv()
+        except (EOFError, OSError):
+            self.respawn(worker, WorkerDied("Worker exited with code %r" % worker.exit_code()))
+            return
+
+        worker.task = None
+        if success:
+            self.call(callback, value)
+        else:
+            self.call(error_callback, value)
+
+    def respawn(self, worker, exception=None):
+
+        logging.warning("Respawning Window Processing Child-Process %d: %r", worker.process.pid, exception)
+        metrics.increment("orbit_workers_respawned_total")
+
+        task = worker.task
+        worker.kill()
+        self.workers[self.workers.index(worker)] = Worker(self.initializer, self.initargs, self.respawn_context)
+
+        if task is not None:
+            self.call(task[4], exception)
+
+    def call(self, callback, value):
+
+        # a failing callback must not stop the supervisor thread
+        if callback:
+            try:
+                callback(value)
+            except Exception:
+                logging.exception("Task callback failed")
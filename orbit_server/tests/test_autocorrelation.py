@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import autocorrelation as ac
+import window_processing
+
+sampling_rate = 50
+
+def orbit_signal(count, rps=1.3, seed=0):
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(count) / sampling_rate
+    return 4 * np.sin(2 * np.pi * rps * t) + rng.normal(0, 0.3, count)
+
+def sliding_windows(signal, length, interval):
+
+    for start in range(0, len(signal) - length, interval):
+        yield (start, signal[start:start + length])
+
+@pytest.mark.parametrize("n", [7, 104, 200, 404])
+def test_batch_matches_direct_sum(n):
+
+    signal = orbit_signal(n)
+    expected = np.array([np.dot(signal[:n - k], signal[k:]) for k in range(n)])
+
+    np.testing.assert_allclose(ac.autocorrelation(signal), expected, atol=1e-9)
+    np.testing.assert_allclose(ac.AutocorrelationEngine().autocorrelation(signal), expected, atol=1e-9)
+
+def test_engine_stacked_rows_match_each_row():
+
+    signals = np.stack([orbit_signal(200, seed=1), orbit_signal(200, rps=0.7, seed=2)])
+    corrs = ac.AutocorrelationEngine().autocorrelation(signals)
+
+    for (signal, corr) in zip(signals, corrs):
+        np.testing.assert_allclose(corr, ac.autocorrelation(signal), atol=1e-9)
+
+@pytest.mark.parametrize("n", [1, 2, 7, 11, 97, 202, 403, 1000])
+def test_fast_fft_length(n):
+
+    length = ac.fast_fft_length(n)
+    remainder = length
+    for factor in (2, 3, 5):
+        while remainder % factor == 0:
+            remainder //= factor
+
+    assert length >= n and remainder == 1
+    assert all(ac.fast_fft_length(m) == length for m in range(n, length + 1))
+
+def test_first_rise():
+
+    engine = ac.AutocorrelationEngine(rising_chunk=4)
+    corr = np.concatenate((np.linspace(10, 0, 37), np.linspace(0, 5, 10)))
+
+    assert engine.first_rise(corr) == 37
+    assert engine.first_rise(np.linspace(10, 0, 20)) is None
+
+def test_estimate_frequency_matches_the_direct_autocorrelation():
+
+    east = orbit_signal(3000, seed=4)
+    up = orbit_signal(3000, rps=1.1, seed=5)
+    time = np.arange(3000) / sampling_rate
+
+    for (start, _) in sliding_windows(east, 200, 10):
+        window = {"time": time[start:start + 200], "east": east[start:start + 200], "up": up[start:start + 200]}
+        frequencies = window_processing.estimate_frequency(window, sampling_rate)
+
+        for (axis, rps) in (("east", 1.3), ("up", 1.1)):
+            corr = np.correlate(window[axis], window[axis], mode="full")[199:]
+            assert frequencies[axis] == pytest.approx(window_processing.freq_from_corr(corr, sampling_rate), rel=1e-9)
+            assert frequencies[axis] == pytest.approx(rps, rel=0.05)
@@ -0,0 +1,111 @@
+import threading
+import pytest
+import broadcaster
+
+def fill(channel, count, key=None):
+
+    for value in range(count):
+        channel.put(value, key)
+
+def drain(channel):
+
+    values = []
+    while True:
+        try:
+            values.append(channel.pop())
+        except IndexError:
+            return values
+
+def test_latest_keeps_the_newest_value_of_each_key():
+
+    channel = broadcaster.Channel("latest", 10)
+    fill(channel, 5, key=0)
+    fill(channel, 3, key=1)
+
+    assert channel.stats()["lag"] == 2
+    assert drain(channel) == [4, 2]
+    assert (channel.stats()["delivered"], channel.stats()["dropped"]) == (2, 6)
+
+def test_bounded_drops_the_new_values_when_full():
+
+    channel = broadcaster.Channel("bounded", 3)
+    fill(channel, 5)
+
+    assert channel.stats()["lag"] == 3
+    assert drain(channel) == [0, 1, 2]
+    assert (channel.stats()["delivered"], channel.stats()["dropped"]) == (3, 2)
+
+def test_drop_oldest_drops_the_old_values_when_full():
+
+    channel = broadcaster.Channel("drop-oldest", 3)
+    fill(channel, 5)
+
+    assert channel.stats()["lag"] == 3
+    assert drain(channel) == [2, 3, 4]
+    assert (channel.stats()["delivered"], channel.stats()["dropped"]) == (3, 2)
+
+def test_unknown_policy():
+
+    with pytest.raises(ValueError):
+        broadcaster.Channel("unbounded", 3)
+
+def test_blocking_get_and_close():
+
+    channel = broadcaster.Channel("bounded", 3)
+    assert channel.get(timeout=0.01) is None
+
+    received = []
+    receiver = threading.Thread(target=lambda: received.append(channel.get(timeout=5)))
+    receiver.start()
+    channel.put("rotation")
+    receiver.join()
+    assert received == ["rotation"]
+
+    # values already broadcasted can still be received after closing
+    channel.put("last")
+    channel.close()
+    channel.put("dropped after close")
+    assert channel.get() == "last"
+    with pytest.raises(broadcaster.ChannelClosed):
+        channel.get()
+    with pytest.raises(broadcaster.ChannelClosed):
+        channel.pop()
+    assert channel.stats()["delivered"] == 2 and channel.stats()["dropped"] == 0
+
+def test_broadcast_to_subscribed_keys():
+
+    fan_out = broadcaster.Broadcaster(4, policy="bounded")
+    notified = []
+    every = fan_out.add_channel(notify=lambda: notified.append(True))
+    first = fan_out.add_channel(keys=[0])
+    second = fan_out.add_channel(keys=[1], policy="latest")
+
+    for value in range(3):
+        fan_out.broadcast(("controller 0", value), 0)
+        fan_out.broadcast(("controller 1", value), 1)
+    fan_out.broadcast("every controller")
+
+    assert len(drain(every)) == 4 and every.stats()["dropped"] == 3
+    assert drain(first) == [("controller 0", 0), ("controller 0", 1), ("controller 0", 2), "every controller"]
+    assert drain(second) == [("controller 1", 2), "every controller"]
+    # values dropped by a bounded channel do not notify its subscriber
+    assert len(notified) == 4
+
+    # subscribing changes the keys received from the next broadcast
+    first.subscribe(None)
+    fan_out.broadcast("any", 5)
+    assert drain(first) == ["any"] and drain(second) == []
+
+def test_closed_channels_are_unsubscribed():
+
+    fan_out = broadcaster.Broadcaster(4)
+    removed = fan_out.add_channel(name="removed")
+    closed = fan_out.add_channel(name="closed")
+    kept = fan_out.add_channel(name="kept")
+
+    fan_out.remove_channel(removed)
+    closed.close()
+    fan_out.broadcast(1)
+
+    assert [stats["name"] for stats in fan_out.stats()] == ["kept"]
+    assert removed.stats()["closed"] and drain(kept) == [1]
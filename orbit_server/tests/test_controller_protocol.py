@@ -0,0 +1,115 @@
+import numpy as np
+import pytest
+import controller_protocol
+
+class FakeController:
+    """Serial device stand-in that returns the given chunks of bytes, one chunk per read."""
+
+    def __init__(self, chunks):
+
+        self.chunks = list(chunks)
+
+    @property
+    def in_waiting(self):
+
+        return len(self.chunks[0]) if self.chunks else 0
+
+    def read(self, size):
+
+        return self.chunks.pop(0)
+
+def orbit_samples(count=50, seed=0):
+
+    rng = np.random.default_rng(seed)
+    times = 1000 + np.cumsum(rng.integers(15, 25, count))
+    return np.column_stack((times, rng.integers(0, 1024, (count, 3)))).astype(np.float64)
+
+def decode_all(reader):
+
+    samples = []
+    while reader.controller.chunks:
+        samples.append(reader.read_samples())
+    return np.concatenate(samples) if samples else np.empty((0, 4))
+
+def split_chunks(data, sizes):
+
+    chunks = []
+    offset = 0
+    for size in sizes:
+        chunks.append(data[offset:offset + size])
+        offset += size
+    return chunks + ([data[offset:]] if offset < len(data) else [])
+
+def test_ascii_frames_round_trip_across_partial_reads():
+
+    samples = orbit_samples()
+    data = b"Ready!\r\n" + controller_protocol.encode_ascii_frames(samples)
+    reader = controller_protocol.AsciiFrameReader(FakeController(split_chunks(data, [5, 13, 1, 200, 7, 300])))
+
+    np.testing.assert_array_equal(decode_all(reader), samples)
+    assert reader.malformed_frames == 0
+
+def test_ascii_malformed_frames_are_counted_and_dropped():
+
+    samples = orbit_samples(4)
+    frames = controller_protocol.encode_ascii_frames(samples).split(b"E")[:-1]
+    data = b"E".join((frames[0], b"STime=12,X=1,Y=2", frames[1], b"STime=12,X=1,Y=2,Z=-3", frames[2], b"noise" + frames[3])) + b"E"
+    reader = controller_protocol.AsciiFrameReader(FakeController([data]))
+
+    np.testing.assert_array_equal(decode_all(reader), samples)
+    assert reader.malformed_frames == 2
+
+def bitwise_crc8(payload):
+
+    crc = 0
+    for byte in payload:
+        crc ^= byte
+        for _ in range(8):
+            crc = ((crc << 1) ^ 0x07) & 0xFF if crc & 0x80 else (crc << 1) & 0xFF
+    return crc
+
+def test_crc8_matches_the_bitwise_crc():
+
+    # the check value of CRC-8 with the polynomial 0x07
+    check = np.frombuffer(b"123456789", dtype=np.uint8)[np.newaxis]
+    assert controller_protocol.crc8(check)[0] == 0xF4
+
+    payloads = np.random.default_rng(0).integers(0, 256, (100, 10), dtype=np.uint8)
+    assert controller_protocol.crc8(payloads).tolist() == [bitwise_crc8(payload) for payload in payloads.tolist()]
+
+def test_binary_frames_round_trip_across_partial_reads():
+
+    samples = orbit_samples()
+    data = b"Ready!\r\n" + controller_protocol.encode_binary_frames(samples)
+    reader = controller_protocol.BinaryFrameReader(FakeController(split_chunks(data, [5, 13, 1, 200, 7, 300])))
+
+    np.testing.assert_array_equal(decode_all(reader), samples)
+    assert reader.malformed_frames == 0
+
+@pytest.mark.parametrize("corrupt_byte", [0, 1, 5, 11])
+def test_binary_reader_resynchronises_after_a_corrupt_frame(corrupt_byte):
+
+    samples = orbit_samples(20)
+    data = bytearray(controller_protocol.encode_binary_frames(samples))
+    frame_size = controller_protocol.BinaryFrameReader.frame_size
+    data[7 * frame_size + corrupt_byte] ^= 0x5A
+    reader = controller_protocol.BinaryFrameReader(FakeController([bytes(data)]))
+
+    np.testing.assert_array_equal(decode_all(reader), np.delete(samples, 7, axis=0))
+    assert reader.malformed_frames == 1
+
+def test_binary_reader_counts_a_run_of_garbage_as_one_malformed_frame():
+
+    samples = orbit_samples(20)
+    data = controller_protocol.encode_binary_frames(samples)
+    frame_size = controller_protocol.BinaryFrameReader.frame_size
+
+    # garbage full of sync bytes between two frames, and a frame that is cut short
+    garbage = bytes([controller_protocol.BinaryFrameReader.sync_byte, 1, 2, 3] * 9)
+    truncated = data[10 * frame_size:11 * frame_size - 4]
+    data = data[:10 * frame_size] + garbage + truncated + data[11 * frame_size:]
+    reader = controller_protocol.BinaryFrameReader(FakeController(split_chunks(data, [50, 50, 50])))
+
+    decoded = decode_all(reader)
+    np.testing.assert_array_equal(decoded, np.delete(samples, 10, axis=0))
+    assert reader.malformed_frames == 1
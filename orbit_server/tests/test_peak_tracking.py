@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import autocorrelation as ac
+import window_processing
+
+sampling_rate = 50
+
+def orbit_corr(rps, count=200, noise=0.3, seed=0):
+
+    rng = np.random.default_rng(seed)
+    t = np.arange(count) / sampling_rate
+    return ac.autocorrelation(4 * np.sin(2 * np.pi * rps * t) + rng.normal(0, noise, count))
+
+@pytest.fixture
+def tracking(monkeypatch):
+
+    monkeypatch.setattr(window_processing, "lag_search_radius", 5)
+    monkeypatch.setattr(window_processing, "last_peak_lags", {})
+    return window_processing.last_peak_lags
+
+def test_peak_near_the_tracked_lag():
+
+    corr = orbit_corr(1.0)
+    peak = window_processing.find_peak(corr)
+
+    assert peak == pytest.approx(50, abs=2)
+    assert window_processing.find_peak_near(corr, peak + 3, 5) == peak
+    assert window_processing.find_peak_near(corr, peak - 3, 5) == peak
+
+def test_no_peak_near_the_tracked_lag():
+
+    corr = orbit_corr(1.0)
+
+    # the neighbourhood only holds the falling or rising side of the peak
+    assert window_processing.find_peak_near(corr, 30, 5) is None
+    assert window_processing.find_peak_near(corr, 70, 5) is None
+
+    # the neighbourhood of the trough has no confident peak
+    assert window_processing.find_peak_near(corr, 25, 5) is None
+
+def test_tracked_lag_at_the_edge_of_the_window():
+
+    corr = orbit_corr(1.0)
+    n = len(corr)
+
+    assert window_processing.find_peak_near(corr, n - 1, 5) is None
+    assert window_processing.find_peak_near(corr, n + 10, 5) is None
+    assert window_processing.find_peak_near(corr, 0, 1) is None
+
+def test_tracking_follows_the_peak(tracking):
+
+    for (i, rps) in enumerate(np.linspace(1.0, 1.1, 10)):
+        corr = orbit_corr(rps, seed=i)
+        freq = window_processing.freq_from_tracked_corr((0, "east"), corr, sampling_rate)
+
+        assert freq == pytest.approx(window_processing.freq_from_corr(corr, sampling_rate), rel=1e-12)
+        assert tracking[(0, "east")] == window_processing.find_peak(corr)
+
+def test_lost_peak_falls_back_to_a_full_search(tracking):
+
+    # the rotation speeds up, so the tracked lag is now at a trough of the autocorrelation
+    window_processing.freq_from_tracked_corr((0, "east"), orbit_corr(1.0), sampling_rate)
+    corr = orbit_corr(1.5)
+    freq = window_processing.freq_from_tracked_corr((0, "east"), corr, sampling_rate)
+
+    assert freq == pytest.approx(window_processing.freq_from_corr(corr, sampling_rate), rel=1e-12)
+    assert freq == pytest.approx(1.5, rel=0.05)
+    assert tracking[(0, "east")] == window_processing.find_peak(corr)
+
+def test_weak_peak_resets_the_tracking(tracking):
+
+    window_processing.freq_from_tracked_corr((0, "up"), orbit_corr(1.0), sampling_rate)
+    assert (0, "up") in tracking
+
+    # noise has no confident peak, so the next window is a full search again
+    window_processing.freq_from_tracked_corr((0, "up"), orbit_corr(1.0, noise=20, seed=1), sampling_rate)
+    assert (0, "up") not in tracking
+
+def test_tracking_is_disabled_without_a_radius(monkeypatch):
+
+    monkeypatch.setattr(window_processing, "lag_search_radius", None)
+    monkeypatch.setattr(window_processing, "last_peak_lags", {})
+    corr = orbit_corr(1.0)
+
+    assert window_processing.freq_from_tracked_corr((0, "east"), corr, sampling_rate) == window_processing.freq_from_corr(corr, sampling_rate)
+    assert window_processing.last_peak_lags == {}
@@ -0,0 +1,86 @@
+import numpy as np
+import pytest
+import analysis_loop
+import controller_protocol
+import recording
+
+def orbit_samples(count=1000, seed=0):
+
+    rng = np.random.default_rng(seed)
+    times = 5000 + np.cumsum(rng.integers(15, 25, count))
+    return np.column_stack((times, rng.integers(0, 1024, (count, 3)))).astype(np.float64)
+
+def write_capture(path, samples, batch_size=37, **metadata):
+
+    capture = recording.CaptureWriter(str(path), **metadata)
+    for start in range(0, len(samples), batch_size):
+        capture.write(samples[start:start + batch_size])
+    capture.close()
+
+def replay_all(path, binary_protocol):
+
+    (controller, protocol) = analysis_loop.prepare_controller(
+        recording.ReplayController(str(path), speed=0), 
+        binary_protocol
+    )
+    frame_reader = controller_protocol.frame_readers[protocol](controller)
+    controller.write(frame_reader.start_command)
+
+    batches = []
+    try:
+        while True:
+            batches.append(frame_reader.read_samples())
+    except EOFError:
+        pass
+
+    return (protocol, np.concatenate(batches))
+
+def test_capture_round_trip(tmp_path):
+
+    samples = orbit_samples()
+    write_capture(tmp_path, samples, sensor_type="am3x-1.5g", time_delta_ms=20)
+    (header, columns) = recording.read_capture(str(tmp_path))
+
+    assert header["sensor_type"] == "am3x-1.5g" and header["time_delta_ms"] == 20
+    np.testing.assert_array_equal(recording.capture_samples(columns), samples)
+    np.testing.assert_array_equal(recording.capture_samples(columns, 100, 200), samples[100:200])
+
+def test_capture_is_not_overwritten(tmp_path):
+
+    write_capture(tmp_path, orbit_samples(10))
+    with pytest.raises(FileExistsError):
+        recording.CaptureWriter(str(tmp_path))
+
+def test_interrupted_capture_is_read_up_to_the_last_complete_sample(tmp_path):
+
+    samples = orbit_samples(100)
+    write_capture(tmp_path, samples)
+
+    # the time column was written one and a half samples further than the others
+    with open(recording.column_path(str(tmp_path), "t"), "ab") as time_file:
+        time_file.write(b"\x00" * 6)
+    with open(recording.column_path(str(tmp_path), "z"), "r+b") as z_file:
+        z_file.truncate(99 * 2)
+
+    (_, columns) = recording.read_capture(str(tmp_path))
+    np.testing.assert_array_equal(recording.capture_samples(columns), samples[:99])
+
+@pytest.mark.parametrize("binary_protocol", [False, True])
+def test_replay_gives_the_captured_samples_back(tmp_path, binary_protocol):
+
+    samples = orbit_samples()
+    write_capture(tmp_path, samples)
+
+    (protocol, replayed) = replay_all(tmp_path, binary_protocol)
+
+    assert protocol == ("binary" if binary_protocol else "ascii")
+    np.testing.assert_array_equal(replayed, samples)
+
+def test_replay_sends_ready_messages_until_started(tmp_path):
+
+    write_capture(tmp_path, orbit_samples(10))
+    controller = recording.ReplayController(str(tmp_path), speed=0)
+
+    assert [controller.read(1) for _ in range(3)] == [recording.ReplayController.ready_message] * 3
+    controller.write(b"0")
+    assert controller.read(1) == recording.ReplayController.ready_message
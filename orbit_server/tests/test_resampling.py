@@ -0,0 +1,64 @@
+import numpy as np
+import pytest
+import resampling
+
+def jittered_samples(count=500, time_delta=20, seed=0):
+
+    rng = np.random.default_rng(seed)
+    times = np.maximum.accumulate(np.round(1013 + np.arange(count) * time_delta + rng.uniform(-4, 4, count)))
+    return np.column_stack((times, rng.normal(0, 5, (count, 3))))
+
+def stream(samples, batch_sizes, time_delta=20):
+
+    resampler = resampling.StreamingResampler(time_delta)
+    batches = []
+    offset = 0
+    for size in batch_sizes:
+        batches.append(resampler.resample(samples[offset:offset + size]))
+        offset += size
+    batches.append(resampler.resample(samples[offset:]))
+    return np.concatenate(batches)
+
+def test_matches_interpolating_the_whole_stream():
+
+    samples = jittered_samples()
+    resampled = resampling.resample(samples, 20)
+
+    # every grid time from the first to the last sample, each interpolated once
+    grid_times = np.arange(np.ceil(samples[0, 0] / 20), np.floor(samples[-1, 0] / 20) + 1) * 20
+    np.testing.assert_array_equal(resampled[:, 0], grid_times)
+    for channel in range(1, 4):
+        np.testing.assert_allclose(resampled[:, channel], np.interp(grid_times, samples[:, 0], samples[:, channel]), rtol=1e-12)
+
+@pytest.mark.parametrize("seed", range(5))
+def test_does_not_depend_on_the_batching(seed):
+
+    samples = jittered_samples(seed=seed)
+    rng = np.random.default_rng(seed)
+    batch_sizes = rng.integers(0, 12, 100)
+
+    np.testing.assert_array_equal(stream(samples, batch_sizes), resampling.resample(samples, 20))
+    np.testing.assert_array_equal(stream(samples, [1] * 499), resampling.resample(samples, 20))
+
+def test_batches_before_the_first_grid_time():
+
+    # the first grid time is 1020, the first two batches end before it
+    samples = jittered_samples()
+    samples[:3, 0] = (1001, 1009, 1015)
+    resampler = resampling.StreamingResampler(20)
+
+    assert resampler.resample(samples[:1]).shape == (0, 4)
+    assert resampler.resample(samples[1:3]).shape == (0, 4)
+    resampled = resampler.resample(samples[3:])
+
+    assert resampled[0, 0] == 1020
+    np.testing.assert_array_equal(resampled, resampling.resample(samples, 20))
+
+def test_empty_batches():
+
+    resampler = resampling.StreamingResampler(20)
+    assert resampler.resample(np.empty((0, 4))).shape == (0, 4)
+
+    samples = jittered_samples()
+    resampled = np.concatenate((resampler.resample(samples[:50]), resampler.resample(np.empty((0, 4))), resampler.resample(samples[50:])))
+    np.testing.assert_array_equal(resampled, resampling.resample(samples, 20))
@@ -0,0 +1,85 @@
+import numpy as np
+import pytest
+import rolling_window as rw
+
+def regular_samples(count, start=0, time_delta=20, seed=0):
+
+    rng = np.random.default_rng(seed)
+    times = (start + np.arange(count)) * time_delta
+    return np.column_stack((times, rng.normal(0, 5, (count, 3)) + (1, -2, 9.8)))
+
+def assert_means_of_window(window):
+
+    views = window.window()
+    means = window.means()
+    for channel in ("east", "north", "up"):
+        assert means[channel] == pytest.approx(np.mean(views[channel]), rel=1e-9, abs=1e-9)
+
+def test_window_views_and_means_over_rolls():
+
+    window = rw.RollingWindow(64)
+    samples = regular_samples(2000)
+
+    # the window grows to 80 samples, and then rolls by 8 samples at a time
+    # rolling cuts off the samples up to and including the rolling time after the first sample
+    window.extend(samples[:80])
+    window.roll(150, False)
+    assert_means_of_window(window)
+
+    for start in range(80, 2000, 8):
+        for sample in samples[start:start + 8]:
+            window.push(*sample)
+        window.roll(150)
+
+        np.testing.assert_array_equal(window.view("t"), samples[start - 72:start + 8, 0])
+        np.testing.assert_array_equal(window.view("up"), samples[start - 72:start + 8, 3])
+        assert_means_of_window(window)
+
+    # the window outgrew its capacity once, so it was reallocated at double the capacity
+    assert window.capacity == 128
+
+def test_means_after_trims():
+
+    window = rw.RollingWindow(256)
+    samples = regular_samples(3000)
+    rng = np.random.default_rng(1)
+
+    end = 0
+    for _ in range(200):
+        interval = int(rng.integers(1, 20))
+        window.extend(samples[end:end + interval])
+        end += interval
+        window.roll(0, False)
+        window.trim(float(rng.choice([400, 1000, 2000])))
+
+        times = window.view("t")
+        assert times[-1] == samples[end - 1, 0]
+        assert times[-1] - times[0] <= 2000
+        assert_means_of_window(window)
+
+def test_running_sums_are_resynchronised():
+
+    window = rw.RollingWindow(128, resync_interval=10)
+    samples = regular_samples(2000)
+    window.extend(samples[:100])
+    window.roll(200, False)
+
+    # a float error in the running sums is corrected on the next resync
+    window.sums += 1e-3
+    for (i, start) in enumerate(range(100, 2000, 5)):
+        window.extend(samples[start:start + 5])
+        window.roll(100)
+        if window.rolls % window.resync_interval == 0:
+            assert_means_of_window(window)
+
+def test_pending_interval_is_not_in_the_window():
+
+    window = rw.RollingWindow(32)
+    samples = regular_samples(40)
+    window.extend(samples[:20])
+    window.roll(100, False)
+    window.extend(samples[20:25])
+
+    assert len(window) == 20
+    np.testing.assert_array_equal(window.view("t", pending=True), samples[20:25, 0])
+    assert_means_of_window(window)
@@ -0,0 +1,69 @@
+import itertools
+import collections
+import numpy as np
+import pytest
+import rotation_mapping
+import window_processing
+from sine import sine
+
+def mapped_rotation_direction(norm_data_window, frequencies, wave_properties):
+    """The rotation direction vote by looking up every time interval in the mappings one by one."""
+
+    acceleration_vectors = list(zip(*(
+        sine(frequencies[axis], norm_data_window["time"], *wave_properties[axis]["popt"])
+        for axis in ("east", "up")
+    )))
+    acceleration_vector_deltas = np.subtract(acceleration_vectors[1:], acceleration_vectors[:-1])
+
+    rotational_directions = []
+    for (delta_signs, signs) in zip(np.sign(acceleration_vector_deltas), np.sign(acceleration_vectors)):
+        direction = rotation_mapping.accel_vector_delta_direction_mapping[tuple(delta_signs)]
+        position = rotation_mapping.accel_vector_position_mapping[tuple(signs)]
+        rotational_directions.append(
+            rotation_mapping.accel_vector_direction_and_position_mapping.get((direction, position), 0)
+        )
+
+    # the most common direction, ties are won by the smallest direction
+    counts = collections.Counter(rotational_directions)
+    return min(counts, key=lambda direction: (-counts[direction], direction))
+
+def test_lookup_matches_the_mappings():
+
+    for (delta_signs, signs) in itertools.product(itertools.product((-1, 0, 1), repeat=2), repeat=2):
+        direction = rotation_mapping.accel_vector_delta_direction_mapping[delta_signs]
+        position = rotation_mapping.accel_vector_position_mapping[signs]
+        expected = rotation_mapping.accel_vector_direction_and_position_mapping.get((direction, position), 0)
+
+        lookup_index = tuple(sign + 1 for sign in delta_signs + signs)
+        assert rotation_mapping.accel_vector_direction_lookup[lookup_index] == expected
+
+@pytest.mark.parametrize("seed", range(20))
+def test_vote_matches_the_mappings(seed):
+
+    rng = np.random.default_rng(seed)
+    time = 1000 + np.arange(200) * 0.02
+    freq = rng.uniform(0.3, 3)
+    frequencies = {"east": freq, "up": freq * rng.choice([1, 1.01, 0.8])}
+    wave_properties = {
+        axis: {"popt": np.array([rng.uniform(0.5, 5), rng.uniform(-np.pi, np.pi), rng.normal(0, 0.5)])}
+        for axis in ("east", "up")
+    }
+
+    assert window_processing.estimate_rotation_direction(
+        {"time": time}, frequencies, wave_properties
+    ) == mapped_rotation_direction({"time": time}, frequencies, wave_properties)
+
+def test_reversed_orbits_vote_opposite_directions():
+
+    # the up axis leads or lags the east axis by a quarter period
+    time = np.arange(200) * 0.02
+    frequencies = {"east": 1.0, "up": 1.0}
+    directions = [
+        window_processing.estimate_rotation_direction({"time": time}, frequencies, {
+            "east": {"popt": np.array([4.0, 0.0, 0.0])},
+            "up": {"popt": np.array([4.0, phase, 0.0])}
+        })
+        for phase in (np.pi / 2, -np.pi / 2)
+    ]
+
+    assert sorted(directions) == [-1, 1]
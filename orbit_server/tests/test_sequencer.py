@@ -0,0 +1,60 @@
+import pickle
+import sequencer
+
+def test_results_completing_out_of_order():
+
+    result_sequencer = sequencer.ResultSequencer(workers=4)
+    for trace_id in range(4):
+        result_sequencer.submit(trace_id)
+
+    # only results newer than every accepted result are broadcasted
+    assert [result_sequencer.accept(trace_id) for trace_id in (1, 0, 3, 2)] == [True, False, True, False]
+
+def test_stale_results_are_rejected():
+
+    result_sequencer = sequencer.ResultSequencer(workers=2)
+    result_sequencer.submit(5)
+
+    assert result_sequencer.accept(5)
+    assert not result_sequencer.accept(5)
+    assert not result_sequencer.accept(4)
+
+def test_superseded_windows():
+
+    result_sequencer = sequencer.ResultSequencer(workers=2)
+    for trace_id in range(2):
+        result_sequencer.submit(trace_id)
+
+    # there are not enough newer windows to keep every worker busy
+    assert not any(result_sequencer.superseded(trace_id) for trace_id in range(2))
+
+    # a window is superseded by enough newer submitted windows, or by an accepted newer result
+    result_sequencer.submit(2)
+    assert result_sequencer.superseded(0) and not result_sequencer.superseded(1)
+    result_sequencer.submit(3)
+    assert result_sequencer.superseded(0) and result_sequencer.superseded(1)
+    assert not result_sequencer.superseded(2)
+    result_sequencer.accept(2)
+    assert result_sequencer.superseded(2)
+    assert not result_sequencer.superseded(3)
+
+def test_trace_ids_spaced_by_the_stride_of_several_controllers():
+
+    # the trace ids of 3 controllers are the controller id, then spaced by the stride
+    sequencers = [sequencer.ResultSequencer(workers=2, stride=3) for _ in range(3)]
+    trace_ids = [list(range(controller, 30, 3)) for controller in range(3)]
+    assert len(set(sum(trace_ids, []))) == 30
+
+    for (result_sequencer, controller_trace_ids) in zip(sequencers, trace_ids):
+        for trace_id in controller_trace_ids[:3]:
+            result_sequencer.submit(trace_id)
+
+    # each controller only needs enough of its own newer windows to keep the workers busy
+    assert not sequencers[1].superseded(trace_ids[1][1])
+    assert sequencers[1].superseded(trace_ids[1][0])
+
+    # the results of one controller don't reject the results of the others
+    assert sequencers[2].accept(trace_ids[2][2])
+    assert sequencers[0].accept(trace_ids[0][1])
+    assert sequencers[1].accept(trace_ids[1][0])
+    assert not sequencers[0].accept(trace_ids[0][0])
@@ -0,0 +1,62 @@
+import numpy as np
+import pytest
+from scipy.optimize import curve_fit
+import sine
+
+def noisy_sine(freq, amp, phase, vertical_disp, n=200, time_delta=0.02, start=1000.0, seed=0):
+
+    rng = np.random.default_rng(seed)
+    time = start + np.arange(n) * time_delta
+    return (time, sine.sine(freq, time, amp, phase, vertical_disp) + rng.normal(0, 0.3, n))
+
+@pytest.mark.parametrize("freq, amp, phase, vertical_disp", [
+    (1.0, 4.0, 0.3, 0.0),
+    (1.2345, 2.5, -2.0, 0.7),
+    (0.6, 6.0, 3.0, -1.2)
+])
+def test_fit_sine_matches_curve_fit(freq, amp, phase, vertical_disp):
+
+    (time, signal) = noisy_sine(freq, amp, phase, vertical_disp)
+    (popt, pcov) = sine.fit_sine(freq, time, signal)
+
+    (expected_popt, expected_pcov) = curve_fit(
+        lambda t, a, p, v: sine.sine(freq, t, a, p, v), 
+        time, 
+        signal, 
+        p0=(amp, phase, vertical_disp)
+    )
+
+    np.testing.assert_allclose(popt, expected_popt, rtol=1e-6, atol=1e-6)
+    # curve_fit differentiates numerically at the large absolute time values, so its covariance is less exact
+    np.testing.assert_allclose(pcov, expected_pcov, rtol=1e-3, atol=1e-9)
+
+def test_fit_sine_amplitude_is_positive_and_phase_is_wrapped():
+
+    (time, signal) = noisy_sine(1.1, -3.0, 0.5, 0.0)
+    (popt, pcov) = sine.fit_sine(1.1, time, signal)
+
+    assert popt[0] > 0
+    assert -np.pi < popt[1] <= np.pi
+    np.testing.assert_allclose(popt[:2], (3.0, 0.5 - np.pi), atol=0.05)
+
+def test_fit_sine_rejects_non_finite_frequency():
+
+    (time, signal) = noisy_sine(1.0, 4.0, 0.3, 0.0)
+    with pytest.raises(ValueError):
+        sine.fit_sine(np.nan, time, signal)
+
+def test_fit_sines_rows_match_single_fits():
+
+    (time, east) = noisy_sine(1.05, 4.0, 0.3, 0.1, seed=1)
+    (_, up) = noisy_sine(1.04, 3.5, 1.9, -0.2, seed=2)
+    freqs = [1.05, 1.04]
+
+    (popts, pcovs) = sine.fit_sines(freqs, time, np.stack((east, up)))
+    (row_popts, row_pcovs) = sine.fit_sines(freqs, np.stack((time, time)), np.stack((east, up)))
+
+    for (i, (freq, signal)) in enumerate(zip(freqs, (east, up))):
+        (popt, pcov) = sine.fit_sine(freq, time, signal)
+        np.testing.assert_allclose(popts[i], popt, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(pcovs[i], pcov, rtol=1e-9, atol=1e-15)
+        np.testing.assert_allclose(row_popts[i], popt, rtol=1e-12, atol=1e-12)
+        np.testing.assert_allclose(row_pcovs[i], pcov, rtol=1e-9, atol=1e-15)
@@ -0,0 +1,194 @@
+import os
+import time
+import threading
+import pytest
+import supervisor
+
+start_times = []
+
+def record_start_time(start_time=None):
+
+    start_times.append(start_time)
+
+def slow_start(delay, start_time=None):
+
+    time.sleep(delay)
+
+def task(kind, value=None):
+
+    if kind == "hang":
+        time.sleep(60)
+    if kind == "fail":
+        raise ValueError(value)
+    if kind == "crash":
+        os._exit(3)
+    if kind == "slow":
+        time.sleep(value)
+    if kind == "start_time":
+        # long enough that every worker gets one of these tasks
+        time.sleep(0.2)
+        return (os.getpid(), start_times[-1])
+    return (os.getpid(), value)
+
+class Results:
+
+    def __init__(self):
+
+        self.values = {}
+        self.done = threading.Condition()
+
+    def callbacks(self, key):
+
+        return (lambda value: self.set(key, ("ok", value)), lambda e: self.set(key, ("error", e)))
+
+    def set(self, key, result):
+
+        with self.done:
+            self.values[key] = result
+            self.done.notify_all()
+
+    def wait(self, count, timeout=20):
+
+        with self.done:
+            assert self.done.wait_for(lambda: len(self.values) >= count, timeout)
+        return self.values
+
+@pytest.fixture
+def pool():
+
+    pool = supervisor.SupervisedPool(2, 0.5, record_start_time)
+    yield pool
+    pool.terminate()
+
+def submit(pool, results, key, kind, value=None):
+
+    (callback, error_callback) = results.callbacks(key)
+    pool.apply_async(task, args=(kind, value), callback=callback, error_callback=error_callback)
+
+def test_results_and_task_errors(pool):
+
+    results = Results()
+    submit(pool, results, "ok", "ok", 1)
+    submit(pool, results, "fail", "fail", "bad window")
+
+    values = results.wait(2)
+    assert values["ok"][0] == "ok" and values["ok"][1][1] == 1
+    assert values["fail"][0] == "error" and isinstance(values["fail"][1], ValueError)
+    assert str(values["fail"][1]) == "bad window"
+
+def test_hung_worker_is_killed_and_respawned(pool):
+
+    results = Results()
+    hung_pids = {worker.process.pid for worker in pool.workers}
+    submit(pool, results, "hang", "hang")
+
+    values = results.wait(1)
+    assert values["hang"][0] == "error" and isinstance(values["hang"][1], supervisor.DeadlineExceeded)
+
+    # the pool still has every worker, and the respawned worker runs tasks
+    assert len(pool.workers) == 2
+    assert len({worker.process.pid for worker in pool.workers} - hung_pids) == 1
+    for i in range(4):
+        submit(pool, results, i, "ok", i)
+    values = results.wait(5)
+    assert all(values[i] == ("ok", (values[i][1][0], i)) for i in range(4))
+
+def test_dead_worker_is_respawned(pool):
+
+    results = Results()
+    submit(pool, results, "crash", "crash")
+    submit(pool, results, "ok", "ok", 1)
+
+    values = results.wait(2)
+    assert values["crash"][0] == "error" and isinstance(values["crash"][1], supervisor.WorkerDied)
+    assert str(values["crash"][1]) == "Worker exited with code 3"
+    assert values["ok"][0] == "ok"
+    assert all(worker.process.is_alive() for worker in pool.workers)
+
+def test_queued_tasks_past_the_deadline_are_skipped(pool):
+
+    results = Results()
+    for i in range(2):
+        submit(pool, results, ("slow", i), "slow", 0.4)
+    for i in range(4):
+        submit(pool, results, ("queued", i), "ok", i)
+
+    values = results.wait(6)
+    assert all(values[("slow", i)][0] == "ok" for i in range(2))
+
+    # the queued tasks waited about 0.4s, so they are still in time, unless the machine is very slow
+    late = [key for (key, value) in values.items() if isinstance(value[1], supervisor.DeadlineExceeded)]
+    assert all(key[0] == "queued" for key in late)
+
+    results = Results()
+    for i in range(2):
+        submit(pool, results, ("slow", i), "slow", 0.8)
+    for i in range(4):
+        submit(pool, results, ("queued", i), "ok", i)
+
+    values = results.wait(6)
+    for i in range(4):
+        assert values[("queued", i)][0] == "error"
+        assert isinstance(values[("queued", i)][1], supervisor.DeadlineExceeded)
+
+def test_respawned_workers_get_their_own_start_time(pool):
+
+    results = Results()
+    pool_created_time = time.monotonic()
+    original_pids = {worker.process.pid for worker in pool.workers}
+    submit(pool, results, "crash", "crash")
+    results.wait(1)
+
+    # the respawned worker only gets tasks once it has started
+    respawn_time = time.monotonic()
+    time.sleep(1)
+    for i in range(2):
+        submit(pool, results, i, "start_time")
+    values = results.wait(3)
+
+    start_times = dict(values[i][1] for i in range(2))
+    assert len(start_times) == 2
+    for (pid, start_time) in start_times.items():
+        if pid in original_pids:
+            assert start_time < pool_created_time
+        else:
+            assert pool_created_time < start_time < respawn_time
+
+def test_close_finishes_queued_tasks_and_rejects_new_ones():
+
+    pool = supervisor.SupervisedPool(2, 5, record_start_time)
+    results = Results()
+    for i in range(6):
+        submit(pool, results, i, "ok", i)
+    pool.close()
+    pool.join()
+
+    assert len(results.values) == 6 and all(value[0] == "ok" for value in results.values.values())
+    assert not any(worker.process.is_alive() for worker in pool.workers)
+    with pytest.raises(ValueError):
+        submit(pool, results, 6, "ok", 6)
+
+def test_respawned_worker_with_a_slow_initializer_gets_tasks_once_started():
+
+    # the initializer takes longer than the deadline, so the startup must not count towards it
+    pool = supervisor.SupervisedPool(1, 0.3, slow_start, (0.6,))
+    try:
+        results = Results()
+        time.sleep(1)
+        submit(pool, results, "crash", "crash")
+        results.wait(1)
+
+        for i in range(10):
+            submit(pool, results, i, "ok", i)
+            time.sleep(0.1)
+        values = results.wait(11)
+
+        # the tasks queued while the worker was starting may be late, the rest all run on one worker
+        late = [i for i in range(10) if values[i][0] == "error"]
+        assert all(isinstance(values[i][1], supervisor.DeadlineExceeded) for i in late)
+        assert late == list(range(len(late)))
+        assert len(late) < 10
+        assert len({values[i][1][0] for i in range(len(late), 10)}) == 1
+        assert len(pool.workers) == 1 and pool.workers[0].process.pid == values[9][1][0]
+    finally:
+        pool.terminate()
@@ -0,0 +1,188 @@
+import numpy as np
+import itertools
+import logging
+import json
+import time
+
+# the spans of a data window, in the order they happen through the pipeline
+# the worker spans happen in a child-process, they are sent back with the processed window
+events = (
+    "sample_read",
+    "window_rolled",
+    "submitted",
+    "worker_start",
+    "normalised",
+    "frequency_estimated",
+    "fitted",
+    "direction_voted",
+    "callback",
+    "broadcast",
+    "client_write"
+)
+event_indices = {event: i for (i, event) in enumerate(events)}
+
+# histogram bin edges in milliseconds
+histogram_bins_ms = (0, 0.1, 0.2, 0.5, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 1e9)
+
+class SpanRing:
+    """In-memory ring of (trace_id, event, time) spans, the oldest spans are overwritten.
+
+    Recording a span is a few array assignments without a lock, the slot is claimed with an
+    atomic counter, so it is cheap enough to do from the analysis loop, the callback thread
+    and the server threads at the same time.
+    """
+
+    def __init__(self, capacity):
+
+        self.capacity = capacity
+        self.trace_ids = np.full(capacity, -1, dtype=np.int64)
+        self.events = np.zeros(capacity, dtype=np.int8)
+        self.times = np.zeros(capacity, dtype=np.float64)
+        self.counter = itertools.count()
+
+    def record(self, trace_id, event, timestamp):
+
+        i = next(self.counter) % self.capacity
+        self.trace_ids[i] = -1
+        self.events[i] = event_indices[event]
+        self.times[i] = timestamp
+        self.trace_ids[i] = trace_id
+
+    def spans(self):
+        """Copies of the recorded trace ids, event indices and times."""
+
+        recorded = self.trace_ids >= 0
+        return (self.trace_ids[recorded], self.events[recorded], self.times[recorded])
+
+class SpanBuffer:
+    """The spans of the data window being processed in a child-process, until they are drained."""
+
+    def __init__(self):
+
+        self.buffer = []
+
+    def record(self, trace_id, event, timestamp):
+
+        self.buffer.append((event, timestamp))
+
+    def drain(self):
+
+        spans = tuple(self.buffer)
+        self.buffer.clear()
+        return spans
+
+# the tracer is None unless tracing is enabled, so marking a span costs a single check
+tracer = None
+export_path = None
+
+def enable(path, capacity=1 << 16):
+    """Enables tracing in the main process, the histograms are exported to the path on close."""
+
+    global tracer
+    global export_path
+    tracer = SpanRing(capacity)
+    export_path = path
+
+def enable_worker():
+    """Enables tracing in a child-process, where spans are buffered until they are drained."""
+
+    global tracer
+    tracer = SpanBuffer()
+
+def mark(trace_id, event, timestamp=None):
+    """Records that an event happened to a data window, now or at a monotonic timestamp."""
+
+    if tracer is not None:
+        tracer.record(trace_id, event, time.monotonic() if timestamp is None else timestamp)
+
+def drain():
+    """Returns and clears the buffered spans of a child-process, for sending back with the data window."""
+
+    if isinstance(tracer, SpanBuffer):
+        return tracer.drain()
+    return ()
+
+def record_spans(trace_id, spans):
+    """Records the spans that were drained from a child-process."""
+
+    for (event, timestamp) in spans:
+        mark(trace_id, event, timestamp)
+
+def lookup(trace_ids, indices, times, event, ids):
+    """Finds the time of an event for each trace id, returns the times and a mask of the ids that had it."""
+
+    selected = indices == event_indices[event]
+    (event_ids, event_times) = (trace_ids[selected], times[selected])
+    order = np.argsort(event_ids, kind="stable")
+    (event_ids, event_times) = (event_ids[order], event_times[order])
+
+    positions = np.searchsorted(event_ids, ids)
+    found = positions < len(event_ids)
+    found[found] = event_ids[positions[found]] == ids[found]
+    return (event_times[np.minimum(positions, max(len(event_ids) - 1, 0))], found)
+
+def summarise(latencies_ms):
+
+    (counts, _) = np.histogram(latencies_ms, bins=histogram_bins_ms)
+    summary = {
+        "count": int(len(latencies_ms)),
+        "histogram_bins_ms": list(histogram_bins_ms),
+        "histogram": counts.tolist()
+    }
+    if len(latencies_ms) > 0:
+        summary.update({
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p90": float(np.percentile(latencies_ms, 90)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+            "max": float(np.max(latencies_ms))
+        })
+    return summary
+
+def histograms():
+    """Latency histograms of every event, in milliseconds.
+
+    The latency of an event is measured from when the last sample of its data window was read,
+    which is the sensor to screen latency by the time of the client write. The stage duration of
+    an event is measured from the previous event of the same data window.
+    """
+
+    (trace_ids, indices, times) = tracer.spans()
+
+    latencies = {}
+    stages = {}
+    for (i, event) in enumerate(events[1:], 1):
+
+        selected = indices == i
+        (ids, event_times) = (trace_ids[selected], times[selected])
+
+        (read_times, found) = lookup(trace_ids, indices, times, "sample_read", ids)
+        latencies[event] = summarise((event_times[found] - read_times[found]) * 1000)
+
+        (previous_times, found) = lookup(trace_ids, indices, times, events[i - 1], ids)
+        stages[event] = summarise((event_times[found] - previous_times[found]) * 1000)
+
+    return {
+        "spans": int(len(trace_ids)),
+        "latency_from_sample_read_ms": latencies,
+        "stage_ms": stages
+    }
+
+def close():
+    """Exports the histograms if tracing is enabled, and logs a summary of them."""
+
+    if not isinstance(tracer, SpanRing):
+        return
+
+    report = histograms()
+
+    for event in events[1:]:
+        latency = report["latency_from_sample_read_ms"][event]
+        if latency["count"] > 0:
+            logging.info(
+                "Trace %s - count: %d, p50: %.2fms, p90: %.2fms, p99: %.2fms",
+                event, latency["count"], latency["p50"], latency["p90"], latency["p99"]
+            )
+
+    if export_path:
+        with open(export_path, "w") as export_file:
+            json.dump(report, export_file, indent=4)
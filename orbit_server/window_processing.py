@@ -1,105 +1,286 @@
-from sine import sine
-from scipy.optimize import curve_fit
-from scipy.signal import fftconvolve
-from scipy.stats import mode
-from scipy.interpolate import interp1d
-from matplotlib.mlab import find as find_index_by_true
+from sine import sine, fit_sines
 import os
-import accelerometers
+import sys
+import resource
 import rotation_mapping
-import graphing
+import autocorrelation
+import tracing
+import metrics
 import numpy as np
 import logging
 import pprint
+import time
+
+# the child-processes only import numpy and the analysis modules, matplotlib is only imported by the 
+# main process when graphing
+
+# the shared windows and the result sequencers of each controller are setup in each child-process 
+# by the process pool initializer
+shared_windows = None
+result_sequencers = None
+
+# the half life in seconds of the recency weighted direction vote, None is an unweighted vote
+direction_half_life_s = None
+
+# the radius in lags of the autocorrelation peak search around the last peak, None is always a full search
+# each child-process keeps the last peak lag per controller and axis, consecutive windows overlap by most 
+# of their samples, so the peak only moves by a few lags between them
+# a peak that is not a local maximum inside the neighbourhood, or that is weaker than the minimum 
+# confidence relative to the zero lag, falls back to a full search
+lag_search_radius = None
+min_peak_confidence = 0.5
+last_peak_lags = {}
+
+direction_names = {1: "Clockwise", -1: "Anticlockwise"}
+
+# each child-process reuses the FFT lengths and workspaces of its batch autocorrelations
+autocorrelation_engine = autocorrelation.AutocorrelationEngine()
+
+# the axes of the orbit, which are stacked into the rows of 2D arrays to be analysed together
+analysis_axes = ("east", "up")
+
+def setup_process(
+    windows, 
+    sequencers, 
+    direction_half_life=None, 
+    trace=False, 
+    lag_radius=None, 
+    start_time=None
+):
+
+    global shared_windows
+    global result_sequencers
+    global direction_half_life_s
+    global lag_search_radius
+    shared_windows = windows
+    result_sequencers = sequencers
+    direction_half_life_s = direction_half_life
+    lag_search_radius = lag_radius
+    if trace:
+        tracing.enable_worker()
+
+    # the startup time is measured from starting this process, the monotonic clock is shared by every process
+    # the maximum resident set size includes the pages shared with the main process when it was forked
+    if start_time is not None:
+        logging.info(
+            "Window Processing Child-Process %d started in %.1f ms with a maximum RSS of %d KiB", 
+            os.getpid(), 
+            (time.monotonic() - start_time) * 1000, 
+            max_rss_kib()
+        )
+
+def max_rss_kib():
+
+    # linux reports the maximum resident set size in KiB, and macOS in bytes
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss // 1024 if sys.platform == "darwin" else max_rss
+
+class PrettyFormat:
+    """Pretty formats an object only if a log message with it is emitted.
+
+    The debug messages of every data window would otherwise format their arrays, even when 
+    debug messages are not logged, which costs more than analysing the data window.
+    """
+
+    def __init__(self, value):
+
+        self.value = value
+
+    def __str__(self):
+
+        return pprint.pformat(self.value)
+
+def analyse_shared_window_process(time_delta_ms, controller, slot, length, trace_id, means=None):
+    """Processes a data window of a controller in a slot of the shared windows.
+
+    Only the slot descriptor is passed in and returned, the data window is read from the 
+    shared slot and the normalised data window and wave properties are written back into it.
+    The descriptor also carries the means of the data window, from the running sums of the 
+    rolling window.
+
+    If the data window was superseded while it was queued, it is skipped, and the returned 
+    frequencies and rotation direction are None.
+
+    The tracing spans of the child-process are returned with the descriptor.
+    """
+
+    time_delta_s = time_delta_ms / 1000
+
+    tracing.mark(trace_id, "worker_start")
+
+    if result_sequencers[controller].superseded(trace_id):
+        logging.info("%d - Skipping Superseded Window Processing at PID: %d", trace_id, os.getpid())
+        return (slot, length, None, None, time_delta_s, trace_id, tracing.drain())
+
+    data_window = shared_windows.window(slot, length)
+
+    (
+        norm_data_window, 
+        frequencies, 
+        wave_properties, 
+        rotation_direction, 
+        time_delta_s, 
+        trace_id
+    ) = analyse_rotation_process(time_delta_ms, data_window, trace_id, means, controller)
+
+    shared_windows.write_result(slot, norm_data_window, wave_properties)
+
+    return (slot, length, frequencies, rotation_direction, time_delta_s, trace_id, tracing.drain())
 
-def analyse_rotation_process(time_delta_ms, orientation, sensor_type, data_window, trace_id):
+def analyse_shared_window_process_callback(
+    broadcaster, 
+    graph, 
+    shared_windows, 
+    result_sequencer, 
+    controller, 
+    adaptive_window, 
+    samples_read_time, 
+    processed_descriptor
+):
+
+    (slot, length, frequencies, rotation_direction, time_delta_s, trace_id, spans) = processed_descriptor
+
+    tracing.record_spans(trace_id, spans)
+    tracing.mark(trace_id, "callback")
+
+    try:
+
+        # skipped windows and results older than the last broadcasted result are dropped
+        if frequencies is None:
+            logging.info("%d - Dropping Skipped Window", trace_id)
+            metrics.increment("orbit_windows_dropped_total")
+        elif not result_sequencer.accept(trace_id):
+            logging.info("%d - Dropping Out of Order Result", trace_id)
+            metrics.increment("orbit_windows_dropped_total")
+        else:
+            (norm_data_window, wave_properties) = shared_windows.result(slot, length)
+            rps = analyse_rotation_process_callback(
+                broadcaster, 
+                graph, 
+                (norm_data_window, frequencies, wave_properties, rotation_direction, time_delta_s, trace_id), 
+                controller
+            )
+            # the next data windows of the controller are sized for the estimated frequency
+            if adaptive_window:
+                adaptive_window.update(rps)
+            # the age of the result is measured from reading the last samples of its data window
+            metrics.increment("orbit_windows_completed_total")
+            metrics.observe("orbit_result_age_seconds", time.monotonic() - samples_read_time)
+
+    finally:
+
+        shared_windows.release(slot)
+
+def analyse_shared_window_process_error_callback(
+    broadcaster, 
+    shared_windows, 
+    result_sequencer, 
+    controller, 
+    slot, 
+    trace_id, 
+    exception
+):
+
+    logging.error("%d - Window Processing Failed: %r", trace_id, exception)
+    metrics.increment("orbit_windows_failed_total")
+
+    try:
+
+        # a failed or late window is broadcasted as an unknown rotation of 0 RPS and direction 0
+        # so clients don't keep acting on the last rotation, unless a newer result was already broadcasted
+        if result_sequencer.accept(trace_id):
+            broadcaster.broadcast((controller, 0.0, 0, trace_id), controller)
+            tracing.mark(trace_id, "broadcast")
+
+    finally:
+
+        shared_windows.release(slot)
+
+def analyse_rotation_process(time_delta_ms, data_window, trace_id, means=None, controller=0):
 
     logging.info("%d - Starting Window Processing at PID: %d", trace_id, os.getpid())
 
-    logging.debug("%d - Data Window: \n%s", trace_id, str(data_window))
+    logging.debug("%d - Data Window: \n%s", trace_id, data_window)
 
-    # these will be used for sampling interpolation, frequency estimation, and sine wave regression
+    # these will be used for frequency estimation, and sine wave regression
     time_delta_s = time_delta_ms / 1000
     sampling_rate = 1000 / time_delta_ms
 
-    logging.debug("%d - Time Delta Seconds: \n%s", trace_id, pprint.pformat(time_delta_s))
-    logging.debug("%d - Sampling Rate: \n%s", trace_id, pprint.pformat(sampling_rate))
+    logging.debug("%d - Time Delta Seconds: \n%s", trace_id, PrettyFormat(time_delta_s))
+    logging.debug("%d - Sampling Rate: \n%s", trace_id, PrettyFormat(sampling_rate))
     
-    # normalise the raw acceleration data to linearly spaced & interpolated data with the given orientation
-    norm_data_window = normalise_signals(data_window, time_delta_s, orientation, sensor_type)
+    # normalise the regular acceleration data by centering it
+    norm_data_window = normalise_signals(data_window, means)
 
-    logging.debug("%d - Normalised Data Window: \n%s", trace_id, pprint.pformat(norm_data_window))
+    tracing.mark(trace_id, "normalised")
+
+    logging.debug("%d - Normalised Data Window: \n%s", trace_id, PrettyFormat(norm_data_window))
 
     # frequency needs to be estimated before curve fitting
-    frequencies = estimate_frequency(norm_data_window, sampling_rate)
+    frequencies = estimate_frequency(norm_data_window, sampling_rate, controller)
+
+    tracing.mark(trace_id, "frequency_estimated")
 
-    logging.debug("%d - Frequencies: \n%s", trace_id, pprint.pformat(frequencies))
+    logging.debug("%d - Frequencies: \n%s", trace_id, PrettyFormat(frequencies))
 
     # non-linear curve fit of a sine curve
     wave_properties = fit_sine_waves(norm_data_window, frequencies)
 
-    logging.debug("%d - Wave Properties: \n%s", trace_id, pprint.pformat(wave_properties))
+    tracing.mark(trace_id, "fitted")
+
+    logging.debug("%d - Wave Properties: \n%s", trace_id, PrettyFormat(wave_properties))
 
     # use the acceleration and jerk to vote on the rotational direction
-    rotation_direction = estimate_rotation_direction(norm_data_window, frequencies, wave_properties)
+    rotation_direction = estimate_rotation_direction(
+        norm_data_window, 
+        frequencies, 
+        wave_properties, 
+        direction_half_life_s
+    )
+
+    tracing.mark(trace_id, "direction_voted")
 
-    logging.debug("%d - Rotation Direction: \n%s", trace_id, pprint.pformat(rotation_direction))
+    logging.debug("%d - Rotation Direction: \n%s", trace_id, PrettyFormat(rotation_direction))
 
     return (norm_data_window, frequencies, wave_properties, rotation_direction, time_delta_s, trace_id)
 
-def analyse_rotation_process_callback(broadcaster, graph, processed_package):
+def analyse_rotation_process_callback(broadcaster, graph, processed_package, controller=0):
 
     (norm_data_window, frequencies, wave_properties, rotation_direction, time_delta_s, trace_id) = processed_package
 
-    if rotation_direction == 1:
-        print("%d - Clockwise Direction" % trace_id)
-    elif rotation_direction == -1:
-        print("%d - Anticlockwise Direction" % trace_id)
-    else:
-        print("%d - Unknown Direction" % trace_id)
-
     rps = (frequencies["east"] + frequencies["up"]) / 2
 
-    print("%d - RPS East: %d" % (trace_id, frequencies["east"]))
-    print("%d - RPS Up: %d" % (trace_id, frequencies["up"]))
-    print("%d - RPS Average: %d" % (trace_id, rps))
+    # a single log line per result, printing to stdout is a bottleneck under load
+    # the counters and gauges of the server are exposed by the metrics endpoint instead
+    logging.info(
+        "%d - Controller %d - %s Direction, RPS East: %.3f, RPS Up: %.3f, RPS Average: %.3f", 
+        trace_id, 
+        controller, 
+        direction_names.get(rotation_direction, "Unknown"), 
+        frequencies["east"], 
+        frequencies["up"], 
+        rps
+    )
+
+    # non-blocking push into the broadcaster, tagged with the controller
+    # it will overwrite any old data of the controller if they haven't been collected
+    broadcaster.broadcast((controller, rps, rotation_direction, trace_id), controller)
 
-    # non-blocking push into the broadcaster
-    # it will overwrite any old data if they haven't been collected
-    broadcaster.broadcast((rps, rotation_direction, trace_id))
+    tracing.mark(trace_id, "broadcast")
 
     if graph:
+        import graphing
         graphing.display(graph, norm_data_window, frequencies, wave_properties, time_delta_s)
 
-def normalise_signals(data_window, time_delta_s, orientation, sensor_type):
+    return rps
 
-    # convert to np arrays and convert acceleration units to acceleration m/s^2
-    for k, vs in data_window.items():
-        if k == 't':
-            data_window[k] = np.array(vs)
-        else:
-            data_window[k] = accelerometers.accel_sensors[sensor_type]["accel_convert_map_np"](np.array(vs))
-
-    # we now have a set of acceleration samples, but they are irregularly 
-    # time-spaced because the game controller is a soft realtime system
-    # we will regularise the samples by first constructing a linear spaced 
-    # set of time, that has the same length as the amount of data but uses 
-    # the the desired time delta_s, then since the time samples have 
-    # changed, we need to accordingly change the acceleration values via 
-    # interpolation
-
-    time_values_s = data_window["t"] / 1000
-
-    # the endpoint is false in order to recreate a half-open interval
-    # num is the number of time values to generate in addition to the start value
-    # so a half open interval will discount the number by 1
-    # thus giving us exactly num number of time values 
-    regular_time_values_s = np.linspace(
-        start    = time_values_s[0],
-        stop     = time_values_s[0] + len(time_values_s) * time_delta_s,
-        num      = len(time_values_s),
-        endpoint = False
-    )
+def normalise_signals(data_window, means=None):
+
+    # the acceleration samples were already converted to m/s^2, oriented to the ENU axes and 
+    # resampled onto the regular time grid of the time delta when they were ingested
+    # see `accelerometers.transform_samples` and `resampling.StreamingResampler`
+    # the regular time values are multiples of the time delta, so overlapping data windows share 
+    # exactly the same regular time values
 
     # time in norm_data_window will be in seconds, not milliseconds
     # for the purposes of orbit, we only care about 2D orbit, so we drop the north axis
@@ -109,53 +290,112 @@ def normalise_signals(data_window, time_delta_s, orientation, sensor_type):
         "up":    None
     }
 
-    norm_data_window["time"]  = regular_time_values_s
+    norm_data_window["time"] = data_window["t"] / 1000
 
     for axis in ["east", "up"]:
 
-        # the east and up axis depends on fixed orientation of the controller during orbit
-        norm_data_window[axis] = data_window[orientation[axis]["axis"]]
-        
         # subtracting the mean will translate the curve to be centered at their rotational orbit
-        norm_data_window[axis] -= np.mean(norm_data_window[axis])
-
-        # flip values according to the given signs
-        if orientation[axis]["sign"] == '-': norm_data_window[axis] *= -1
-
-        # use linear interpolation and allow a bit of extrapolation 
-        # extrapolation is because the corrected time could be a bit larger than the sampled time
-        interpolated_f = interp1d(
-            time_values_s, 
-            norm_data_window[axis], 
-            bounds_error=False,
-            fill_value="extrapolate"
-        )
-
-        norm_data_window[axis] = interpolated_f(regular_time_values_s)
+        # the means are usually given from running sums, otherwise they are computed here
+        # this makes a copy, the data window may be a view into the shared slot
+        mean = means[axis] if means is not None else np.mean(data_window[axis])
+        norm_data_window[axis] = data_window[axis] - mean
 
     return norm_data_window
 
-def estimate_frequency(norm_data_window, sampling_rate):
+def estimate_frequency(norm_data_window, sampling_rate, controller=0):
 
     # the inferred frequency is also the rotations per second
-    inferred_freq_east  = freq_from_autocorr(norm_data_window['east'],  sampling_rate)
-    inferred_freq_up    = freq_from_autocorr(norm_data_window['up'],    sampling_rate)
+    # the autocorrelations of both axes are computed together from their stacked signals
+    # the peaks of the two rows are found faster one row at a time than with `freqs_from_corrs`
+    corrs = autocorrelation_engine.autocorrelation(
+        np.stack([norm_data_window[axis] for axis in analysis_axes])
+    )
+
+    (inferred_freq_east, inferred_freq_up) = (
+        freq_from_tracked_corr((controller, axis), corr, sampling_rate) 
+        for (axis, corr) in zip(analysis_axes, corrs)
+    )
 
     return {
         "east": inferred_freq_east,
         "up": inferred_freq_up
     }
 
-def freq_from_autocorr(signal, sampling_rate):
-    
-    corr = fftconvolve(signal, signal[::-1], mode='full')
-    corr = corr[len(corr)//2:]
-    d = np.diff(corr)
-    start = find_index_by_true(d > 0)[0]
-    peak = np.argmax(corr[start:]) + start
+def freq_from_corr(corr, sampling_rate):
+
+    px, py = parabolic(corr, find_peak(corr))
+    return sampling_rate / px
+
+def freq_from_tracked_corr(stream, corr, sampling_rate):
+    """Frequency from the autocorrelation peak, searched around the last peak of the stream."""
+
+    if lag_search_radius is None:
+        return freq_from_corr(corr, sampling_rate)
+
+    peak = None
+    if stream in last_peak_lags:
+        peak = find_peak_near(corr, last_peak_lags[stream], lag_search_radius)
+
+    if peak is None:
+        logging.debug("Full Autocorrelation Peak Search on the %s stream", stream)
+        peak = find_peak(corr)
+
+    # only a confident peak is tracked, otherwise the next window is a full search again
+    if corr[peak] >= min_peak_confidence * corr[0]:
+        last_peak_lags[stream] = peak
+    else:
+        last_peak_lags.pop(stream, None)
+
     px, py = parabolic(corr, peak)
     return sampling_rate / px
 
+def find_peak(corr):
+
+    # the highest lag after the first rising lag, which skips the falling lags around lag 0
+    start = autocorrelation_engine.first_rise(corr)
+    if start is None:
+        raise IndexError("The autocorrelation never rises")
+    return np.argmax(corr[start:]) + start
+
+def find_peak_near(corr, lag, radius):
+    """Highest lag within the radius of a lag, None if it is not a confident local maximum."""
+
+    low = max(1, lag - radius)
+    high = min(len(corr) - 1, lag + radius + 1)
+    if high - low < 3:
+        return None
+
+    peak = np.argmax(corr[low:high]) + low
+
+    # a peak at the edge of the neighbourhood may have moved out of it
+    if peak == low or peak == high - 1 or corr[peak] < min_peak_confidence * corr[0]:
+        return None
+
+    return peak
+
+def freqs_from_corrs(corrs, sampling_rate):
+    """Batched `freq_from_corr` over a 2D array with an autocorrelation in each row.
+
+    Rows without a rising lag, or with their peak at the last lag, have a nan frequency
+    instead of raising an IndexError.
+    """
+
+    (count, n) = corrs.shape
+    rows = np.arange(count)
+
+    # the peak is searched after the first rising lag of each row
+    rising = np.diff(corrs, axis=1) > 0
+    starts = np.argmax(rising, axis=1)
+    peaks = np.argmax(np.where(np.arange(n) >= starts[:, np.newaxis], corrs, -np.inf), axis=1)
+    valid = rising.any(axis=1) & (peaks < n - 1)
+    peaks = np.where(valid, peaks, 1)
+
+    # the vectorised parabolic interpolation of every peak
+    (before, at, after) = (corrs[rows, peaks - 1], corrs[rows, peaks], corrs[rows, peaks + 1])
+    with np.errstate(divide='ignore', invalid='ignore'):
+        px = 1/2. * (before - after) / (before - 2 * at + after) + peaks
+        return np.where(valid, sampling_rate / px, np.nan)
+
 def parabolic(f, x):
     
     xv = 1/2. * (f[x-1] - f[x+1]) / (f[x-1] - 2 * f[x] + f[x+1]) + x
@@ -164,91 +404,67 @@ def parabolic(f, x):
 
 def fit_sine_waves(norm_data_window, frequencies):
 
-    # fix the sine function with the inferred frequency (scipy doesn't like partial functions)
-    sine_with_freq_east  = lambda t, a, b, c: sine(frequencies["east"],  t, a, b, c)
-    sine_with_freq_up    = lambda t, a, b, c: sine(frequencies["up"],    t, a, b, c)
-
     # fit the sine curve with a fixed frequency to the time values and the signal
-    popt_east, pcov_east = curve_fit(
-        sine_with_freq_east, 
-        norm_data_window['time'], 
-        norm_data_window['east']
-    )
-    popt_up, pcov_up = curve_fit(
-        sine_with_freq_up, 
+    # with a fixed frequency this is a linear least squares problem, so it's solved directly
+    # the signals of both axes are fitted together as the rows of a 2D array
+    (popts, pcovs) = fit_sines(
+        [frequencies[axis] for axis in analysis_axes], 
         norm_data_window['time'], 
-        norm_data_window['up']
+        np.stack([norm_data_window[axis] for axis in analysis_axes])
     )
 
     return {
-        "east": {
-            "popt": popt_east,
-            "pcov": pcov_east
-        },
-        "up": {
-            "popt": popt_up,
-            "pcov": pcov_up
-        }
+        axis: {
+            "popt": popts[i],
+            "pcov": pcovs[i]
+        } for (i, axis) in enumerate(analysis_axes)
     }
 
-def estimate_rotation_direction(norm_data_window, frequencies, wave_properties):
+def estimate_rotation_direction(norm_data_window, frequencies, wave_properties, recency_half_life_s=None):
 
     # we only need the east and up data to detect rotation
 
     # we need to use the fitted functions to get the approximated acceleration vector values
-    fitted_east_sine = lambda ts: sine(
-        frequencies["east"], 
-        ts, 
-        wave_properties["east"]["popt"][0], 
-        wave_properties["east"]["popt"][1], 
-        wave_properties["east"]["popt"][2]
-    )
-    fitted_up_sine = lambda ts: sine(
-        frequencies["up"], 
-        ts, 
-        wave_properties["up"]["popt"][0], 
-        wave_properties["up"]["popt"][1], 
-        wave_properties["up"]["popt"][2]
-    )
-    
-    # zip up the east and up accelerations into vectors for every time instant from the fitted sine function
-    # creates an array of [[East Accel, Up Accel], [East Accel, Up Accel], ...]
-    acceleration_vectors = list(
-        zip(
-            fitted_east_sine(norm_data_window['time']), 
-            fitted_up_sine(norm_data_window['time'])
-        )
+    # stack the east and up accelerations for every time instant from the fitted sine function
+    # creates an array of [[East Accel, East Accel, ...], [Up Accel, Up Accel, ...]]
+    # the fitted parameters are stacked into columns, so both axes are evaluated in one call
+    freqs = np.array([[frequencies[axis]] for axis in analysis_axes])
+    popts = np.stack([wave_properties[axis]["popt"] for axis in analysis_axes])
+    acceleration_vectors = sine(
+        freqs, 
+        norm_data_window['time'], 
+        popts[:, 0:1], 
+        popts[:, 1:2], 
+        popts[:, 2:3]
     )
 
     # acquire the change in acceleration vector for each time interval
-    # relies on element-wise subtraction of left shifted and right shifted acceleration_vectors
-    acceleration_vector_deltas = np.subtract(acceleration_vectors[1:], acceleration_vectors[:-1])
-
-    # map the acceleration_vector_deltas to directions
-    acceleration_vector_delta_directions = []
-    for signs in np.sign(acceleration_vector_deltas):
-        acceleration_vector_delta_directions.append(
-            rotation_mapping.accel_vector_delta_direction_mapping[tuple(signs)]
-        )
-
-    # map the acceleration_vectors to positions
-    acceleration_vector_positions = []
-    for signs in np.sign(acceleration_vectors):
-        acceleration_vector_positions.append(
-            rotation_mapping.accel_vector_position_mapping[tuple(signs)]
-        )
+    acceleration_vector_deltas = np.diff(acceleration_vectors, axis=1)
 
-    # zip up the directions with the positions
-    # for example: [ ['NE', 'LB'], [ 'SW', 'RT'], ... ]
-    # then produce a list of inferred rotational directions
+    # the signs of the deltas map to directions, and the signs of the vectors at the start 
+    # of each time interval map to positions, the compiled lookup maps both of them to the 
+    # inferred rotational directions, indexing it with the signs shifted by 1
     # for example: [ 1, 1, 1, 0, -1, -1, 1] where 1: C, -1: AC and 0: ?
-    rotational_directions = []
-    for dir_and_pos in zip(acceleration_vector_delta_directions, acceleration_vector_positions):
-        rotational_directions.append(
-            rotation_mapping.accel_vector_direction_and_position_mapping.get(dir_and_pos, 0)
-        )
+    delta_indices = np.sign(acceleration_vector_deltas).astype(np.intp) + 1
+    position_indices = np.sign(acceleration_vectors[:, :-1]).astype(np.intp) + 1
+    rotational_directions = rotation_mapping.accel_vector_direction_lookup[
+        delta_indices[0], 
+        delta_indices[1], 
+        position_indices[0], 
+        position_indices[1]
+    ]
+
+    # a rolling data window is not periodic, so votes can be weighted by their recency
+    # the weights halve for every half life before the end of the window
+    if recency_half_life_s:
+        vote_times = norm_data_window['time'][1:]
+        weights = 0.5 ** ((vote_times[-1] - vote_times) / recency_half_life_s)
+    else:
+        weights = None
 
     # most common direction (vote on the majority inferred rotational direction)
-    rotational_direction = mode(rotational_directions)[0][0]
+    # ties are won by the smallest direction
+    votes = np.bincount(rotational_directions + 1, weights=weights, minlength=3)
+    rotational_direction = int(np.argmax(votes)) - 1
 
-    return rotational_direction
\ No newline at end of file
+    return rotational_direction